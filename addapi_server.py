@@ -1,5 +1,4 @@
 import json
-import base64
 import os
 import time
 import requests
@@ -9,9 +8,14 @@ from dotenv import load_dotenv
 from urllib.parse import urlencode
 from flask import Flask, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import BadRequest
 
-from html_extraction import scrape, process_results
-from customTypes import ConvertResult
+import github_cache
+import jobs
+import metrics
+import serialization
+from github_client import github, GitHubError
+from html_extraction import scrape, iter_scrape, process_results
 
 # Load .env variables
 load_dotenv()
@@ -57,6 +61,18 @@ def convert_json():
     The JSON payload should include:
     - 'api_urls': a list of URLs to be processed.
     - 'user_name': the username associated with the operation.
+    - 'async' (optional): if true, the conversion runs as a background job. The response is a 202
+      with the 'job_id' to poll at GET {ROUTE_PREFIX}convert/<job_id>.
+    - 'stream' (optional): 'ndjson' or 'sse' to receive each URL's result as soon as it is ready.
+      Sending an 'Accept: application/x-ndjson' or 'Accept: text/event-stream' header works too.
+    - 'pretty' (optional): if true, the JSON response is indented (also '?pretty=1'). It is compact
+      by default, and gzipped when the client sends 'Accept-Encoding: gzip'.
+    - 'idempotency_key' (optional, or an 'Idempotency-Key' header): a client-chosen key for the
+      request. Retrying with the same key attaches to the conversion the first attempt started,
+      in whichever worker it runs, and returns its result (or, with 'async', its job). Reusing a
+      key for different URLs is a 422.
+
+    Concurrent requests for the same URL share one fetch and extraction, with or without a key.
 
     The function performs the following steps:
     - Extracts data from the specified URLs using a web scraping function.
@@ -71,21 +87,88 @@ def convert_json():
     - Returns a 400 status code if any required data is missing in the request.
     - Returns a 500 status code if there is an exception during the execution, such as failure in data fetching or processing.
     """
+    option_2_json = json_object(request.get_json())
     try:
-        option_2_json = request.get_json()
-        api_urls = option_2_json.get('api_urls')
-        username = option_2_json.get("user_name")
-        scrape_results: dict = scrape(api_urls) 
-
-        conversion_results = process_results(scrape_results, option_2_json)
-        conversion_json_str = json.dumps(conversion_results, sort_keys=False, indent=2)
-        
-        return Response(conversion_json_str, status=200, mimetype='application/json')
+        api_urls, stream_format, idempotency_key, error = convert_options(
+            option_2_json, request.accept_mimetypes, request.headers.get("Idempotency-Key")
+        )
+        if error:
+            return jsonify({"error": error}), 400
+
+        if option_2_json.get("async"):
+            job_id = jobs.submit_job(api_urls, option_2_json, idempotency_key)
+            return jsonify(job_created(job_id, jobs.get_job(job_id, include_results=False))), 202
+
+        if idempotency_key and not stream_format:
+            # Run here, recorded as a job so a retry, in any worker, waits for this conversion instead of repeating it
+            job = jobs.wait_for_job(jobs.run_keyed_job(api_urls, option_2_json, idempotency_key))
+            if job is None or job["status"] == "failed":
+                error = job["error"] if job else "Job not found"
+                return Response(json.dumps({"error": error}), status=500, mimetype='application/json')
+            return json_response(job["results"], pretty=wants_pretty(option_2_json))
+
+        if stream_format:
+            return Response(
+                stream_conversion(api_urls, option_2_json, stream_format),
+                status=200,
+                mimetype=STREAM_MIMETYPES[stream_format],
+                # Stop nginx from buffering the stream until the end
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        conversion_results = convert_urls(api_urls, option_2_json)
+        return json_response(conversion_results, pretty=wants_pretty(option_2_json))
+    except jobs.IdempotencyKeyConflict as e:
+        return jsonify({"error": str(e)}), 422
     except Exception as e:
         print(e)
         return Response(json.dumps({"error": str(e)}), status=500, mimetype='application/json')
 
 
+@app.route(f'{ROUTE_PREFIX}convert/<job_id>', methods=['GET'])
+def convert_job_status(job_id):
+    """
+    Report the progress of a background conversion started with POST /convert and 'async': true.
+
+    Returns:
+    - A JSON response with the job 'status' (queued, running, done or failed), the 'total' and
+      'completed' URL counts and the per-URL 'results' finished so far, in the same shape as a
+      synchronous /convert response.
+    - A JSON response with an 'error' message and a 404 status code if the job is unknown or has expired.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return json_response(job, pretty=wants_pretty())
+
+
+@app.route(f'{ROUTE_PREFIX}metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Expose Prometheus metrics: per-stage /convert timings, GitHub call latencies, scrape outcomes,
+    OpenAI token usage and in-flight work, aggregated over all gunicorn workers.
+    """
+    payload, content_type = metrics.render()
+    return Response(payload, status=200, mimetype=content_type)
+
+
+@app.errorhandler(BadRequest)
+def bad_request(e):
+    return jsonify({"error": e.description}), 400
+
+
+@app.before_request
+def track_request_start():
+    if request.endpoint:
+        metrics.IN_FLIGHT.labels(f"request:{request.endpoint}").inc()
+
+
+@app.teardown_request
+def track_request_end(exc=None):
+    if request.endpoint:
+        metrics.IN_FLIGHT.labels(f"request:{request.endpoint}").dec()
+
+
 @app.route(f'{ROUTE_PREFIX}raise-pr', methods=['POST'])
 def raise_pr():
     """
@@ -99,6 +182,9 @@ def raise_pr():
     The JSON payload must include:
     - 'user_name': The GitHub username of the user for whom the pull request will be raised.
     - 'api_urls': A list of URLs that were called successfully by the client.
+
+    It may also include 'files', mapping further apizoo file names to results in the same
+    shape as 'api_urls'; every file lands in the same commit.
     
     The function handles the following:
     - Forking the main repository under the user's GitHub account.
@@ -122,31 +208,28 @@ def raise_pr():
         return jsonify({"error": "Authorization header missing or incorrect"}), 401
     
     # Get JSON data sent from the client
-    data = request.get_json()
-    if not data or 'user_name' not in data or 'api_urls' not in data:
+    data = json_object(request.get_json())
+    commit = pull_request_commit(data)
+    if commit is None:
         return jsonify({"error": "Missing data in request"}), 400
-    
-    user_name = data['user_name']
-    url_results = data['api_urls']
-    
-    successfulResults = getSuccessfulResults(url_results)
-    file_path = f"data/apizoo/{user_name}.json"
-    new_branch_name = create_unique_branch_name(user_name)
 
-    try:
-        fork_repo_info = fork_repository(MAIN_REPO, access_token)
-        fork_repo_name = fork_repo_info['full_name']
-        create_branch(fork_repo_name, new_branch_name, access_token)
-
-        commit_message = f"Add new file for {user_name}"
-        file_content = dumps(list(successfulResults), indent=2) + '\n'
-        create_file_in_repo(fork_repo_name, file_path, commit_message, file_content, new_branch_name, access_token)
+    files, commit_message = commit
+    new_branch_name = create_unique_branch_name(data['user_name'])
 
+    try:
+        # Fork (cached per user), branch and all files in one commit through the Git Data API
+        fork_repo_name = github.commit_files_to_fork(MAIN_REPO, new_branch_name, files, commit_message, access_token)
 
         base_branch = "main"
         compare_url = generate_github_compare_url(MAIN_REPO, fork_repo_name, base_branch, new_branch_name)
         # Return the URL for the frontend to handle redirection
         return jsonify({"compare_url": compare_url}), 200
+    except GitHubError as e:
+        if e.status_code == 401:
+            # The token was revoked or expired; drop its cached /check-access-token result
+            github_cache.invalidate_token(access_token)
+            return jsonify({"error": str(e)}), 401
+        return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -174,13 +257,7 @@ def exchange_code_for_token():
     if not code:
         return jsonify({'error': 'Authorization code is required.'}), 400
 
-    token_url = "https://github.com/login/oauth/access_token"
-    headers = {'Accept': 'application/json'}
-    payload = {
-        'client_id': GITHUB_CLIENT_ID,
-        'client_secret': GITHUB_CLIENT_SECRET,
-        'code': code,
-    }
+    token_url, headers, payload = access_token_request(code)
     # Make the POST request to exchange the code for an access token
     response = requests.post(token_url, headers=headers, data=payload)
     if response.ok:
@@ -210,26 +287,15 @@ def check_access_token():
     - A JSON response with a 'valid' key set to False and the appropriate status code
       if the token is invalid, or if any other errors occur during the validation process.
     """
-    data = request.get_json()
+    data = json_object(request.get_json())
     access_token = data.get('access_token')
     if not access_token:
         return jsonify({'error': 'Access token is missing.'}), 400
     
-    github_token_check_url = f"https://api.github.com/applications/{GITHUB_CLIENT_ID}/token"
-    
     try:
-        response = requests.post(
-            github_token_check_url,
-            auth=(GITHUB_CLIENT_ID, GITHUB_CLIENT_SECRET),
-            headers={ 'Accept': 'application/vnd.github+json' },
-            json={ 'access_token': access_token }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({'valid': True})
-        else:
-            return jsonify({'valid': False, 'status': response.status_code})
-    except requests.RequestException as e:
+        valid, status_code = github.check_access_token(GITHUB_CLIENT_ID, GITHUB_CLIENT_SECRET, access_token)
+        return jsonify(token_status(valid, status_code))
+    except (requests.RequestException, GitHubError) as e:
         return jsonify({'error': f'Failed to validate token with GitHub: {str(e)}'}), 500
 
 #################################
@@ -248,120 +314,192 @@ def create_unique_branch_name(user_name):
     return f"{user_name}-branch-{timestamp}"
 
 
-def fork_repository(repo, access_token):
+def json_object(data):
+    """Returns a request's JSON body, raising BadRequest (a 400) unless it is an object."""
+    if not isinstance(data, dict):
+        raise BadRequest("The request body must be a JSON object.")
+    return data
+
+
+def pull_request_commit(data):
     """
-    Fork a repository on GitHub using the access token
+    Builds the commit of a /raise-pr request: one apizoo file for the user's 'api_urls' results
+    and one per entry of 'files', keyed by path, and the commit message.
+    Returns None if 'user_name' or 'api_urls' is missing, or the results are not objects.
     """
-    url = f"https://api.github.com/repos/{repo}/forks"
-    headers = {
-        "Authorization": access_token,
-        "Accept": "application/vnd.github.v3+json",
+    if not data or 'user_name' not in data or 'api_urls' not in data:
+        return None
+    user_name = data['user_name']
+    file_results = {user_name: data['api_urls']}
+    if not isinstance(data.get('files') or {}, dict):
+        return None
+    file_results.update(data.get('files') or {})
+    if not all(isinstance(results, dict) and all(isinstance(result, dict) for result in results.values())
+               for results in file_results.values()):
+        return None
+    files = {
+        f"data/apizoo/{os.path.basename(name)}.json": dumps(list(getSuccessfulResults(results)), indent=2) + '\n'
+        for name, results in file_results.items()
     }
-    response = requests.post(url, headers=headers)
-    if response.status_code == 202:
-        return response.json()
-    else:
-        # Attempt to extract the GitHub error message from the response
-        try:
-            error_details = response.json()
-            error_message = error_details.get('message', 'No error message provided.')
-        except ValueError:
-            # In case the response body does not contain valid JSON
-            error_message = 'No error message provided.'
+    commit_message = f"Add new file for {user_name}" if len(files) == 1 else f"Add {len(files)} new files for {user_name}"
+    return files, commit_message
+
+
+def access_token_request(code):
+    """The URL, headers and form data exchanging an OAuth authorization code for an access token."""
+    payload = {
+        'client_id': GITHUB_CLIENT_ID,
+        'client_secret': GITHUB_CLIENT_SECRET,
+        'code': code,
+    }
+    return "https://github.com/login/oauth/access_token", {'Accept': 'application/json'}, payload
+
+
+def token_status(valid, status_code):
+    """The /check-access-token response for a github.check_access_token result."""
+    if valid:
+        return {'valid': True}
+    return {'valid': False, 'status': status_code}
+
+
+###########################
+## Misc Helper Functions ##
+###########################
 
-        # Include the status code and error message in the exception
-        raise Exception(f"Failed to fork repository. Status code: {response.status_code}. Error: {error_message}")
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
 
 
-def get_latest_commit_sha(access_token, repo, branch="main"):
+def get_stream_format(option_2_json, accept_mimetypes=None):
     """
-    Get the latest commit SHA of a branch in a repository using the access token passed in.
+    Returns 'ndjson' or 'sse' if the /convert client asked for a streamed response, else None.
+    accept_mimetypes defaults to the Accept header of the current Flask request.
     """
-    url = f"https://api.github.com/repos/{repo}/git/ref/heads/{branch}"
-    headers = {
-        "Authorization": access_token,
-        "Accept": "application/vnd.github.v3+json",
-    }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()["object"]["sha"]
-    else:
-        raise Exception("Failed to get latest commit SHA.")
+    requested = option_2_json.get("stream")
+    if requested in STREAM_MIMETYPES:
+        return requested
+    if accept_mimetypes is None:
+        accept_mimetypes = request.accept_mimetypes
+    best_match = accept_mimetypes.best_match(list(STREAM_MIMETYPES.values()) + ['application/json'])
+    if best_match and best_match != 'application/json' and accept_mimetypes[best_match] > accept_mimetypes['application/json']:
+        return next(key for key, mimetype in STREAM_MIMETYPES.items() if mimetype == best_match)
+    return None
+
+
+def convert_options(option_2_json, accept_mimetypes=None, idempotency_header=None):
+    """
+    Reads the delivery options of a /convert request.
 
+    Args:
+        option_2_json (dict): The request's JSON body.
+        accept_mimetypes (MIMEAccept, optional): The Accept header, see get_stream_format.
+        idempotency_header (str, optional): The Idempotency-Key header, which wins over 'idempotency_key'.
 
-def create_branch(repo, branch_name, access_token):
-    """
-    Create a new branch in a repository using the access token passed in as an arg.
+    Returns:
+        Tuple: api_urls, the stream format (or None), the idempotency key (or None), and an
+        error message for a 400 (or None): async, streamed and keyed requests need a list of URLs.
     """
-    latest_sha = get_latest_commit_sha(access_token, repo, "main")
-    url = f"https://api.github.com/repos/{repo}/git/refs"
-    headers = {
-        "Authorization": access_token,
-        "Accept": "application/vnd.github.v3+json",
-    }
-    data = {
-        "ref": f"refs/heads/{branch_name}",
-        "sha": latest_sha,
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 201:
-        return response.json()
-    else:
-        raise Exception("Failed to create branch.")
+    api_urls = option_2_json.get('api_urls')
+    stream_format = get_stream_format(option_2_json, accept_mimetypes)
+    idempotency_key = idempotency_header or option_2_json.get("idempotency_key")
+    error = None
+    if (option_2_json.get("async") or stream_format or idempotency_key) and not isinstance(api_urls, list):
+        error = "'api_urls' must be a list of URLs"
+    return api_urls, stream_format, idempotency_key, error
+
+
+def convert_urls(api_urls, option_2_json):
+    """The blocking part of a synchronous /convert: scrape and process the results."""
+    scrape_results = scrape(api_urls)
+    with metrics.time_stage("process_results"):
+        conversion_results = process_results(scrape_results, option_2_json)
+    metrics.observe_request_tokens(scrape_results)
+    return conversion_results
+
 
+def job_created(job_id, job):
+    """The 202 body of an async /convert request."""
+    return {"job_id": job_id, "status": job["status"], "status_url": f"{ROUTE_PREFIX}convert/{job_id}"}
 
-def create_file_in_repo(repo, file_path, commit_message, content, branch, access_token):
+
+def pretty_requested(args, payload=None) -> bool:
+    """
+    Pretty-printed JSON is opt-in, with '?pretty=1' (args holds the query string) or 'pretty': true
+    in the request body.
     """
-    Create or update a file in a specified GitHub repository.
+    if args.get("pretty", "").lower() in ("1", "true", "yes"):
+        return True
+    return bool(isinstance(payload, dict) and payload.get("pretty"))
+
 
-    This function sends a PUT request to the GitHub API to create or update a file at a specified path within a repository on a specific branch. The file content is base64 encoded before being sent.
+def wants_pretty(payload=None) -> bool:
+    return pretty_requested(request.args, payload)
+
+
+def encode_json(payload, accept_encoding=None, pretty=False):
     """
-    url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
-    headers = {
-        "Authorization": access_token,
-        "Accept": "application/vnd.github.v3+json",
-    }
-    data = {
-        "message": commit_message,
-        "content": base64.b64encode(content.encode('utf-8')).decode('utf-8'), 
-        "branch": branch,
-    }
+    Serialize a payload with orjson and gzip it when the client accepts it and it is large enough.
+    Returns the body and whether it is gzipped.
+    """
+    with metrics.time_stage("serialize"):
+        body = serialization.dumps(payload, pretty=pretty)
+        compressed = serialization.compress(body, accept_encoding)
+    return compressed or body, compressed is not None
 
-    response = requests.put(url, headers=headers, json=data)
 
-    if response.status_code in [200, 201]:  # 201 for Created, 200 for Updated
-        return response.json()  # Return the JSON response if successful
-    else:
-        raise Exception(f"Failed to create file: {response.status_code} {response.json()}")
+def json_response(payload, status=200, pretty=False):
+    body, gzipped = encode_json(payload, request.headers.get("Accept-Encoding"), pretty)
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add("Accept-Encoding")
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
 
 
-def submit_pull_request(main_repo, title, body, head, base, access_token):
-    """Submit a pull request to the main repository."""
-    url = f"https://api.github.com/repos/{main_repo}/pulls"
-    headers = {
-        "Authorization": f"token {access_token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    data = {
-        "title": title,
-        "body": body,
-        "head": head,
-        "base": base,
-    }
-    response = requests.post(url, headers=headers, json=data)
+def stream_messages(results, option_2_json, stream_format):
+    """
+    Generate the /convert response one URL at a time, in completion order.
 
-    if response.status_code == 201:  # 201 Created
-        print("Pull request submitted successfully.")
-        return response.json()  # Returns the created pull request information
-    else:
-        raise Exception(f"Failed to create pull request: {response.status_code} {response.json()}")
+    Each message is a single-URL object, {url: {"status", "data", ...}}, in the same shape a
+    synchronous /convert response uses. NDJSON puts one object per line; SSE sends 'result'
+    events followed by a final 'done' event.
 
+    Args:
+        results: iter_scrape() of the request's URLs, closed with this generator.
+        option_2_json (dict): The request's JSON body.
+        stream_format (str): 'ndjson' or 'sse'.
+    """
+    def encode(payload, event="result"):
+        message = serialization.dumps(payload).decode("utf-8")
+        if stream_format == "sse":
+            return f"event: {event}\ndata: {message}\n\n"
+        return message + "\n"
 
-###########################
-## Misc Helper Functions ##
-###########################
+    streamed = {}
+    try:
+        for url, result in results:
+            with metrics.time_stage("process_results"):
+                processed = process_results({url: result}, option_2_json)
+            streamed[url] = {"meta": result.get("meta")}
+            with metrics.time_stage("serialize"):
+                message = encode(processed)
+            yield message
+    except Exception as e:
+        print(e)
+        yield encode({"error": str(e)}, event="error")
+        return
+    finally:
+        # Cancels the URLs not started yet when the stream is abandoned early
+        results.close()
+        metrics.observe_request_tokens(streamed)
+    if stream_format == "sse":
+        yield encode({}, event="done")
+
+
+def stream_conversion(api_urls, option_2_json, stream_format):
+    """See stream_messages()."""
+    return stream_messages(iter_scrape(api_urls), option_2_json, stream_format)
 
-def getSuccessfulResults(urlResults: ConvertResult): 
+def getSuccessfulResults(urlResults: dict):
     successfulResults = []
     for result in urlResults.values():
         if result["status"] == "success":
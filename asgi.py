@@ -0,0 +1,353 @@
+# Asynchronous Server Gateway Interface: the routes of addapi_server.py (same paths, ROUTE_PREFIX
+# and responses) as a native ASGI app, for uvicorn:
+#   uvicorn asgi:app --host 0.0.0.0 --port 8080 --workers 4
+# GitHub calls go through github_client.async_github (httpx), so a worker keeps serving while
+# requests wait on GitHub. The /convert pipeline keeps its own fetch and LLM thread pools and is
+# awaited on ASGI_THREADS threads, never on the event loop.
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+import httpx
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import BadRequest
+from werkzeug.http import parse_accept_header
+
+import github_cache
+import jobs
+import metrics
+import serialization
+from addapi_server import (
+    FRONTEND_URL, GITHUB_CLIENT_ID, GITHUB_CLIENT_SECRET, MAIN_REPO, ROUTE_PREFIX, STREAM_MIMETYPES,
+    access_token_request, convert_options, convert_urls, create_unique_branch_name, encode_json, generate_github_compare_url,
+    job_created, json_object, pretty_requested, pull_request_commit, stream_messages, token_status,
+)
+from github_client import async_github, GitHubError
+from html_extraction import iter_scrape
+
+# Threads running blocking work (the scrape pipeline, job submission) for the event loop.
+# Each waits on the pipeline's own pools, so this bounds concurrent /convert requests per worker.
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "64"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created lazily (and again after a fork) so every worker process runs its own pool
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+async def run_blocking(fn: Callable, *args) -> Any:
+    """Runs a blocking function on the worker's thread pool and awaits its result."""
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+
+
+class Request:
+    def __init__(self, scope: Dict[str, Any], body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.body = body
+        self.headers: Dict[str, str] = {}
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1").lower(), value.decode("latin-1")
+            self.headers[name] = f"{self.headers[name]}, {value}" if name in self.headers else value
+        self.args = {key: values[0] for key, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+
+    def get_json(self) -> Any:
+        try:
+            return serialization.loads(self.body)
+        except ValueError:
+            raise BadRequest("The request body is not valid JSON.")
+
+    @property
+    def accept_mimetypes(self) -> MIMEAccept:
+        return parse_accept_header(self.headers.get("accept"), MIMEAccept)
+
+
+class Response:
+    def __init__(self, body: Union[bytes, AsyncIterator[str]] = b"", status: int = 200,
+                 content_type: str = "application/json", headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.status = status
+        self.headers = {"content-type": content_type, **(headers or {})}
+
+
+def jsonify(payload: Any, status: int = 200) -> Response:
+    return Response(serialization.dumps(payload), status)
+
+
+def wants_pretty(request: Request, payload=None) -> bool:
+    return pretty_requested(request.args, payload)
+
+
+def json_response(request: Request, payload: Any, status: int = 200, pretty: bool = False) -> Response:
+    """See addapi_server.json_response."""
+    body, gzipped = encode_json(payload, request.headers.get("accept-encoding"), pretty)
+    headers = {"vary": "Accept-Encoding"}
+    if gzipped:
+        headers["content-encoding"] = "gzip"
+    return Response(body, status, headers=headers)
+
+
+#########################
+### Route Definitions ###
+#########################
+
+async def convert_json(request: Request) -> Response:
+    """See addapi_server.convert_json."""
+    option_2_json = json_object(request.get_json())
+    try:
+        api_urls, stream_format, idempotency_key, error = convert_options(
+            option_2_json, request.accept_mimetypes, request.headers.get("idempotency-key")
+        )
+        if error:
+            return jsonify({"error": error}, 400)
+
+        if option_2_json.get("async"):
+            job_id = await run_blocking(jobs.submit_job, api_urls, option_2_json, idempotency_key)
+            job = await run_blocking(jobs.get_job, job_id, False)
+            return jsonify(job_created(job_id, job), 202)
+
+        if idempotency_key and not stream_format:
+            # Run here, recorded as a job so a retry, in any worker, waits for this conversion instead of repeating it
+            job_id = await run_blocking(jobs.run_keyed_job, api_urls, option_2_json, idempotency_key)
+            job = await wait_for_job(job_id)
+            if job is None or job["status"] == "failed":
+                error = job["error"] if job else "Job not found"
+                return jsonify({"error": error}, 500)
+            return json_response(request, job["results"], pretty=wants_pretty(request, option_2_json))
+
+        if stream_format:
+            return Response(
+                stream_conversion(api_urls, option_2_json, stream_format),
+                content_type=STREAM_MIMETYPES[stream_format],
+                # Stop nginx from buffering the stream until the end
+                headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+            )
+
+        conversion_results = await run_blocking(convert_urls, api_urls, option_2_json)
+        return json_response(request, conversion_results, pretty=wants_pretty(request, option_2_json))
+    except jobs.IdempotencyKeyConflict as e:
+        return jsonify({"error": str(e)}, 422)
+    except Exception as e:
+        print(e)
+        return jsonify({"error": str(e)}, 500)
+
+
+async def convert_job_status(request: Request, job_id: str) -> Response:
+    """See addapi_server.convert_job_status."""
+    job = await run_blocking(jobs.get_job, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}, 404)
+    return json_response(request, job, pretty=wants_pretty(request))
+
+
+async def prometheus_metrics(request: Request) -> Response:
+    # In multiprocess mode this reads and merges every worker's sample files
+    payload, content_type = await run_blocking(metrics.render)
+    return Response(payload, content_type=content_type)
+
+
+async def raise_pr(request: Request) -> Response:
+    """See addapi_server.raise_pr."""
+    access_token = request.headers.get('authorization')
+    if not access_token:
+        return jsonify({"error": "Authorization header missing or incorrect"}, 401)
+
+    data = json_object(request.get_json())
+    commit = pull_request_commit(data)
+    if commit is None:
+        return jsonify({"error": "Missing data in request"}, 400)
+
+    files, commit_message = commit
+    new_branch_name = create_unique_branch_name(data['user_name'])
+
+    try:
+        fork_repo_name = await async_github.commit_files_to_fork(MAIN_REPO, new_branch_name, files, commit_message, access_token)
+        compare_url = generate_github_compare_url(MAIN_REPO, fork_repo_name, "main", new_branch_name)
+        return jsonify({"compare_url": compare_url}, 200)
+    except GitHubError as e:
+        if e.status_code == 401:
+            # The token was revoked or expired; drop its cached /check-access-token result
+            await run_blocking(github_cache.invalidate_token, access_token)
+            return jsonify({"error": str(e)}, 401)
+        return jsonify({"error": str(e)}, 500)
+    except Exception as e:
+        return jsonify({"error": str(e)}, 500)
+
+
+async def exchange_code_for_token(request: Request) -> Response:
+    """See addapi_server.exchange_code_for_token."""
+    code = request.args.get('code')
+    if not code:
+        return jsonify({'error': 'Authorization code is required.'}, 400)
+
+    token_url, headers, payload = access_token_request(code)
+    response = await async_github.client.post(token_url, headers=headers, data=payload)
+    if response.is_success:
+        token_data = response.json()
+        return Response(status=302, headers={"location": f"{FRONTEND_URL}/?access_token={token_data['access_token']}"})
+    return jsonify({'error': 'Failed to fetch access token'}, response.status_code)
+
+
+async def check_access_token(request: Request) -> Response:
+    """See addapi_server.check_access_token."""
+    data = json_object(request.get_json())
+    access_token = data.get('access_token')
+    if not access_token:
+        return jsonify({'error': 'Access token is missing.'}, 400)
+
+    try:
+        valid, status_code = await async_github.check_access_token(GITHUB_CLIENT_ID, GITHUB_CLIENT_SECRET, access_token)
+        return jsonify(token_status(valid, status_code))
+    except (httpx.HTTPError, GitHubError) as e:
+        return jsonify({'error': f'Failed to validate token with GitHub: {str(e)}'}, 500)
+
+
+async def say_hello(request: Request) -> Response:
+    return jsonify({"msg": "Hello from Flask"})
+
+
+# (method, path) -> handler; the handler names match the Flask endpoints, as metrics labels
+ROUTES: Dict[Tuple[str, str], Callable] = {
+    ("POST", f"{ROUTE_PREFIX}convert"): convert_json,
+    ("GET", f"{ROUTE_PREFIX}metrics"): prometheus_metrics,
+    ("POST", f"{ROUTE_PREFIX}raise-pr"): raise_pr,
+    ("GET", f"{ROUTE_PREFIX}get-access-token"): exchange_code_for_token,
+    ("POST", f"{ROUTE_PREFIX}check-access-token"): check_access_token,
+    ("GET", f"{ROUTE_PREFIX}hello"): say_hello,
+}
+JOB_STATUS_PREFIX = f"{ROUTE_PREFIX}convert/"
+
+
+######################
+## Helper Functions ##
+######################
+
+async def wait_for_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Like jobs.wait_for_job, sleeping on the event loop between checks."""
+    while True:
+        job = await run_blocking(jobs.get_job, job_id, False)
+        if job is None or job["status"] in ("done", "failed"):
+            return job and await run_blocking(jobs.get_job, job_id)
+        await asyncio.sleep(jobs.JOB_WAIT_POLL)
+
+
+async def stream_conversion(api_urls, option_2_json, stream_format) -> AsyncIterator[str]:
+    """See addapi_server.stream_messages, advanced on the thread pool."""
+    messages = stream_messages(iter_scrape(api_urls), option_2_json, stream_format)
+    try:
+        while True:
+            message = await run_blocking(next, messages, None)
+            if message is None:
+                break
+            yield message
+    finally:
+        await run_blocking(messages.close)
+
+
+def cors_headers(request: Request) -> Dict[str, str]:
+    """The headers Flask-Cors adds for CORS(app, origins=[FRONTEND_URL])."""
+    origin = request.headers.get("origin")
+    if origin != FRONTEND_URL:
+        return {}
+    headers = {"access-control-allow-origin": origin, "vary": "Origin"}
+    if request.method == "OPTIONS":
+        headers["access-control-allow-methods"] = "DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+        if "access-control-request-headers" in request.headers:
+            headers["access-control-allow-headers"] = request.headers["access-control-request-headers"]
+    return headers
+
+
+async def dispatch(request: Request) -> Response:
+    job_id = request.path[len(JOB_STATUS_PREFIX):] if request.path.startswith(JOB_STATUS_PREFIX) else ""
+    if job_id and "/" not in job_id:
+        methods, args = {"GET": convert_job_status}, (job_id,)
+    else:
+        methods, args = {method: handler for (method, path), handler in ROUTES.items() if path == request.path}, ()
+    if not methods:
+        return jsonify({"error": "Not Found"}, 404)
+    if "GET" in methods:
+        # As in Flask, GET routes answer HEAD too; app() leaves the body out
+        methods["HEAD"] = methods["GET"]
+    handler = methods.get(request.method)
+    if handler is None:
+        if request.method == "OPTIONS":
+            return Response(status=200, headers={"allow": ", ".join(sorted(methods) + ["OPTIONS"])})
+        return jsonify({"error": "Method Not Allowed"}, 405)
+
+    endpoint = f"request:{handler.__name__}"
+    metrics.IN_FLIGHT.labels(endpoint).inc()
+    try:
+        return await handler(request, *args)
+    except BadRequest as e:
+        return jsonify({"error": e.description}, 400)
+    finally:
+        metrics.IN_FLIGHT.labels(endpoint).dec()
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return body
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_github.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope, await read_body(receive))
+    response = await dispatch(request)
+    for name, value in cors_headers(request).items():
+        if name in response.headers and name == "vary":
+            value = f"{response.headers[name]}, {value}"
+        response.headers[name] = value
+
+    streamed = not isinstance(response.body, bytes)
+    if not streamed:
+        response.headers["content-length"] = str(len(response.body))
+    await send({
+        "type": "http.response.start",
+        "status": response.status,
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()],
+    })
+    if request.method == "HEAD":
+        if streamed:
+            await response.body.aclose()
+        await send({"type": "http.response.body", "body": b""})
+        return
+    if not streamed:
+        await send({"type": "http.response.body", "body": response.body})
+        return
+    async for chunk in response.body:
+        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
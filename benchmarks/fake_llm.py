@@ -0,0 +1,61 @@
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import chunking
+from extraction_backends import local_extraction
+from html_extraction import prompt_api
+
+
+def document_text(prompt: str) -> str:
+    """Strips the prompt_api() template around the markdown, so its example call is not extracted."""
+    sentinel = "\0DOCUMENT\0"
+    prefix, _, suffix = prompt_api().replace("{{", "{").replace("}}", "}").replace("{api_name}", sentinel).partition(sentinel)
+    start = prompt.find(prefix)
+    if start == -1 or not prompt.endswith(suffix):
+        return prompt
+    return prompt[start + len(prefix):len(prompt) - len(suffix)]
+
+
+class FakeExtractionLLM(BaseChatModel):
+    """
+    Chat model standing in for ChatOpenAI in the extraction chain, without network access.
+
+    It answers the chain's function call with local_extraction() of the prompt, after sleeping
+    latency + latency_per_1k_tokens * prompt_tokens / 1000 seconds, and reports token usage
+    the way the OpenAI integration does.
+    """
+
+    latency: float = 0.5
+    latency_per_1k_tokens: float = 0.0
+    model_name: str = "fake-extraction"
+    temperature: float = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-extraction"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        prompt_tokens = chunking.count_tokens(prompt)
+        time.sleep(self.latency + self.latency_per_1k_tokens * prompt_tokens / 1000)
+
+        arguments = json.dumps({"info": local_extraction(document_text(prompt))})
+        completion_tokens = chunking.count_tokens(arguments)
+        message = AIMessage(
+            content="",
+            additional_kwargs={"function_call": {"name": "information_extraction", "arguments": arguments}},
+        )
+        token_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": token_usage, "model_name": self.model_name},
+        )
@@ -0,0 +1,347 @@
+"""
+Load test: throughput, latency percentiles and error rates of the WSGI (gunicorn wsgi:app, sync
+workers) and the ASGI (uvicorn asgi:app) deployments under a mix of /convert, /raise-pr and
+/check-access-token traffic.
+
+The servers run as subprocesses against local stand-ins, so no network or credentials are needed:
+GitHub (benchmarks/mock_github.py), OpenAI (benchmarks/mock_openai.py, for extraction) and the doc
+sites (benchmarks/stub_server.py, serving benchmarks/corpus). Each stand-in has its own latency,
+and GitHub and OpenAI answer a share of requests with errors (502 / 500) or 429s, which the app
+retries. OpenAI also enforces --openai-rpm / --openai-tpm, which the servers are configured with.
+
+Clients run in closed loop: each sends its next request, drawn from --mix, when the previous one
+finishes. /convert asks for 1-3 corpus pages, /raise-pr sends back /convert results for them, as
+the frontend does, and /check-access-token checks the token of one of --users users (one in ten
+has an expired token, answered with valid: false). The extraction and fetch caches are disabled so
+every /convert fetches and extracts, unless --warm-caches is given; the GitHub caches stay on.
+
+For every server, --workers and --concurrency combination, each endpoint gets a row with its
+throughput, p50/p95/p99 latency and error rate (any non-200, plus the share of /convert URLs that
+failed), followed by the calls the stand-ins received.
+
+Usage (from the repository root):
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --workers 1 4 --concurrency 8 32 --duration 30 --mix convert=1 check-access-token=4
+    python -m benchmarks.loadtest --openai-throttle-rate 0.1 --github-error-rate 0.05 --output loadtest.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import itertools
+import subprocess
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.mock_github import start_mock_github
+from benchmarks.mock_openai import start_mock_openai
+from benchmarks.stub_server import CORPUS_DIR, start_stub_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "wsgi": lambda port, workers: [sys.executable, "-m", "gunicorn", "--workers", str(workers),
+                                   "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+    "asgi": lambda port, workers: [sys.executable, "-m", "uvicorn", "asgi:app", "--workers", str(workers),
+                                   "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+}
+SERVER_MODULES = {"wsgi": "gunicorn", "asgi": "uvicorn"}
+ENDPOINTS = ("check-access-token", "convert", "raise-pr")
+DEFAULT_MIX = ["check-access-token=6", "convert=3", "raise-pr=1"]
+CACHE_SWITCHES = ("EXTRACTION_CACHE_ENABLED", "FETCH_CACHE_ENABLED", "NEAR_DUPLICATE_ENABLED")
+
+
+class Traffic:
+    """
+    Draws the requests of a mix and keeps what clients would remember between them.
+
+    Args:
+        mix (Dict[str, float]): Relative weight of each endpoint.
+        docs_url (str): Base URL of the stub doc site.
+        users (int): Number of distinct users (and access tokens).
+        seed (int): Seed, so runs send the same sequence of requests.
+    """
+
+    def __init__(self, mix: Dict[str, float], docs_url: str, users: int, seed: int = 0):
+        self.endpoints = list(mix)
+        self.weights = list(mix.values())
+        self.users = users
+        self.random = random.Random(seed)
+        self.pages = [f"{docs_url}/{name}" for name in sorted(os.listdir(CORPUS_DIR)) if name.endswith(".html")]
+        self.results: Dict[str, Any] = {}  # page -> its latest /convert result, sent back with /raise-pr
+        self.serial = itertools.count()
+
+    def token(self, user: int) -> str:
+        # One user in ten has an expired token
+        return f"token-invalid-{user}" if user % 10 == 0 else f"token-user-{user}"
+
+    def next_request(self) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Returns the endpoint, headers and JSON body of the next request."""
+        endpoint = self.random.choices(self.endpoints, self.weights)[0]
+        user = self.random.randrange(self.users)
+        pages = self.random.sample(self.pages, self.random.randint(1, min(3, len(self.pages))))
+
+        if endpoint == "check-access-token":
+            return endpoint, {}, {"access_token": self.token(user)}
+        if endpoint == "convert":
+            return endpoint, {}, {"api_urls": pages, "user_name": f"loadtest-{user}"}
+        # Branch names are unique per user and second, so every PR gets its own user name;
+        # the token is always a valid one, as the frontend checks it before raising a PR
+        api_urls = {page: self.results.get(page, {"status": "success", "data": []}) for page in pages}
+        return endpoint, {"Authorization": self.token(user | 1)}, {
+            "user_name": f"loadtest-{user}-{next(self.serial)}", "api_urls": api_urls,
+        }
+
+    def record(self, endpoint: str, response: httpx.Response) -> Tuple[int, int]:
+        """Remembers /convert results. Returns the number of URLs converted and of those that failed."""
+        if endpoint != "convert" or response.status_code != 200:
+            return 0, 0
+        results = response.json()
+        self.results.update((url, result) for url, result in results.items() if result.get("status") == "success")
+        return len(results), sum(result.get("status") != "success" for result in results.values())
+
+
+def parse_mix(pairs: List[str]) -> Dict[str, float]:
+    mix = {}
+    for pair in pairs:
+        endpoint, _, weight = pair.partition("=")
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {endpoint!r}, expected one of {', '.join(ENDPOINTS)}")
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, workers: int, settings: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    """
+    Starts a server in a subprocess and waits until it answers /hello.
+
+    Args:
+        kind (str): "wsgi" or "asgi".
+        workers (int): Worker processes.
+        settings (Dict[str, str]): Environment variables for the server, on top of ours.
+
+    Returns:
+        Tuple[subprocess.Popen, str]: The server process (terminate it when done) and its base URL.
+    """
+    port = free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        GITHUB_CLIENT_ID="loadtest",
+        GITHUB_CLIENT_SECRET="loadtest",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "loadtest"),
+        ADDAPI_DATA_DIR=tempfile.mkdtemp(prefix=f"addapi-loadtest-{kind}-"),
+        **settings,
+    )
+    process = subprocess.Popen(SERVERS[kind](port, workers), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/hello", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def summarize(samples: List[Tuple[float, Any]], elapsed: float, urls: int = 0, url_errors: int = 0) -> Dict[str, Any]:
+    latencies = [latency for latency, _ in samples]
+    statuses = Counter(str(status) for _, status in samples)
+    errors = sum(count for status, count in statuses.items() if status != "200")
+    summary = {
+        "requests": len(samples),
+        "rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "statuses": dict(statuses),
+    }
+    if urls:
+        summary.update(urls=urls, url_errors=url_errors, url_error_rate=round(url_errors / urls, 4))
+    return summary
+
+
+async def drive(base_url: str, traffic: Traffic, concurrency: int, duration: float) -> Dict[str, Any]:
+    """
+    Sends requests from concurrency clients in closed loop for duration seconds.
+
+    Returns:
+        Dict[str, Any]: The summary of all requests ("all") and of each endpoint: count, throughput,
+        latency percentiles, errors and status codes (exceptions by name).
+    """
+    samples: Dict[str, List[Tuple[float, Any]]] = {endpoint: [] for endpoint in traffic.endpoints}
+    url_counts = Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        async def client_loop(deadline: float):
+            while time.perf_counter() < deadline:
+                endpoint, headers, body = traffic.next_request()
+                start = time.perf_counter()
+                try:
+                    response = await client.post(f"/{endpoint}", headers=headers, json=body)
+                    status = response.status_code
+                    urls, url_errors = traffic.record(endpoint, response)
+                    url_counts.update(urls=urls, url_errors=url_errors)
+                except (httpx.HTTPError, ValueError) as e:
+                    status = type(e).__name__
+                samples[endpoint].append((time.perf_counter() - start, status))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(start + duration) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    report = {"all": summarize([sample for values in samples.values() for sample in values], elapsed)}
+    for endpoint, values in samples.items():
+        extra = (url_counts["urls"], url_counts["url_errors"]) if endpoint == "convert" else ()
+        report[endpoint] = summarize(values, elapsed, *extra)
+    return report
+
+
+def stand_in_counters(github_state, openai_state) -> Dict[str, int]:
+    with github_state.lock:
+        github_calls = sum(github_state.calls.values())
+    with openai_state.lock:
+        return {
+            "github_calls": github_calls,
+            "openai_completed": openai_state.completed,
+            "openai_rate_limited": openai_state.rate_limited,
+            "openai_errors": openai_state.errors,
+            "openai_tokens": openai_state.tokens,
+        }
+
+
+def available(kind: str) -> bool:
+    try:
+        __import__(SERVER_MODULES[kind])
+        return True
+    except ImportError:
+        return False
+
+
+def print_run(run: Dict[str, Any]) -> None:
+    print(f"\n{run['server']}  workers={run['workers']}  concurrency={run['concurrency']}")
+    for endpoint, result in run["endpoints"].items():
+        urls = f"   failed URLs {result['url_error_rate']:.1%}" if "urls" in result else ""
+        print(f"  {endpoint:<19} {result['requests']:>6} req {result['rps']:>8.1f} req/s"
+              f"   p50 {result['p50_ms']:>8.1f} ms   p95 {result['p95_ms']:>8.1f} ms   p99 {result['p99_ms']:>8.1f} ms"
+              f"   errors {result['error_rate']:>6.1%}{urls}")
+    stand_ins = run["stand_ins"]
+    print(f"  stand-ins: {stand_ins['github_calls']} GitHub calls, {stand_ins['openai_completed']} OpenAI completions"
+          f" ({stand_ins['openai_rate_limited']} answered 429, {stand_ins['openai_errors']} answered 500)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[2], help="server worker processes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per run")
+    parser.add_argument("--mix", nargs="+", default=DEFAULT_MIX, metavar="ENDPOINT=WEIGHT",
+                        help=f"relative share of each endpoint (default: {' '.join(DEFAULT_MIX)})")
+    parser.add_argument("--users", type=int, default=200, help="distinct users and access tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-caches", action="store_true", help="keep the extraction and fetch caches enabled")
+    parser.add_argument("--github-latency", type=float, default=0.1, help="seconds per mock GitHub call")
+    parser.add_argument("--github-error-rate", type=float, default=0.0, help="share of GitHub calls answered 502")
+    parser.add_argument("--github-throttle-rate", type=float, default=0.0, help="share of GitHub calls answered 429")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="seconds per mock OpenAI completion")
+    parser.add_argument("--openai-rpm", type=int, default=0, help="mock OpenAI requests per minute, 0 for no limit")
+    parser.add_argument("--openai-tpm", type=int, default=0, help="mock OpenAI tokens per minute, 0 for no limit")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="share of OpenAI calls answered 500")
+    parser.add_argument("--openai-throttle-rate", type=float, default=0.0, help="share of OpenAI calls answered 429")
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="seconds per doc page fetch")
+    parser.add_argument("--output", help="write the full report as JSON to this file")
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    github_server, github_url, github_state = start_mock_github(
+        latency=args.github_latency, error_rate=args.github_error_rate, throttle_rate=args.github_throttle_rate,
+        rate_limit=10 ** 9, seed=args.seed,
+    )
+    openai_server, openai_url, openai_state = start_mock_openai(
+        rpm=args.openai_rpm, tpm=args.openai_tpm, latency=args.openai_latency,
+        error_rate=args.openai_error_rate, throttle_rate=args.openai_throttle_rate, seed=args.seed,
+    )
+    docs_server, docs_url = start_stub_server(latency=args.fetch_latency)
+    settings = {
+        "GITHUB_API_URL": github_url,
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "LLM_RPM": str(args.openai_rpm),
+        "LLM_TPM": str(args.openai_tpm),
+    }
+    if not args.warm_caches:
+        settings.update(dict.fromkeys(CACHE_SWITCHES, "0"))
+
+    report: Dict[str, Any] = {"settings": {k: v for k, v in vars(args).items() if k != "output"}, "runs": []}
+    try:
+        for kind in args.servers:
+            if not available(kind):
+                print(f"{kind}: {SERVER_MODULES[kind]} is not installed, skipped")
+                continue
+            for workers in args.workers:
+                process, base_url = start_server(kind, workers, settings)
+                try:
+                    # Warm up connections, workers and the LLM stack; this also collects the
+                    # /convert results that /raise-pr sends back
+                    warm_up = Traffic(dict.fromkeys(mix, 1.0), docs_url, args.users, args.seed)
+                    asyncio.run(drive(base_url, warm_up, 2, 2))
+                    for concurrency in args.concurrency:
+                        traffic = Traffic(mix, docs_url, args.users, args.seed)
+                        traffic.results = warm_up.results
+                        before = stand_in_counters(github_state, openai_state)
+                        endpoints = asyncio.run(drive(base_url, traffic, concurrency, args.duration))
+                        after = stand_in_counters(github_state, openai_state)
+                        run = {
+                            "server": kind, "workers": workers, "concurrency": concurrency,
+                            "endpoints": endpoints,
+                            "stand_ins": {name: after[name] - before[name] for name in after},
+                        }
+                        report["runs"].append(run)
+                        print_run(run)
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+    finally:
+        github_server.shutdown()
+        openai_server.shutdown()
+        docs_server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
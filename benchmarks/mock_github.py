@@ -0,0 +1,283 @@
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+# Local stand-in for the parts of the GitHub REST API used by /raise-pr and /check-access-token.
+# Point GITHUB_API_URL at it (before importing github_client) to exercise the client offline.
+
+VALID_TOKENS = ("token-valid", "Bearer token-valid")
+
+
+class MockGitHubState:
+    """
+    In-memory repositories and fault injection settings shared by all requests of one server.
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        error_rate (float): Share of requests answered with a 502.
+        rate_limit (int): Calls each credential may make before getting 403 with X-RateLimit-Remaining 0.
+        retry_after (int): Retry-After seconds sent with throttled responses.
+        throttle_rate (float): Share of requests answered with a 429 (or a secondary rate limit 403).
+        secondary (bool): Answer throttled requests with GitHub's secondary rate limit 403 instead of 429.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limit: int = 5000,
+                 retry_after: int = 1, throttle_rate: float = 0.0, secondary: bool = False, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.throttle_rate = throttle_rate
+        self.secondary = secondary
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.used: Dict[str, int] = {}
+        self.forks: Dict[str, str] = {}  # upstream repo -> fork, deleted forks are dropped from here
+        self.refs: Dict[Tuple[str, str], str] = {}  # (repo, branch) -> commit sha
+        self.commits: Dict[str, str] = {}  # commit sha -> tree sha, shared by the whole fork network
+        self.trees: Dict[str, Dict[str, str]] = {}  # tree sha -> {path: content}
+        self.calls: Dict[str, int] = {}
+        self.connections = set()
+
+    def sha(self, *parts: str) -> str:
+        return hashlib.sha1(":".join(parts + (str(time.time()),)).encode("utf-8")).hexdigest()
+
+    def head(self, repo: str, branch: str = "main") -> str:
+        """Returns the commit at the head of a branch, creating an initial commit for upstream branches."""
+        with self.lock:
+            if (repo, branch) not in self.refs:
+                tree, commit = self.sha(repo, "tree"), self.sha(repo, branch)
+                self.trees[tree] = {"README.md": "mock"}
+                self.commits[commit] = tree
+                self.refs[(repo, branch)] = commit
+            return self.refs[(repo, branch)]
+
+    def exists(self, repo: str) -> bool:
+        """Upstream repositories always exist, forks (owned by mock-user) only until deleted."""
+        with self.lock:
+            return not repo.startswith("mock-user/") or repo in self.forks.values()
+
+    def delete_fork(self, upstream: str) -> None:
+        with self.lock:
+            self.forks.pop(upstream, None)
+
+    def advance(self, repo: str, branch: str = "main") -> str:
+        """Moves an upstream branch to a new commit, as a merge upstream would."""
+        parent_tree = self.commits[self.head(repo, branch)]
+        with self.lock:
+            sha = self.sha(repo, branch, "advance")
+            self.commits[sha] = parent_tree
+            self.refs[(repo, branch)] = sha
+        return sha
+
+
+class MockGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse can be observed
+    # Buffer each response so headers and body leave in one segment; written separately, the
+    # body waits for the client's delayed ACK (Nagle) and every call takes 40ms longer.
+    wbufsize = 64 * 1024
+    state: MockGitHubState = None
+
+    ROUTES = [
+        ("POST", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/forks$"), "fork"),
+        ("GET", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/git/ref/heads/(?P<branch>.+)$"), "get_ref"),
+        ("GET", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/branches/(?P<branch>.+)$"), "get_branch"),
+        ("POST", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/git/refs$"), "create_ref"),
+        ("POST", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/git/trees$"), "create_tree"),
+        ("POST", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/git/commits$"), "create_commit"),
+        ("PUT", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/contents/(?P<path>.+)$"), "put_contents"),
+        ("POST", re.compile(r"^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/pulls$"), "create_pull"),
+        ("POST", re.compile(r"^/applications/(?P<client_id>[^/]+)/token$"), "check_token"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def credential(self) -> str:
+        return self.headers.get("Authorization") or "anonymous"
+
+    def dispatch(self, method: str) -> None:
+        state = self.state
+        body = self.read_json() if method in ("POST", "PUT") else {}
+        if state.latency:
+            time.sleep(state.latency)
+
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(self.path)
+            if route_method == method and match:
+                break
+        else:
+            return self.send_json(404, {"message": "Not Found"})
+
+        with state.lock:
+            state.calls[name] = state.calls.get(name, 0) + 1
+            state.connections.add(self.client_address)
+            credential = self.credential()
+            state.used[credential] = state.used.get(credential, 0) + 1
+            remaining = max(state.rate_limit - state.used[credential], 0)
+            roll = state.random.random()
+        reset = int(time.time()) + 60
+        limit_headers = {
+            "X-RateLimit-Limit": str(state.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset),
+        }
+
+        if state.used[credential] > state.rate_limit:
+            return self.send_json(403, {"message": "API rate limit exceeded"}, limit_headers)
+        if roll < state.throttle_rate:
+            if state.secondary:
+                return self.send_json(
+                    403, {"message": "You have exceeded a secondary rate limit."},
+                    dict(limit_headers, **{"Retry-After": str(state.retry_after)}),
+                )
+            return self.send_json(429, {"message": "Too Many Requests"},
+                                  dict(limit_headers, **{"Retry-After": str(state.retry_after)}))
+        if roll < state.throttle_rate + state.error_rate:
+            return self.send_json(502, {"message": "Server Error"}, limit_headers)
+
+        status, response = getattr(self, name)(body, **match.groupdict())
+        self.send_json(status, response, limit_headers)
+
+    def authorized(self) -> bool:
+        return bool(self.headers.get("Authorization")) and "invalid" not in self.headers["Authorization"]
+
+    def fork(self, body, owner, repo):
+        if not self.authorized():
+            return 401, {"message": "Bad credentials"}
+        fork = f"mock-user/{repo}"
+        with self.state.lock:
+            self.state.forks[f"{owner}/{repo}"] = fork
+        return 202, {"full_name": fork, "owner": {"login": "mock-user"}}
+
+    def get_ref(self, body, owner, repo, branch):
+        name = f"{owner}/{repo}"
+        if not self.state.exists(name):
+            return 404, {"message": "Not Found"}
+        with self.state.lock:
+            sha = self.state.refs.get((name, branch))
+        if sha is None and branch == "main":
+            sha = self.state.head(name)
+        if sha is None:
+            return 404, {"message": "Not Found"}
+        return 200, {"ref": f"refs/heads/{branch}", "object": {"sha": sha, "type": "commit"}}
+
+    def get_branch(self, body, owner, repo, branch):
+        status, ref = self.get_ref(body, owner, repo, branch)
+        if status != 200:
+            return status, ref
+        sha = ref["object"]["sha"]
+        return 200, {"name": branch, "commit": {"sha": sha, "commit": {"tree": {"sha": self.state.commits[sha]}}}}
+
+    def create_tree(self, body, owner, repo):
+        if not self.state.exists(f"{owner}/{repo}"):
+            return 404, {"message": "Not Found"}
+        with self.state.lock:
+            base = self.state.trees.get(body.get("base_tree"))
+            if base is None:
+                return 422, {"message": "Invalid tree info"}
+            tree = dict(base, **{entry["path"]: entry["content"] for entry in body.get("tree", [])})
+            sha = self.state.sha(owner, repo, "tree")
+            self.state.trees[sha] = tree
+        return 201, {"sha": sha}
+
+    def create_commit(self, body, owner, repo):
+        if not self.state.exists(f"{owner}/{repo}"):
+            return 404, {"message": "Not Found"}
+        with self.state.lock:
+            if body.get("tree") not in self.state.trees or any(p not in self.state.commits for p in body.get("parents", [])):
+                return 422, {"message": "Tree or parent SHA does not exist"}
+            sha = self.state.sha(owner, repo, "commit")
+            self.state.commits[sha] = body["tree"]
+        return 201, {"sha": sha, "tree": {"sha": body["tree"]}}
+
+    def create_ref(self, body, owner, repo):
+        name = f"{owner}/{repo}"
+        if not self.state.exists(name):
+            return 404, {"message": "Not Found"}
+        branch = body.get("ref", "").replace("refs/heads/", "", 1)
+        with self.state.lock:
+            if (name, branch) in self.state.refs:
+                return 422, {"message": "Reference already exists"}
+            if body.get("sha") not in self.state.commits:
+                return 422, {"message": "Object does not exist"}
+            self.state.refs[(name, branch)] = body.get("sha")
+        return 201, {"ref": body.get("ref"), "object": {"sha": body.get("sha"), "type": "commit"}}
+
+    def put_contents(self, body, owner, repo, path):
+        name = f"{owner}/{repo}"
+        branch = body.get("branch", "main")
+        with self.state.lock:
+            parent = self.state.refs.get((name, branch))
+            if parent is None:
+                return 404, {"message": "Branch not found"}
+            tree = dict(self.state.trees[self.state.commits[parent]], **{path: body.get("content", "")})
+            tree_sha, sha = self.state.sha(name, path, "tree"), self.state.sha(name, path)
+            self.state.trees[tree_sha] = tree
+            self.state.commits[sha] = tree_sha
+            self.state.refs[(name, branch)] = sha
+        return 201, {"content": {"path": path}, "commit": {"sha": sha}}
+
+    def create_pull(self, body, owner, repo):
+        return 201, {"number": 1, "html_url": f"https://github.com/{owner}/{repo}/pull/1"}
+
+    def check_token(self, body, client_id):
+        if body.get("access_token") in VALID_TOKENS:
+            return 200, {"token": body["access_token"], "app": {"client_id": client_id}}
+        return 404, {"message": "Not Found"}
+
+
+def start_mock_github(**settings) -> Tuple[ThreadingHTTPServer, str, MockGitHubState]:
+    """
+    Starts the GitHub stand-in on a free port, in a background thread.
+
+    Args:
+        **settings: Fault injection settings, see MockGitHubState.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str, MockGitHubState]: The server (call shutdown() when done),
+        its base URL (for GITHUB_API_URL) and its state, for inspecting the calls it received.
+    """
+    state = MockGitHubState(**settings)
+    handler = type("Handler", (MockGitHubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+if __name__ == "__main__":
+    server, base_url, _ = start_mock_github()
+    print(f"Mock GitHub API at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,191 @@
+import json
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import chunking
+from benchmarks.fake_llm import document_text
+from extraction_backends import local_extraction
+
+# Local OpenAI-compatible chat completions server enforcing its own RPM / TPM limits, for
+# exercising llm_scheduler without an OpenAI account. Start it on a known port and point
+# OPENAI_BASE_URL at "<base_url>/v1" before html_extraction is imported.
+
+
+class MockOpenAIState:
+    """
+    Quota and counters shared by all requests of one server.
+
+    Args:
+        rpm (int): Requests accepted per sliding minute, 0 for no limit.
+        tpm (int): Prompt + completion tokens accepted per sliding minute, 0 for no limit.
+        latency (float): Seconds to wait before answering each accepted request.
+        latency_per_1k_tokens (float): Extra seconds per 1000 prompt tokens.
+        error_rate (float): Share of requests answered with a 500, whatever the quota.
+        throttle_rate (float): Share of requests answered with a 429, whatever the quota.
+        retry_after (float): Seconds of retry-after sent with those 429s.
+        seed (int): Seed of the fault injection, so runs are repeatable.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, latency: float = 0.0, latency_per_1k_tokens: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()  # (timestamp, tokens) of accepted requests in the last minute
+        self.completed = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.tokens = 0
+
+    def admit(self, tokens: int) -> Tuple[bool, float]:
+        """Records a request if the quota allows it. Returns whether it was accepted, else the seconds until it would be."""
+        now = time.time()
+        with self.lock:
+            while self.window and self.window[0][0] <= now - 60:
+                self.window.popleft()
+            used_tokens = sum(cost for _, cost in self.window)
+            over_requests = self.rpm and len(self.window) >= self.rpm
+            over_tokens = self.tpm and self.window and used_tokens + tokens > self.tpm
+            if over_requests or over_tokens:
+                self.rate_limited += 1
+                return False, max(self.window[0][0] + 60 - now, 0.001)
+            self.window.append((now, tokens))
+            return True, 0.0
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer each response so headers and body leave in one segment; written separately, the
+    # body waits for the client's delayed ACK (Nagle) and every call takes 40ms longer.
+    wbufsize = 64 * 1024
+    state: MockOpenAIState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            return self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+        state = self.state
+        with state.lock:
+            roll = state.random.random()
+        if roll < state.throttle_rate:
+            with state.lock:
+                state.rate_limited += 1
+            return self.send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after-ms": str(int(state.retry_after * 1000)), "retry-after": str(max(int(state.retry_after), 1))},
+            )
+        if roll < state.throttle_rate + state.error_rate:
+            with state.lock:
+                state.errors += 1
+            return self.send_json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+
+        prompt = "\n".join(str(message.get("content") or "") for message in body.get("messages", []))
+        functions = body.get("functions") or [tool["function"] for tool in body.get("tools", [])]
+        prompt_tokens = chunking.count_tokens(prompt) + chunking.count_tokens(json.dumps(functions))
+        arguments = json.dumps({"info": local_extraction(document_text(prompt))})
+        completion_tokens = chunking.count_tokens(arguments)
+
+        accepted, retry_after = state.admit(prompt_tokens + completion_tokens)
+        if not accepted:
+            return self.send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after-ms": str(int(retry_after * 1000)), "retry-after": str(max(int(retry_after), 1))},
+            )
+
+        time.sleep(state.latency + state.latency_per_1k_tokens * prompt_tokens / 1000)
+        with state.lock:
+            state.completed += 1
+            state.tokens += prompt_tokens + completion_tokens
+
+        if body.get("tools"):
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex}", "type": "function",
+                "function": {"name": functions[0]["name"], "arguments": arguments},
+            }]}
+            finish_reason = "tool_calls"
+        elif body.get("functions"):
+            message = {"role": "assistant", "content": None,
+                       "function_call": {"name": body["functions"][0]["name"], "arguments": arguments}}
+            finish_reason = "function_call"
+        else:
+            message = {"role": "assistant", "content": arguments}
+            finish_reason = "stop"
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def start_mock_openai(port: int = 0, **settings) -> Tuple[ThreadingHTTPServer, str, MockOpenAIState]:
+    """
+    Starts the OpenAI stand-in on a free port, in a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 for any free port.
+        **settings: Quota and latency settings, see MockOpenAIState.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str, MockOpenAIState]: The server (call shutdown() when done),
+        its base URL (use f"{base_url}/v1" as OPENAI_BASE_URL) and its state, with the counters.
+    """
+    state = MockOpenAIState(**settings)
+    handler = type("Handler", (MockOpenAIHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server, base_url, _ = start_mock_openai(args.port, rpm=args.rpm, tpm=args.tpm, latency=args.latency,
+                                            error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    print(f"Mock OpenAI API at {base_url}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,417 @@
+"""
+Offline benchmark for the extraction pipeline.
+
+Serves the checked-in corpus from a local stub server, replaces the LLM with a deterministic
+fake of configurable latency and measures load_html, structured, html_transformer, prune,
+extract, process_results and serialize per page, end-to-end scrape() throughput and peak memory,
+the peak memory of the BeautifulSoup and streaming transformers on one oversized page, and
+whether the lxml parser (or the configured HTML_PARSER) gives the same markdown as html.parser.
+
+The committed benchmarks/baseline.json holds only the machine-independent fields (each page's
+markdown and extraction fingerprints and token counts), so any machine can check that outputs
+did not change. Record a full baseline on the benchmark machine to also compare timings and memory.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks                   # compare against benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --save-baseline   # record a full baseline on this machine
+    python -m benchmarks.run_benchmarks --save-baseline --portable   # the committed baseline, after an intended output change
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from typing import Any, Dict, List
+
+import serialization
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+STAGES = ["load_html", "structured", "html_transformer", "prune", "extract", "process_results", "serialize"]
+# Per-page fields that do not depend on the machine, the content of a --portable baseline
+PORTABLE_PAGE_FIELDS = ["html_bytes", "markdown_chars", "markdown_tokens", "pruned_tokens", "chunks", "extractor",
+                        "prompt_tokens", "api_calls", "response_bytes", "markdown_sha256", "extraction_sha256"]
+
+
+def configure_environment(keep_caches: bool) -> None:
+    # Must run before the pipeline modules are imported, they read their settings at import time
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["ADDAPI_DATA_DIR"] = tempfile.mkdtemp(prefix="addapi-bench-")
+    # The fake LLM has no quota; keep llm_scheduler from throttling it to the OpenAI one
+    os.environ.setdefault("LLM_RPM", "0")
+    os.environ.setdefault("LLM_TPM", "0")
+    # scrape() extracts every page with the fake model, instead of routing small ones to OpenAI
+    os.environ.setdefault("EXTRACTION_ROUTING", "0")
+    if not keep_caches:
+        os.environ["EXTRACTION_CACHE_ENABLED"] = "0"
+        os.environ["FETCH_CACHE_ENABLED"] = "0"
+        os.environ["NEAR_DUPLICATE_ENABLED"] = "0"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.sha256(serialization.dumps(value)).hexdigest()[:16]
+
+
+def run_page(he, url: str, llm, timings: Dict[str, List[float]]) -> Dict[str, Any]:
+    """Runs one page through the pipeline stage by stage, appending each stage's duration to timings."""
+    start = time.perf_counter()
+    html = he.load_html(url)
+    timings["load_html"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    structured = he.structured_extraction.extract_structured(html, he.HTML_PARSER)
+    timings["structured"].append(time.perf_counter() - start)
+
+    # The markdown is measured for every page, even those scrape() reads from the markup
+    start = time.perf_counter()
+    markdown = he.html_transformer(html)
+    timings["html_transformer"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    pruned, prune_meta = he.pruning.prune_markdown(markdown)
+    timings["prune"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if structured is not None:
+        data, extract_meta = he.fill_structured(structured[1], llm)
+    else:
+        data, extract_meta = he.chunked_extract(pruned, llm)
+    timings["extract"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    processed = he.process_results({url: {"status": "success", "data": data}}, {"user_name": "benchmark"})
+    timings["process_results"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    body = serialization.dumps(processed)
+    timings["serialize"].append(time.perf_counter() - start)
+
+    return {
+        "html": html,
+        "markdown": markdown,
+        "pruned_tokens": prune_meta["pruned_tokens"],
+        "chunks": extract_meta["chunks"],
+        "extractor": structured[0] if structured is not None else "llm",
+        "prompt_tokens": extract_meta["tokens"]["prompt"],
+        "processed": processed[url],
+        "response_bytes": len(body),
+    }
+
+
+def measure_peak_memory(he, url: str, llm) -> int:
+    tracemalloc.start()
+    try:
+        run_page(he, url, llm, {stage: [] for stage in STAGES})
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def build_large_page(corpus: str, target_bytes: int) -> str:
+    """Builds one oversized page, like a generated API reference, from the bodies of the corpus pages."""
+    bodies = []
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus, name), encoding="utf-8") as f:
+                page = f.read()
+            start = page.find(">", page.find("<body")) + 1
+            end = page.rfind("</body>")
+            bodies.append(page[start:end] if start > 0 and end > start else page)
+    content = "".join(bodies)
+    copies = max(target_bytes // max(len(content.encode("utf-8")), 1), 1)
+    return '<html><head><title>Reference</title></head><body><div class="main">' + content * copies + "</div></body></html>"
+
+
+def measure_transform_modes(he, html: str) -> Dict[str, Any]:
+    """Peak traced memory and time of the BeautifulSoup and the streaming transformer on one page."""
+    modes, outputs = {}, {}
+    for mode, transformer in (("soup", he.html_transformer), ("stream", he.stream_html_transformer)):
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            outputs[mode] = transformer(html)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        modes[mode] = {"peak_memory_bytes": peak, "seconds": round(elapsed, 2)}
+    return {
+        "html_bytes": len(html.encode("utf-8")),
+        "markdown_chars": len(outputs["stream"]),
+        "identical": outputs["soup"] == outputs["stream"],
+        "modes": modes,
+    }
+
+
+def compare_parsers(he, corpus: str) -> Dict[str, Any]:
+    """
+    Markdown of every corpus page with html.parser and with the alternative parser: HTML_PARSER
+    when it is set to another backend, lxml otherwise.
+
+    Returns:
+        Dict[str, Any]: The parser, whether scrape() uses it, the number of pages and the markdown
+        chars of both parsers on each page where they differ.
+    """
+    parser = he.HTML_PARSER if he.HTML_PARSER != "html.parser" else "lxml"
+    pages = sorted(name for name in os.listdir(corpus) if name.endswith(".html"))
+    differs = {}
+    for name in pages:
+        with open(os.path.join(corpus, name), encoding="utf-8") as f:
+            html = f.read()
+        reference, markdown = he.html_transformer(html, "html.parser"), he.html_transformer(html, parser)
+        if markdown != reference:
+            differs[name] = {"html.parser": len(reference), parser: len(markdown)}
+    return {"parser": parser, "configured": parser == he.HTML_PARSER, "pages": len(pages), "differs": differs}
+
+
+def run(args) -> Dict[str, Any]:
+    import chunking
+    import html_extraction as he
+    from benchmarks.fake_llm import FakeExtractionLLM
+    from benchmarks.stub_server import start_stub_server
+
+    llm = FakeExtractionLLM(latency=args.llm_latency, latency_per_1k_tokens=args.llm_latency_per_1k_tokens)
+    he.set_llm(llm)  # scrape() uses the shared model
+    server, base_url = start_stub_server(args.corpus, latency=args.fetch_latency)
+    pages = sorted(name for name in os.listdir(args.corpus) if name.endswith(".html"))
+    urls = {name: f"{base_url}/{name}" for name in pages}
+
+    try:
+        timings = {stage: [] for stage in STAGES}
+        page_results = {}
+        for name, url in urls.items():
+            run_page(he, url, llm, {stage: [] for stage in STAGES})  # warm-up
+            for _ in range(args.iterations):
+                outcome = run_page(he, url, llm, timings)
+            page_results[name] = {
+                "html_bytes": len(outcome["html"].encode("utf-8")),
+                "markdown_chars": len(outcome["markdown"]),
+                "markdown_tokens": chunking.count_tokens(outcome["markdown"]),
+                "pruned_tokens": outcome["pruned_tokens"],
+                "chunks": outcome["chunks"],
+                "extractor": outcome["extractor"],
+                "prompt_tokens": outcome["prompt_tokens"],
+                "api_calls": len(outcome["processed"].data),
+                "response_bytes": outcome["response_bytes"],
+                "markdown_sha256": fingerprint(outcome["markdown"]),
+                "extraction_sha256": fingerprint(outcome["processed"].data),
+                "peak_memory_bytes": measure_peak_memory(he, url, llm),
+            }
+
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            results = he.scrape(list(urls.values()), max_workers=args.concurrency)
+            errors += sum(1 for result in results.values() if result["status"] != "success")
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    large_page = measure_transform_modes(he, build_large_page(args.corpus, int(args.large_page_mb * 2**20)))
+    parsers = compare_parsers(he, args.corpus)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "tokenizer": "tiktoken" if chunking.get_encoding() is not None else "estimate",
+        },
+        "settings": {
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "llm_latency_per_1k_tokens": args.llm_latency_per_1k_tokens,
+            "fetch_latency": args.fetch_latency,
+        },
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+        "throughput_pages_per_s": round(len(urls) * args.iterations / elapsed, 2),
+        "scrape_errors": errors,
+        "peak_memory_bytes": max(page["peak_memory_bytes"] for page in page_results.values()),
+        "markdown_tokens": sum(page["markdown_tokens"] for page in page_results.values()),
+        "pruned_tokens": sum(page["pruned_tokens"] for page in page_results.values()),
+        "prompt_tokens": sum(page["prompt_tokens"] for page in page_results.values()),
+        "response_bytes": sum(page["response_bytes"] for page in page_results.values()),
+        "large_page": large_page,
+        "parsers": parsers,
+        "pages": page_results,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<18}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['mean_ms']:>10}")
+
+    print(f"\n{'page':<34}{'html KB':>9}{'md chars':>10}{'tokens':>8}{'pruned':>8}{'extractor':>10}{'prompt':>8}"
+          f"{'chunks':>8}{'calls':>7}{'peak MB':>9}")
+    for name, page in report["pages"].items():
+        print(
+            f"{name:<34}{page['html_bytes'] / 1024:>9.1f}{page['markdown_chars']:>10}{page['markdown_tokens']:>8}"
+            f"{page['pruned_tokens']:>8}{page['extractor']:>10}{page['prompt_tokens']:>8}{page['chunks']:>8}"
+            f"{page['api_calls']:>7}{page['peak_memory_bytes'] / 2**20:>9.2f}"
+        )
+    print(f"\nthroughput: {report['throughput_pages_per_s']} pages/s "
+          f"(scrape(), concurrency {report['settings']['concurrency']})")
+    saved = 1 - report["pruned_tokens"] / max(report["markdown_tokens"], 1)
+    print(f"prompt tokens: {report['markdown_tokens']} before pruning, {report['pruned_tokens']} after ({saved:.0%} saved), "
+          f"{report['prompt_tokens']} sent to the LLM with structured extraction")
+    print(f"/convert response: {report['response_bytes']} bytes of compact JSON for all pages")
+    print(f"peak memory: {report['peak_memory_bytes'] / 2**20:.2f} MB, tokenizer: {report['environment']['tokenizer']}")
+    large_page = report["large_page"]
+    print(f"{large_page['html_bytes'] / 2**20:.1f} MB page: " + ", ".join(
+        f"{mode} {stats['peak_memory_bytes'] / 2**20:.1f} MB peak in {stats['seconds']}s"
+        for mode, stats in large_page["modes"].items()
+    ) + (", same markdown" if large_page["identical"] else ", MARKDOWN DIFFERS"))
+    parsers = report["parsers"]
+    print(f"{parsers['parser']} parser: same markdown as html.parser on "
+          f"{parsers['pages'] - len(parsers['differs'])} of {parsers['pages']} pages" + "".join(
+              f", {name} {chars[parsers['parser']]} chars against {chars['html.parser']}"
+              for name, chars in parsers["differs"].items()
+          ) + ("" if parsers["configured"] else " (not used, HTML_PARSER is html.parser)"))
+    if report["scrape_errors"]:
+        print(f"WARNING: {report['scrape_errors']} pages failed in the scrape() run")
+
+
+def portable(report: Dict[str, Any]) -> Dict[str, Any]:
+    """The machine-independent part of a report: outputs and token counts, no timings or memory."""
+    return {
+        "environment": {"tokenizer": report["environment"]["tokenizer"]},
+        **{key: report[key] for key in ("markdown_tokens", "pruned_tokens", "prompt_tokens", "response_bytes")},
+        "pages": {name: {key: page[key] for key in PORTABLE_PAGE_FIELDS} for name, page in report["pages"].items()},
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compares a report with the baseline.
+
+    Returns:
+        List[str]: One line per regression: slower stages, lower throughput, more memory or prompt
+        tokens, pages whose markdown / extraction output changed, or pages where a configured
+        HTML_PARSER other than html.parser gives different markdown. Token counts and extraction
+        output (which follows the chunk boundaries) are only compared when both used the same tokenizer.
+    """
+    problems = []
+    same_tokenizer = baseline.get("environment", {}).get("tokenizer") == report["environment"]["tokenizer"]
+    for stage, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            # Ignore sub-millisecond noise
+            if stats[key] > base[key] * (1 + tolerance) and stats[key] - base[key] > 1:
+                problems.append(f"{stage} {key}: {base[key]} -> {stats[key]}")
+
+    base_throughput = baseline.get("throughput_pages_per_s")
+    if base_throughput and report["throughput_pages_per_s"] < base_throughput * (1 - tolerance):
+        problems.append(f"throughput: {base_throughput} -> {report['throughput_pages_per_s']} pages/s")
+
+    if report["scrape_errors"]:
+        problems.append(f"{report['scrape_errors']} pages failed in the scrape() run")
+
+    base_memory = baseline.get("peak_memory_bytes")
+    if base_memory and report["peak_memory_bytes"] > base_memory * (1 + tolerance):
+        problems.append(f"peak memory: {base_memory} -> {report['peak_memory_bytes']} bytes")
+
+    base_stream = baseline.get("large_page", {}).get("modes", {}).get("stream", {}).get("peak_memory_bytes")
+    stream = report["large_page"]["modes"]["stream"]["peak_memory_bytes"]
+    if base_stream and stream > base_stream * (1 + tolerance):
+        problems.append(f"large page streaming peak memory: {base_stream} -> {stream} bytes")
+    if not report["large_page"]["identical"]:
+        problems.append("large page: streaming and BeautifulSoup markdown differ")
+    # Only a parser scrape() actually uses must match; the lxml report is informational otherwise
+    parsers = report["parsers"]
+    if parsers["configured"]:
+        for name, chars in parsers["differs"].items():
+            problems.append(f"{name}: HTML_PARSER={parsers['parser']} markdown differs from html.parser "
+                            f"({chars[parsers['parser']]} chars against {chars['html.parser']})")
+
+    base_tokens = baseline.get("pruned_tokens")
+    if same_tokenizer and base_tokens and report["pruned_tokens"] > base_tokens * (1 + tolerance):
+        problems.append(f"prompt tokens after pruning: {base_tokens} -> {report['pruned_tokens']}")
+
+    for name, page in report["pages"].items():
+        base = baseline.get("pages", {}).get(name)
+        if not base:
+            continue
+        for key in ("markdown_sha256", "extraction_sha256") if same_tokenizer else ("markdown_sha256",):
+            if page[key] != base[key]:
+                problems.append(f"{name}: {key.split('_')[0]} output changed")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(BENCHMARK_DIR, "corpus"))
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4, help="max_workers for the scrape() throughput run")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="fake LLM seconds per call")
+    parser.add_argument("--llm-latency-per-1k-tokens", type=float, default=0.0)
+    parser.add_argument("--fetch-latency", type=float, default=0.0, help="stub server seconds per request")
+    parser.add_argument("--large-page-mb", type=float, default=2, help="size of the page for the transform mode comparison")
+    parser.add_argument("--keep-caches", action="store_true", help="leave fetch / extraction caches enabled")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--portable", action="store_true",
+                        help="with --save-baseline, save only the machine-independent fields (as committed)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    parser.add_argument("--output", help="write the full report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    configure_environment(args.keep_caches)
+    report = run(args)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(portable(report) if args.portable else report, f, indent=2)
+            f.write("\n")
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}; record one with --save-baseline")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("environment", {}).get("tokenizer") != report["environment"]["tokenizer"]:
+        print(f"\nbaseline was recorded with the {baseline.get('environment', {}).get('tokenizer')} tokenizer, "
+              f"comparing markdown only, not token counts or extraction output")
+    problems = compare(report, baseline, args.tolerance)
+    if problems:
+        print("\nREGRESSIONS against baseline:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print("\nno regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
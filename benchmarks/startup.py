@@ -0,0 +1,163 @@
+"""
+Startup benchmark: import time and memory of a worker.
+
+Each measurement runs in a fresh interpreter. "import" is the cost of importing the WSGI app
+(what every gunicorn worker pays before its first request), "llm" the cost of loading the LLM
+stack and creating the model, paid on the first extraction or up front with LLM_PRELOAD=1.
+
+The fork runs mimic gunicorn: a master imports the app and forks --workers children, which then
+load the LLM stack. In the fork-preload run the master imports it before forking, as
+"gunicorn --preload" with LLM_PRELOAD=1 does, so the children share those pages; each child
+reports its RSS and the memory private to it (Private_Clean + Private_Dirty, Linux only).
+
+Usage (from the repository root):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --workers 4 --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+import subprocess
+from typing import Any, Dict, List
+
+
+def configure_environment() -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("ADDAPI_DATA_DIR", tempfile.mkdtemp(prefix="addapi-startup-"))
+
+
+def memory() -> Dict[str, float]:
+    """Current RSS and private memory of this process in MB, from /proc where available."""
+    report = {"max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    report["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+        private_kb = 0
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Private_Clean", "Private_Dirty"):
+                    private_kb += int(value.split()[0])
+        report["private_mb"] = round(private_kb / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return report
+
+
+def child_measure() -> Dict[str, Any]:
+    start = time.perf_counter()
+    import wsgi  # noqa: F401
+    import_ms = (time.perf_counter() - start) * 1000
+    after_import = memory()
+    llm_loaded_at_import = "langchain_openai" in sys.modules
+
+    import html_extraction
+    start = time.perf_counter()
+    html_extraction.preload(create_model=True)
+    llm_ms = (time.perf_counter() - start) * 1000
+    return {
+        "import_ms": round(import_ms, 1),
+        "llm_ms": round(llm_ms, 1),
+        "llm_loaded_at_import": llm_loaded_at_import,
+        "import_rss_mb": after_import.get("rss_mb", after_import["max_rss_mb"]),
+        "rss_mb": memory().get("rss_mb"),
+        "max_rss_mb": memory()["max_rss_mb"],
+    }
+
+
+def child_fork(workers: int, preload: bool) -> Dict[str, Any]:
+    import wsgi  # noqa: F401
+    import html_extraction
+    if preload:
+        html_extraction.preload()
+
+    pipes = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            html_extraction.preload(create_model=True)
+            os.write(write_fd, json.dumps(memory()).encode("utf-8"))
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append((pid, read_fd))
+
+    reports = []
+    for pid, read_fd in pipes:
+        with os.fdopen(read_fd) as f:
+            reports.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    return {"master": memory(), "workers": reports}
+
+
+def run_child(args: List[str]) -> Dict[str, Any]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-m", "benchmarks.startup", *args],
+        cwd=root, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    # The app prints while importing; the report is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def mean(values: List[float]) -> float:
+    return round(sum(values) / len(values), 1) if values else 0.0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="forked workers per fork run")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement")
+    parser.add_argument("--output", help="write the full report as JSON to this file")
+    parser.add_argument("--child", choices=["measure", "fork", "fork-preload"], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    configure_environment()
+    if args.child == "measure":
+        print(json.dumps(child_measure()))
+        return 0
+    if args.child:
+        print(json.dumps(child_fork(args.workers, preload=args.child == "fork-preload")))
+        return 0
+
+    runs = [run_child(["--child", "measure"]) for _ in range(args.repeat)]
+    report = {
+        "import_ms": mean([run["import_ms"] for run in runs]),
+        "llm_ms": mean([run["llm_ms"] for run in runs]),
+        "llm_loaded_at_import": any(run["llm_loaded_at_import"] for run in runs),
+        "import_rss_mb": mean([run["import_rss_mb"] or 0 for run in runs]),
+        "rss_mb": mean([run["rss_mb"] or 0 for run in runs]),
+        "fork": {},
+    }
+    if hasattr(os, "fork"):
+        for mode in ("fork", "fork-preload"):
+            result = run_child(["--child", mode, "--workers", str(args.workers)])
+            report["fork"][mode] = {
+                "master_rss_mb": result["master"].get("rss_mb"),
+                "worker_rss_mb": mean([worker.get("rss_mb") or 0 for worker in result["workers"]]),
+                "worker_private_mb": mean([worker.get("private_mb") or 0 for worker in result["workers"]]),
+            }
+
+    print(f"import of the app      {report['import_ms']:>8.1f} ms   RSS {report['import_rss_mb']:.1f} MB"
+          f"   LLM stack loaded: {'yes' if report['llm_loaded_at_import'] else 'no'}")
+    print(f"LLM stack + model      {report['llm_ms']:>8.1f} ms   RSS {report['rss_mb']:.1f} MB after")
+    for mode, result in report["fork"].items():
+        print(f"{mode:<22} {args.workers} workers   RSS {result['worker_rss_mb']:.1f} MB"
+              f"   private {result['worker_private_mb']:.1f} MB per worker")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import os
+import time
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+class CorpusHandler(SimpleHTTPRequestHandler):
+    """Serves the corpus like a static documentation host, with an optional per-request delay."""
+
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(directory: str = CORPUS_DIR, latency: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Starts a local HTTP server for the corpus on a free port, in a background thread.
+
+    Args:
+        directory (str): Directory to serve. Defaults to the checked-in corpus.
+        latency (float): Seconds to wait before answering each request, to emulate a remote site.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str]: The server (call shutdown() when done) and its base URL.
+    """
+    handler = type("Handler", (CorpusHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    server, base_url = start_stub_server()
+    print(f"Serving {CORPUS_DIR} at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
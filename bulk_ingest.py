@@ -0,0 +1,436 @@
+"""
+Bulk ingestion of a whole documentation site.
+
+Starting from a doc root (crawled within its directory) or a sitemap.xml, pages are discovered
+through a bounded, deduplicated frontier, fetched politely (robots.txt, per-host delay and
+concurrency limits) and the API-like ones run through the extraction pipeline. Results are
+appended to a JSONL file as they finish, and the frontier is checkpointed in local SQLite, so
+an interrupted run continues where it stopped when started again with the same root.
+
+Usage (from the repository root):
+    python bulk_ingest.py https://docs.python.org/3/library/ --output stdlib.jsonl
+    python bulk_ingest.py https://example.com/sitemap.xml --output example.jsonl --max-pages 1000
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+import fetcher
+import html_extraction
+import llm_scheduler
+import pruning
+import serialization
+import storage
+import structured_extraction
+from url_utils import in_scope, normalize_url
+
+INGEST_MAX_PAGES = int(os.environ.get("INGEST_MAX_PAGES", "1000"))
+INGEST_MAX_DEPTH = int(os.environ.get("INGEST_MAX_DEPTH", "5"))
+INGEST_MAX_WORKERS = int(os.environ.get("INGEST_MAX_WORKERS", "4"))
+INGEST_MAX_PER_HOST = int(os.environ.get("INGEST_MAX_PER_HOST", "2"))
+# Minimum seconds between two requests to the same host; a larger robots.txt Crawl-delay wins.
+INGEST_DELAY = float(os.environ.get("INGEST_DELAY", "1"))
+# Pages without a known documentation format need at least this many call signatures to be extracted.
+INGEST_MIN_SIGNATURES = int(os.environ.get("INGEST_MIN_SIGNATURES", "3"))
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "2"))
+
+# Links to files that are never documentation pages
+SKIPPED_EXTENSIONS = re.compile(
+    r"\.(png|jpe?g|gif|svg|ico|webp|css|js|json|map|zip|gz|tgz|bz2|xz|whl|tar|pdf|txt|rst|md|woff2?|ttf|eot|mp4|webm)$",
+    re.IGNORECASE,
+)
+HREF_RE = re.compile(r"""<a\s[^>]*?href\s*=\s*["']([^"'#]+)""", re.IGNORECASE)
+SITEMAP_NAMESPACE = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+MAX_SITEMAPS = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    run_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    -- queued, in_progress, extracted (written to the output), crawled (not an API page), failed
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, url)
+);
+CREATE INDEX IF NOT EXISTS frontier_state ON frontier (run_id, state);
+"""
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("ingest", _SCHEMA)
+
+
+class HostPoliteness:
+    """
+    robots.txt rules and request pacing per host, shared by every crawl thread.
+    """
+
+    def __init__(self, delay: float, max_per_host: int):
+        self.delay = delay
+        self.max_per_host = max_per_host
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._next_request: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def robots(self, url: str) -> Optional[RobotFileParser]:
+        """Returns the parsed robots.txt of url's host, None if it has none or it could not be read."""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if origin in self._robots:
+                return self._robots[origin]
+        parser = None
+        try:
+            response = fetcher.get_session(url).get(f"{origin}/robots.txt", timeout=fetcher.FETCH_TIMEOUT)
+            if response.status_code == 200:
+                parser = RobotFileParser()
+                parser.parse(response.text.splitlines())
+        except requests.RequestException as e:
+            print(f"Could not read robots.txt of {origin}, crawling it unrestricted: {e}")
+        with self._lock:
+            self._robots[origin] = parser
+        return parser
+
+    def allowed(self, url: str) -> bool:
+        parser = self.robots(url)
+        return parser is None or parser.can_fetch(fetcher.USER_AGENT, url)
+
+    def wait_turn(self, url: str) -> None:
+        """Sleeps until the host of url may receive its next request, and books that slot."""
+        parser = self.robots(url)
+        crawl_delay = (parser.crawl_delay(fetcher.USER_AGENT) if parser else None) or 0
+        delay = max(self.delay, float(crawl_delay))
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.time()
+            start = max(self._next_request.get(host, now), now)
+            self._next_request[host] = start + delay
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_id_for(root: str) -> str:
+    """Ingestion runs are identified by their normalized root, so running the same root again resumes it."""
+    return hashlib.sha256(root.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_sitemap(xml_text: str) -> Tuple[List[str], List[str]]:
+    """
+    Reads a sitemap or sitemap index.
+
+    Returns:
+        Tuple[List[str], List[str]]: The page URLs and the nested sitemap URLs it lists.
+    """
+    try:
+        root = ET.fromstring(xml_text.encode("utf-8"))
+    except ET.ParseError as e:
+        print(f"Invalid sitemap: {e}")
+        return [], []
+    locations = [loc.text.strip() for loc in root.iter(f"{SITEMAP_NAMESPACE}loc") if loc.text]
+    if root.tag == f"{SITEMAP_NAMESPACE}sitemapindex":
+        return [], locations
+    return locations, []
+
+
+def is_api_page(page: fetcher.FetchResult) -> bool:
+    """
+    Returns True for pages worth extracting: generated reference docs, or pages whose markdown
+    has at least INGEST_MIN_SIGNATURES call signatures. Overviews and tutorials are only crawled.
+
+    The markdown is the pipeline's own (html_extraction.cached_html_transformer()), stored by
+    body hash, so extracting the page afterwards does not transform it again.
+    """
+    if structured_extraction.detect_format(page.text) is not None:
+        return True
+    markdown, _ = html_extraction.cached_html_transformer(page)
+    return len(pruning.SIGNATURE_RE.findall(markdown)) >= INGEST_MIN_SIGNATURES
+
+
+def extract_links(html_content: str, page_url: str) -> List[str]:
+    """Returns the normalized, deduplicated http(s) links of a page, in document order."""
+    links = []
+    for href in HREF_RE.findall(html_content):
+        url = normalize_url(href, page_url)
+        if url and not SKIPPED_EXTENSIONS.search(urlsplit(url).path):
+            links.append(url)
+    return list(dict.fromkeys(links))
+
+
+class Ingestion:
+    """
+    One resumable crawl-and-extract run.
+
+    Args:
+        root (str): Doc root URL, or the URL of a sitemap.xml.
+        output (str): JSONL file results are appended to.
+        user_name (str): user_name written into every extracted item.
+        scope (str, optional): URL prefix pages must be under. Defaults to the root's directory
+            (or, for a sitemap, the whole host).
+        max_pages (int): Frontier size bound; links beyond it are ignored.
+        max_depth (int): Link hops followed from the root or the sitemap entries.
+        max_workers (int): Pages processed at once.
+        delay (float): Seconds between requests to one host.
+        max_per_host (int): Concurrent requests to one host.
+    """
+
+    def __init__(self, root: str, output: str, user_name: str = "bulk_ingest", scope: Optional[str] = None,
+                 max_pages: int = INGEST_MAX_PAGES, max_depth: int = INGEST_MAX_DEPTH,
+                 max_workers: int = INGEST_MAX_WORKERS, delay: float = INGEST_DELAY,
+                 max_per_host: int = INGEST_MAX_PER_HOST):
+        self.root = normalize_url(root)
+        if self.root is None:
+            raise ValueError(f"Not an http(s) URL: {root}")
+        self.is_sitemap = urlsplit(self.root).path.endswith(".xml")
+        self.scope = normalize_url(scope) if scope else (
+            f"{urlsplit(self.root).scheme}://{urlsplit(self.root).netloc}/" if self.is_sitemap else self.root
+        )
+        self.output = output
+        self.user_name = user_name
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.politeness = HostPoliteness(delay, max_per_host)
+        self.run_id = run_id_for(self.root)
+        self._output_lock = threading.Lock()
+
+    def _enqueue(self, urls: List[str], depth: int) -> int:
+        """Adds new in-scope URLs to the frontier while it is under max_pages. Returns how many were added."""
+        candidates = [url for url in urls if in_scope(url, self.scope)]
+        if not candidates:
+            return 0
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = self._insert_frontier(conn, candidates, depth)
+            conn.execute("COMMIT")
+            return added
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _insert_frontier(self, conn: sqlite3.Connection, urls: List[str], depth: int) -> int:
+        """Inserts queued URLs while the frontier is under max_pages, in the caller's transaction."""
+        size = conn.execute("SELECT COUNT(*) FROM frontier WHERE run_id = ?", (self.run_id,)).fetchone()[0]
+        added = 0
+        for url in urls:
+            if size + added >= self.max_pages:
+                break
+            added += conn.execute(
+                "INSERT OR IGNORE INTO frontier (run_id, url, depth, state, updated_at) VALUES (?, ?, ?, 'queued', ?)",
+                (self.run_id, url, depth, time.time()),
+            ).rowcount
+        return added
+
+    def _claim(self, limit: int) -> List[Tuple[str, int]]:
+        """Moves up to limit queued URLs, shallowest first, to in_progress and returns them with their depth."""
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT url, depth FROM frontier WHERE run_id = ? AND state = 'queued' ORDER BY depth, rowid LIMIT ?",
+                (self.run_id, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE frontier SET state = 'in_progress', attempts = attempts + 1, updated_at = ? WHERE run_id = ? AND url = ?",
+                [(time.time(), self.run_id, url) for url, _ in rows],
+            )
+            conn.execute("COMMIT")
+            return rows
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, url: str, state: str, error: Optional[str] = None, permanent: bool = False) -> None:
+        # Permanent failures (e.g. 404) use up their attempts, so a resumed run does not retry them
+        _db().execute(
+            "UPDATE frontier SET state = ?, error = ?, updated_at = ?, attempts = MAX(attempts, ?) WHERE run_id = ? AND url = ?",
+            (state, error, time.time(), INGEST_MAX_ATTEMPTS if permanent else 0, self.run_id, url),
+        )
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = serialization.dumps(record) + b"\n"
+        with self._output_lock, open(self.output, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _fetch(self, url: str) -> fetcher.FetchResult:
+        with html_extraction.host_semaphore(url, self.max_per_host):
+            self.politeness.wait_turn(url)
+            return html_extraction.fetch_page(url)
+
+    def seed(self) -> None:
+        """
+        Starts a new run, or resumes one: pages left in progress by an interrupted run are queued again.
+
+        The run is recorded together with its seed URLs, in one transaction; a run recorded with an
+        empty frontier (interrupted while seeding before this was the case) is seeded again.
+        """
+        conn = _db()
+        now = time.time()
+        settings = json.dumps({"scope": self.scope, "max_pages": self.max_pages, "max_depth": self.max_depth})
+        recorded = conn.execute("SELECT 1 FROM ingest_runs WHERE id = ?", (self.run_id,)).fetchone()
+        seeded = conn.execute("SELECT 1 FROM frontier WHERE run_id = ? LIMIT 1", (self.run_id,)).fetchone()
+        if recorded and seeded:
+            conn.execute(
+                "UPDATE frontier SET state = 'queued' WHERE run_id = ? AND (state = 'in_progress' OR "
+                "(state = 'failed' AND attempts < ?))",
+                (self.run_id, INGEST_MAX_ATTEMPTS),
+            )
+            conn.execute("UPDATE ingest_runs SET settings = ?, updated_at = ? WHERE id = ?", (settings, now, self.run_id))
+            print(f"Resuming ingestion {self.run_id} of {self.root}")
+            return
+        if recorded:
+            print(f"Ingestion {self.run_id} has an empty frontier, seeding it again")
+
+        # Sitemaps are read before the transaction, which must not wait on the network
+        pages = self._sitemap_pages() if self.is_sitemap else [self.root]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO ingest_runs (id, root, settings, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET settings = excluded.settings, updated_at = excluded.updated_at",
+                (self.run_id, self.root, settings, now, now),
+            )
+            added = self._insert_frontier(conn, [url for url in pages if in_scope(url, self.scope)], 0)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if self.is_sitemap:
+            print(f"Sitemap listed {len(pages)} pages, {added} queued")
+
+    def _sitemap_pages(self) -> List[str]:
+        """Returns the normalized, deduplicated page URLs of the root sitemap and the sitemaps it nests."""
+        pages, sitemaps, seen = [], [self.root], set()
+        while sitemaps and len(seen) < MAX_SITEMAPS:
+            sitemap = sitemaps.pop(0)
+            if sitemap in seen:
+                continue
+            seen.add(sitemap)
+            try:
+                found_pages, found_sitemaps = parse_sitemap(self._fetch(sitemap).text)
+            except (html_extraction.HTTPError, html_extraction.ErrorFetchingContent) as e:
+                print(f"Skipping sitemap {sitemap}: {e}")
+                continue
+            pages.extend(filter(None, (normalize_url(url) for url in found_pages)))
+            sitemaps.extend(filter(None, (normalize_url(url) for url in found_sitemaps)))
+        return list(dict.fromkeys(pages))
+
+    def process(self, url: str, depth: int) -> str:
+        """
+        Fetches one page, queues its links and extracts it if it is an API page.
+
+        Returns:
+            str: The page's new frontier state.
+        """
+        if not self.politeness.allowed(url):
+            self._finish(url, "crawled", "disallowed by robots.txt")
+            return "crawled"
+        try:
+            page = self._fetch(url)
+        except html_extraction.HTTPError as e:
+            self._finish(url, "failed", f"HTTP Error: {e.status_code}", permanent=400 <= e.status_code < 500 and e.status_code != 429)
+            return "failed"
+        except Exception as e:
+            self._finish(url, "failed", str(e))
+            return "failed"
+
+        # Any failure past the fetch fails this page only, instead of the whole crawl
+        try:
+            if depth < self.max_depth:
+                self._enqueue(extract_links(page.text, url), depth + 1)
+            state = "extracted" if is_api_page(page) else "crawled"
+            if state == "extracted":
+                data, meta = html_extraction.extract_page(url, page, llm_scheduler.BATCH)
+                result = html_extraction.process_results(
+                    {url: {"status": "success", "data": data}}, {"user_name": self.user_name}
+                )[url]
+                # Written before the page is marked done: a crash in between repeats the page on resume
+                self._write({"url": url, "depth": depth, "status": "success", "data": result.data, "meta": meta})
+        except Exception as e:
+            self._finish(url, "failed", str(e))
+            return "failed"
+        self._finish(url, state)
+        return state
+
+    def run(self) -> Dict[str, int]:
+        """
+        Crawls until the frontier is exhausted.
+
+        Returns:
+            Dict[str, int]: Page counts per frontier state for the whole run, including earlier sessions.
+        """
+        self.seed()
+        in_flight = set()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest") as executor:
+            while True:
+                if len(in_flight) < self.max_workers:
+                    for url, depth in self._claim(self.max_workers - len(in_flight)):
+                        in_flight.add(executor.submit(self.process, url, depth))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done += 1
+                    if done % 25 == 0:
+                        print(f"Ingestion {self.run_id}: {self.progress()}")
+        return self.progress()
+
+    def progress(self) -> Dict[str, int]:
+        rows = _db().execute(
+            "SELECT state, COUNT(*) FROM frontier WHERE run_id = ? GROUP BY state", (self.run_id,)
+        ).fetchall()
+        return dict(rows)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="documentation root URL or sitemap.xml URL")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--user-name", default="bulk_ingest")
+    parser.add_argument("--scope", help="URL prefix to stay under (default: the root's directory)")
+    parser.add_argument("--max-pages", type=int, default=INGEST_MAX_PAGES)
+    parser.add_argument("--max-depth", type=int, default=INGEST_MAX_DEPTH)
+    parser.add_argument("--workers", type=int, default=INGEST_MAX_WORKERS)
+    parser.add_argument("--delay", type=float, default=INGEST_DELAY, help="seconds between requests to one host")
+    parser.add_argument("--max-per-host", type=int, default=INGEST_MAX_PER_HOST)
+    args = parser.parse_args(argv)
+
+    ingestion = Ingestion(
+        args.root, args.output, user_name=args.user_name, scope=args.scope, max_pages=args.max_pages,
+        max_depth=args.max_depth, max_workers=args.workers, delay=args.delay, max_per_host=args.max_per_host,
+    )
+    counts = ingestion.run()
+    print(f"Ingestion {ingestion.run_id} finished: {counts}")
+    return 1 if counts.get("failed") and not counts.get("extracted") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+from typing import List, Optional
+
+# Token budget for the markdown sent to a single extract() call.
+CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", "6000"))
+TOKEN_ENCODING = os.environ.get("TOKEN_ENCODING", "cl100k_base")
+
+HEADING_RE = re.compile(r"^#{1,6}\s")
+
+# Rough characters-per-token ratio used when the tiktoken encoding cannot be loaded
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    Returns the tiktoken encoding, loading it on first use (loading takes a noticeable moment).
+
+    Returns None if the encoding cannot be loaded, e.g. when its BPE file cannot be downloaded;
+    token counts then fall back to a character estimate.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    print(f"Could not load tiktoken encoding {TOKEN_ENCODING}, estimating token counts: {e}")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _slice_tokens(text: str, max_tokens: int) -> List[str]:
+    encoding = get_encoding()
+    if encoding is None:
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def _code_state(line: str, in_code: bool) -> bool:
+    """Returns whether we are inside a code block after this line (html2text [code] marks or ``` fences)."""
+    stripped = line.strip()
+    if stripped.startswith("```"):
+        return not in_code
+    if "[code]" in stripped and "[/code]" not in stripped:
+        return True
+    if "[/code]" in stripped:
+        return False
+    return in_code
+
+
+def split_sections(markdown: str) -> List[List[str]]:
+    """
+    Splits markdown into sections, each starting at a heading. Headings inside code blocks
+    (e.g. shell comments) do not start a new section.
+    """
+    sections: List[List[str]] = [[]]
+    in_code = False
+    for line in markdown.splitlines():
+        if not in_code and HEADING_RE.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+        in_code = _code_state(line, in_code)
+    return [section for section in sections if section]
+
+
+def _split_units(lines: List[str]) -> List[str]:
+    """Splits a section into paragraphs at blank lines, never breaking a code block apart."""
+    units, current = [], []
+    in_code = False
+    for line in lines:
+        if not in_code and not line.strip():
+            if current:
+                units.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+        in_code = _code_state(line, in_code)
+    if current:
+        units.append("\n".join(current))
+    return units
+
+
+def _split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """Last resort for a single paragraph or code block larger than the budget."""
+    pieces, current, current_tokens = [], [], 0
+    for line in text.splitlines():
+        line_tokens = count_tokens(line) + 1
+        if line_tokens > max_tokens:
+            if current:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            pieces.extend(_slice_tokens(line, max_tokens))
+            continue
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _split_oversized_section(lines: List[str], max_tokens: int) -> List[str]:
+    """Packs the paragraphs of a section that does not fit the budget, repeating its heading for context."""
+    heading = lines[0] if HEADING_RE.match(lines[0]) else None
+    body = lines[1:] if heading else lines
+    prefix = f"{heading}\n" if heading else ""
+    budget = max(max_tokens - (count_tokens(prefix) if heading else 0), 1)
+
+    chunks, current, current_tokens = [], [], 0
+    for unit in _split_units(body):
+        unit_tokens = count_tokens(unit) + 1
+        parts = _split_by_tokens(unit, budget) if unit_tokens > budget else [unit]
+        for part in parts:
+            part_tokens = count_tokens(part) + 1
+            if current and current_tokens + part_tokens > budget:
+                chunks.append(prefix + "\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append(prefix + "\n\n".join(current))
+    return chunks
+
+
+def chunk_markdown(markdown: str, max_tokens: Optional[int] = None) -> List[str]:
+    """
+    Splits markdown into chunks of at most max_tokens tokens.
+
+    Chunks are cut at heading boundaries, so related content stays together; only sections
+    larger than the budget are split further, at paragraph boundaries outside code blocks.
+
+    Args:
+        markdown (str): Markdown produced by html_transformer().
+        max_tokens (int, optional): Token budget per chunk. Defaults to CHUNK_TOKEN_BUDGET.
+
+    Returns:
+        List[str]: The chunks, in document order. Markdown within budget is returned as one chunk.
+    """
+    max_tokens = max_tokens or CHUNK_TOKEN_BUDGET
+    if count_tokens(markdown) <= max_tokens:
+        return [markdown]
+
+    chunks, current, current_tokens = [], [], 0
+    for section in split_sections(markdown):
+        text = "\n".join(section)
+        section_tokens = count_tokens(text) + 1
+        if section_tokens > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized_section(section, max_tokens))
+            continue
+        if current and current_tokens + section_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += section_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
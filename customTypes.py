@@ -1,35 +1,44 @@
-from typing import List, Dict, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
 
+# Result types of /convert. Slotted dataclasses keep per-item memory low, and orjson serializes
+# them natively, fields in declaration order (the order of the JSON keys).
+
+
+@dataclass
 class ApiCallDetail:
-    def __init__(
-        self,
-        user_name: str,
-        api_name: str,
-        api_call: str,
-        api_version: Optional[str],
-        api_arguments: List[List[str]],
-        functionality: str,
-        env_requirements: Optional[str],
-        example_code: str,
-        meta_data: Optional[str],
-        questions: List[str]
-    ) -> None:
-        self.user_name = user_name
-        self.api_name = api_name
-        self.api_call = api_call
-        self.api_version = api_version
-        self.api_arguments = api_arguments
-        self.functionality = functionality
-        self.env_requirements = env_requirements
-        self.example_code = example_code
-        self.meta_data = meta_data
-        self.questions = questions
+    __slots__ = (
+        "user_name", "api_name", "api_call", "api_version", "api_arguments", "functionality",
+        "env_requirements", "example_code", "meta_data", "Questions",
+    )
+    user_name: str
+    api_name: Optional[str]
+    api_call: Optional[str]
+    api_version: Optional[str]
+    api_arguments: Optional[List[List[str]]]
+    functionality: Optional[str]
+    env_requirements: Optional[List[str]]
+    example_code: Optional[str]
+    meta_data: Optional[Any]
+    Questions: Optional[List[str]]
+
+    @classmethod
+    def from_extraction(cls, item: Any, user_name: str) -> "ApiCallDetail":
+        """Builds a detail from an extracted Option1Format (or a dict with its fields) in one pass."""
+        get = item.get if isinstance(item, dict) else lambda name: getattr(item, name, None)
+        return cls(
+            user_name, get("api_name"), get("api_call"), get("api_version"), get("api_arguments"),
+            get("functionality"), get("env_requirements"), get("example_code"), get("meta_data"), get("Questions"),
+        )
 
+
+@dataclass
 class ConvertedURL:
-    def __init__(self, status: str, data: List[ApiCallDetail]) -> None:
-        self.status = status
-        self.data = data
+    __slots__ = ("status", "data", "meta")
+    status: str
+    # The extracted API calls, or error messages when status is "error"
+    data: Union[List[ApiCallDetail], ApiCallDetail, List[str]]
+    meta: Optional[Dict[str, Any]]
+
 
-class ConvertResult:
-    def __init__(self, results: Dict[str, ConvertedURL]) -> None:
-        self.results = results
\ No newline at end of file
+ConvertResult = Dict[str, ConvertedURL]
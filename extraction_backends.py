@@ -0,0 +1,317 @@
+import os
+import re
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+# Extraction backends turn page markdown into items of a pydantic schema; route() picks one for
+# each page by its size in tokens (before pruning):
+# - small pages, up to ROUTE_SMALL_MAX_TOKENS, go to EXTRACTION_SMALL_BACKEND: by default a single
+#   native OpenAI function call on EXTRACTION_SMALL_MODEL, without the langchain chain around it;
+# - large pages, from ROUTE_LARGE_MIN_TOKENS, go to EXTRACTION_LARGE_BACKEND: by default the
+#   long-context EXTRACTION_LARGE_MODEL, in chunks of EXTRACTION_LARGE_CHUNK_TOKENS instead of
+#   chunking.CHUNK_TOKEN_BUDGET, so in fewer calls;
+# - the others to the langchain extraction chain on the shared model (EXTRACTION_MODEL).
+# EXTRACTION_BACKEND forces one backend for every page, e.g. "local" (deterministic, no network)
+# for tests and offline runs. EXTRACTION_ROUTING=0 sends every page to the langchain backend.
+EXTRACTION_BACKEND = os.environ.get("EXTRACTION_BACKEND", "")
+EXTRACTION_ROUTING = os.environ.get("EXTRACTION_ROUTING", "1") != "0"
+EXTRACTION_MODEL = os.environ.get("EXTRACTION_MODEL", "gpt-3.5-turbo")
+EXTRACTION_SMALL_BACKEND = os.environ.get("EXTRACTION_SMALL_BACKEND", "function_calling")
+EXTRACTION_SMALL_MODEL = os.environ.get("EXTRACTION_SMALL_MODEL", "gpt-3.5-turbo")
+EXTRACTION_LARGE_BACKEND = os.environ.get("EXTRACTION_LARGE_BACKEND", "long_context")
+EXTRACTION_LARGE_MODEL = os.environ.get("EXTRACTION_LARGE_MODEL", "gpt-4-turbo")
+EXTRACTION_LARGE_CHUNK_TOKENS = int(os.environ.get("EXTRACTION_LARGE_CHUNK_TOKENS", "64000"))
+ROUTE_SMALL_MAX_TOKENS = int(os.environ.get("ROUTE_SMALL_MAX_TOKENS", "1500"))
+ROUTE_LARGE_MIN_TOKENS = int(os.environ.get("ROUTE_LARGE_MIN_TOKENS", "12000"))
+
+# The LLM stack (langchain, langchain_openai, openai) takes about two seconds and 100 MB to
+# import, so it is loaded on the first extraction (or by html_extraction.preload()) instead of at import time.
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def create_chat_model(model_name: str):
+    """Creates a ChatOpenAI model for the extraction chain, importing langchain_openai."""
+    from langchain_openai import ChatOpenAI
+    # Retries are left to llm_scheduler, which backs off for the whole worker pool on a 429.
+    # OPENAI_BASE_URL may point at an OpenAI-compatible server such as benchmarks/mock_openai.py.
+    return ChatOpenAI(model_name=model_name, temperature=0, openai_api_key=os.environ.get("OPENAI_API_KEY"),
+                      base_url=os.environ.get("OPENAI_BASE_URL"), max_retries=0)
+
+
+def get_llm():
+    """
+    Returns the shared ChatOpenAI model of the langchain backend, creating it on first use.
+    """
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_chat_model(EXTRACTION_MODEL)
+    return _llm
+
+
+def set_llm(model) -> None:
+    """Replaces the shared model, e.g. with benchmarks/fake_llm.py."""
+    global _llm
+    _llm = model
+
+
+def model_settings(llm) -> Dict[str, Any]:
+    """The model settings that change extraction output, part of every cache key."""
+    return {
+        "model_name": getattr(llm, "model_name", None),
+        "temperature": getattr(llm, "temperature", None),
+    }
+
+
+def extraction_function(pydantic_schema) -> Dict[str, Any]:
+    """The function definition the langchain extraction chain sends: a list of schema items under "info"."""
+    schema = pydantic_schema.schema()
+    return {
+        "name": "information_extraction",
+        "description": "Extracts the relevant information from the passage.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "info": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {key: {"title": key, **value} for key, value in schema["properties"].items()},
+                        "required": schema.get("required", []),
+                    },
+                },
+            },
+            "required": ["info"],
+        },
+    }
+
+
+class ExtractionBackend(ABC):
+    """
+    Turns markdown into a list of items of a pydantic schema.
+
+    Attributes:
+        name (str): The backend's label in metrics and in the result "meta".
+        uses_openai (bool): Calls go through llm_scheduler and count against the OpenAI quota.
+        chunk_tokens (int, optional): Token budget of the markdown in one call, None for
+            chunking.CHUNK_TOKEN_BUDGET.
+    """
+
+    name = "base"
+    uses_openai = True
+    chunk_tokens: Optional[int] = None
+
+    @abstractmethod
+    def settings(self) -> Dict[str, Any]:
+        """The settings that change extraction output, part of every extraction cache key."""
+
+    @abstractmethod
+    def extract(self, content: str, pydantic_schema, template: str) -> Tuple[Any, Dict[str, int]]:
+        """
+        Extracts items from markdown.
+
+        Args:
+            content (str): The markdown, substituted for {api_name} in the template.
+            pydantic_schema: Schema of the extracted items.
+            template (str): Prompt template, e.g. html_extraction.prompt_api().
+
+        Returns:
+            Tuple[Any, Dict[str, int]]: The items and the "prompt" / "completion" tokens consumed.
+        """
+
+
+class LangChainBackend(ExtractionBackend):
+    """
+    The create_extraction_chain_pydantic chain on a langchain chat model: a given model, a
+    ChatOpenAI model of model_name, or else the shared model (get_llm()).
+    """
+
+    def __init__(self, name: str = "langchain", model=None, model_name: Optional[str] = None,
+                 chunk_tokens: Optional[int] = None):
+        self.name = name
+        self.model_name = model_name
+        self.chunk_tokens = chunk_tokens
+        self._model = model
+        self._model_lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._model is None and self.model_name is None:
+            return get_llm()
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = create_chat_model(self.model_name)
+        return self._model
+
+    def settings(self) -> Dict[str, Any]:
+        return model_settings(self.llm)
+
+    def extract(self, content: str, pydantic_schema, template: str) -> Tuple[Any, Dict[str, int]]:
+        from langchain.chains import create_extraction_chain_pydantic
+        from langchain.prompts import PromptTemplate
+        from langchain_community.callbacks import get_openai_callback
+
+        prompt = PromptTemplate(input_variables=["api_name"], template=template)
+        chain = create_extraction_chain_pydantic(pydantic_schema=pydantic_schema, llm=self.llm, prompt=prompt)
+        with get_openai_callback() as usage:
+            extracted_content = chain.run(content)
+        return extracted_content, {"prompt": usage.prompt_tokens, "completion": usage.completion_tokens}
+
+
+class FunctionCallingBackend(ExtractionBackend):
+    """
+    One chat completion with the extraction function as a forced tool call, through the openai
+    client directly: the same prompt and function as the langchain chain, without its prompt,
+    chain and parser layers (or importing langchain at all).
+    """
+
+    def __init__(self, name: str = "function_calling", model_name: str = EXTRACTION_SMALL_MODEL,
+                 chunk_tokens: Optional[int] = None):
+        self.name = name
+        self.model_name = model_name
+        self.chunk_tokens = chunk_tokens
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created lazily (and again after a fork): its connection pool must not be shared by workers
+        with self._client_lock:
+            if self._client is None or self._client_pid != os.getpid():
+                import openai
+                self._client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"),
+                                             base_url=os.environ.get("OPENAI_BASE_URL"), max_retries=0)
+                self._client_pid = os.getpid()
+            return self._client
+
+    def settings(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "temperature": 0, "backend": "function_calling"}
+
+    def extract(self, content: str, pydantic_schema, template: str) -> Tuple[Any, Dict[str, int]]:
+        function = extraction_function(pydantic_schema)
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            temperature=0,
+            messages=[{"role": "user", "content": template.format(api_name=content)}],
+            tools=[{"type": "function", "function": function}],
+            tool_choice={"type": "function", "function": {"name": function["name"]}},
+        )
+        tool_calls = response.choices[0].message.tool_calls or []
+        arguments = json.loads(tool_calls[0].function.arguments) if tool_calls else {}
+        extracted_content = [pydantic_schema.parse_obj(item) for item in arguments.get("info") or []]
+        usage = response.usage
+        tokens = {"prompt": usage.prompt_tokens, "completion": usage.completion_tokens} if usage else {"prompt": 0, "completion": 0}
+        return extracted_content, tokens
+
+
+CALL_RE = re.compile(r"\b([A-Za-z_][\w.:]*)\(([^()\n]{0,200})\)")
+
+
+def local_extraction(text: str, max_items: int = 20) -> List[Dict[str, Any]]:
+    """
+    Deterministically builds Option1Format-shaped items from the call signatures found in text.
+    """
+    items, seen = [], set()
+    for match in CALL_RE.finditer(text):
+        name, arguments = match.group(1), match.group(2)
+        api_call = f"{name}({arguments})"
+        if api_call in seen:
+            continue
+        seen.add(api_call)
+        items.append({
+            "api_name": name,
+            "api_call": api_call,
+            "api_version": None,
+            "api_arguments": [[argument.strip()] for argument in arguments.split(",") if argument.strip()],
+            "functionality": f"Calls {name}",
+            "env_requirements": None,
+            "example_code": api_call,
+            "meta_data": None,
+            "Questions": [f"How do I use {name}?"],
+        })
+        if len(items) >= max_items:
+            break
+    return items
+
+
+class LocalBackend(ExtractionBackend):
+    """
+    Extraction without a model or network access, for tests and offline runs: every call
+    signature in the markdown becomes an item, see local_extraction(). Deterministic and free.
+    """
+
+    name = "local"
+    uses_openai = False
+
+    def settings(self) -> Dict[str, Any]:
+        return {"backend": "local"}
+
+    def extract(self, content: str, pydantic_schema, template: str) -> Tuple[Any, Dict[str, int]]:
+        return [pydantic_schema.parse_obj(item) for item in local_extraction(content)], {"prompt": 0, "completion": 0}
+
+
+_backends: Dict[str, ExtractionBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str) -> ExtractionBackend:
+    """
+    Returns the backend configured under a name: "langchain", "function_calling", "long_context" or "local".
+    """
+    with _backends_lock:
+        if name not in _backends:
+            if name == "langchain":
+                _backends[name] = LangChainBackend()
+            elif name == "function_calling":
+                _backends[name] = FunctionCallingBackend(model_name=EXTRACTION_SMALL_MODEL)
+            elif name == "long_context":
+                _backends[name] = LangChainBackend(name, model_name=EXTRACTION_LARGE_MODEL,
+                                                   chunk_tokens=EXTRACTION_LARGE_CHUNK_TOKENS)
+            elif name == "local":
+                _backends[name] = LocalBackend()
+            else:
+                raise ValueError(f"Unknown extraction backend: {name}")
+        return _backends[name]
+
+
+def as_backend(llm) -> ExtractionBackend:
+    """Wraps a langchain chat model in a LangChainBackend; backends are returned as they are."""
+    if isinstance(llm, ExtractionBackend):
+        return llm
+    return LangChainBackend(model=llm)
+
+
+def primary() -> ExtractionBackend:
+    """The backend of unrouted extraction: the forced one, else the langchain backend."""
+    return get_backend(EXTRACTION_BACKEND or "langchain")
+
+
+def route(tokens: int) -> Tuple[ExtractionBackend, str]:
+    """
+    Picks the backend for a page of the given size and records the decision.
+
+    Args:
+        tokens (int): Size of the markdown to extract from.
+
+    Returns:
+        Tuple[ExtractionBackend, str]: The backend, and the route taken: "forced", "small",
+        "large" or "default".
+    """
+    if EXTRACTION_BACKEND:
+        backend, route_name = get_backend(EXTRACTION_BACKEND), "forced"
+    elif EXTRACTION_ROUTING and tokens <= ROUTE_SMALL_MAX_TOKENS:
+        backend, route_name = get_backend(EXTRACTION_SMALL_BACKEND), "small"
+    elif EXTRACTION_ROUTING and tokens >= ROUTE_LARGE_MIN_TOKENS:
+        backend, route_name = get_backend(EXTRACTION_LARGE_BACKEND), "large"
+    else:
+        backend, route_name = get_backend("langchain"), "default"
+    metrics.EXTRACTION_ROUTES.labels(route_name, backend.name).inc()
+    return backend, route_name
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+import storage
+
+# Persistent cache of LLM extraction results, shared by all workers through local SQLite.
+EXTRACTION_CACHE_ENABLED = os.environ.get("EXTRACTION_CACHE_ENABLED", "1") != "0"
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+EXTRACTION_CACHE_TTL = int(os.environ.get("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS extractions_last_access ON extractions (last_access);
+"""
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("extraction_cache", _SCHEMA)
+
+
+def make_key(markdown: str, prompt: str, schema: str, model_settings: Dict[str, Any]) -> str:
+    """
+    Builds the cache key for an extraction.
+
+    The key covers everything that can change the LLM output: the markdown itself, the
+    prompt template, the output schema and the model settings.
+    """
+    digest = hashlib.sha256()
+    for part in (markdown, prompt, schema, json.dumps(model_settings, sort_keys=True)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get(key: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Looks up a cached extraction.
+
+    Returns:
+        Optional[List[Dict]]: The cached items, or None on a miss, an expired entry or a storage error.
+    """
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+    now = time.time()
+    try:
+        conn = _db()
+        row = conn.execute("SELECT value, created_at FROM extractions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > EXTRACTION_CACHE_TTL:
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+    except sqlite3.Error as e:
+        print(f"Extraction cache read failed: {e}")
+        return None
+
+
+def put(key: str, items: List[Dict[str, Any]]) -> None:
+    """
+    Stores an extraction and evicts the least recently used entries above EXTRACTION_CACHE_MAX_ENTRIES.
+    """
+    if not EXTRACTION_CACHE_ENABLED:
+        return
+    now = time.time()
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO extractions (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(items), now, now),
+        )
+        conn.execute(
+            "DELETE FROM extractions WHERE key IN "
+            "(SELECT key FROM extractions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (EXTRACTION_CACHE_MAX_ENTRIES,),
+        )
+    except sqlite3.Error as e:
+        print(f"Extraction cache write failed: {e}")
@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import codecs
+import hashlib
+import sqlite3
+import threading
+import requests
+
+from email.utils import parsedate_to_datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+import storage
+
+# HTTP fetch layer for documentation pages: pooled sessions per host and an on-disk
+# response cache revalidated with ETag / Last-Modified.
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "30"))  # seconds
+FETCH_POOL_SIZE = int(os.environ.get("FETCH_POOL_SIZE", "10"))
+FETCH_CACHE_ENABLED = os.environ.get("FETCH_CACHE_ENABLED", "1") != "0"
+FETCH_CACHE_MAX_ENTRIES = int(os.environ.get("FETCH_CACHE_MAX_ENTRIES", "2000"))
+# Largest page body accepted, decompressed, in bytes (0 for no limit). Bodies are streamed and
+# decoded in chunks, so a larger page is abandoned as soon as it crosses the limit.
+FETCH_MAX_BYTES = int(os.environ.get("FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+FETCH_CHUNK_BYTES = 64 * 1024
+USER_AGENT = os.environ.get("FETCH_USER_AGENT", "addapi-server/1.0 (+https://github.com/ShishirPatil/gorilla)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    body_hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS transforms (
+    key TEXT PRIMARY KEY,
+    markdown TEXT NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transforms_last_access ON transforms (last_access);
+"""
+
+_MAX_AGE_RE = re.compile(r"max-age\s*=\s*(\d+)")
+
+
+class ResponseTooLarge(requests.RequestException):
+    pass
+
+
+class FetchResult(NamedTuple):
+    text: str
+    body_hash: str
+    # "fresh" (served from cache without a request), "revalidated" (304) or "fetched" (200)
+    cache_status: str
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the keep-alive session for the host of a URL, creating it on first use.
+    """
+    host = urlparse(url).netloc.lower()
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+            _sessions[host] = session
+        return session
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("fetch_cache", _SCHEMA)
+
+
+def _freshness(headers, now: float) -> Optional[float]:
+    """
+    Computes when a response stops being fresh from its caching headers.
+
+    Returns:
+        Optional[float]: The expiry timestamp, or None if the response must not be stored.
+    """
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return now
+
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        age_header = headers.get("Age", "")
+        age = int(age_header) if age_header.isdigit() else 0
+        return now + max(int(match.group(1)) - age, 0)
+
+    if headers.get("Expires"):
+        try:
+            return parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            return now
+    # No explicit lifetime: keep it only if it can be revalidated later
+    return now
+
+
+def _load_entry(url: str):
+    try:
+        return _db().execute(
+            "SELECT body, body_hash, etag, last_modified, expires_at FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Fetch cache read failed: {e}")
+        return None
+
+
+def _store_entry(url: str, body: str, body_hash: str, etag, last_modified, expires_at: float) -> None:
+    now = time.time()
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (url, body, body_hash, etag, last_modified, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, body, body_hash, etag, last_modified, expires_at, now),
+        )
+        conn.execute(
+            "DELETE FROM responses WHERE url IN "
+            "(SELECT url FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (FETCH_CACHE_MAX_ENTRIES,),
+        )
+    except sqlite3.Error as e:
+        print(f"Fetch cache write failed: {e}")
+
+
+def _touch_entry(url: str, expires_at: float) -> None:
+    try:
+        _db().execute(
+            "UPDATE responses SET expires_at = ?, last_access = ? WHERE url = ?", (expires_at, time.time(), url)
+        )
+    except sqlite3.Error as e:
+        print(f"Fetch cache write failed: {e}")
+
+
+def read_text(response: requests.Response) -> Tuple[str, str]:
+    """
+    Reads a streamed response body, decoding it chunk by chunk and enforcing FETCH_MAX_BYTES.
+
+    The body is decoded with the response's charset like response.text (UTF-8 when there is
+    none), without first holding all of it as bytes.
+
+    Returns:
+        Tuple[str, str]: The text and the SHA-256 of its UTF-8 encoding.
+
+    Raises:
+        ResponseTooLarge: If the body is larger than FETCH_MAX_BYTES.
+    """
+    declared = response.headers.get("Content-Length", "")
+    if FETCH_MAX_BYTES and declared.isdigit() and int(declared) > FETCH_MAX_BYTES:
+        raise ResponseTooLarge(f"Page is {declared} bytes, more than the {FETCH_MAX_BYTES} byte limit")
+    try:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    digest = hashlib.sha256()
+    parts = []
+    received = 0
+    for chunk in response.iter_content(FETCH_CHUNK_BYTES):
+        received += len(chunk)
+        if FETCH_MAX_BYTES and received > FETCH_MAX_BYTES:
+            raise ResponseTooLarge(f"Page is more than the {FETCH_MAX_BYTES} byte limit")
+        parts.append(decoder.decode(chunk))
+        digest.update(parts[-1].encode("utf-8"))
+    parts.append(decoder.decode(b"", final=True))
+    digest.update(parts[-1].encode("utf-8"))
+    return "".join(parts), digest.hexdigest()
+
+
+def fetch(url: str) -> FetchResult:
+    """
+    Fetches a page through the response cache.
+
+    Fresh cached responses are returned without touching the network; stale ones are
+    revalidated with If-None-Match / If-Modified-Since so an unchanged page costs a 304.
+
+    Returns:
+        FetchResult: The page text, a hash of it and how it was obtained.
+
+    Raises:
+        requests.HTTPError: If the server answers with a 4xx or 5xx status.
+        ResponseTooLarge: If the body is larger than FETCH_MAX_BYTES.
+        requests.RequestException: For connection level failures.
+    """
+    now = time.time()
+    entry = _load_entry(url) if FETCH_CACHE_ENABLED else None
+    if entry is not None and entry[4] > now:
+        _touch_entry(url, entry[4])
+        return FetchResult(entry[0], entry[1], "fresh")
+
+    headers = {}
+    if entry is not None:
+        if entry[2]:
+            headers["If-None-Match"] = entry[2]
+        if entry[3]:
+            headers["If-Modified-Since"] = entry[3]
+
+    with get_session(url).get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as response:
+        if response.status_code == 304 and entry is not None:
+            expires_at = _freshness(response.headers, now)
+            _touch_entry(url, expires_at if expires_at is not None else now)
+            return FetchResult(entry[0], entry[1], "revalidated")
+
+        response.raise_for_status()  # Raises an HTTPError if the status is 4xx, 5xx
+        text, body_hash = read_text(response)
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    expires_at = _freshness(response.headers, now)
+    if FETCH_CACHE_ENABLED and expires_at is not None and (expires_at > now or etag or last_modified):
+        _store_entry(url, text, body_hash, etag, last_modified, expires_at)
+    return FetchResult(text, body_hash, "fetched")
+
+
+def get_markdown(key: str) -> Optional[str]:
+    """
+    Returns the markdown previously produced for a page body, so unchanged pages skip re-parsing.
+    """
+    if not FETCH_CACHE_ENABLED:
+        return None
+    try:
+        conn = _db()
+        row = conn.execute("SELECT markdown FROM transforms WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE transforms SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+    except sqlite3.Error as e:
+        print(f"Fetch cache read failed: {e}")
+    return None
+
+
+def put_markdown(key: str, markdown: str) -> None:
+    """
+    Stores the markdown produced for a page body.
+    """
+    if not FETCH_CACHE_ENABLED:
+        return
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO transforms (key, markdown, last_access) VALUES (?, ?, ?)",
+            (key, markdown, time.time()),
+        )
+        conn.execute(
+            "DELETE FROM transforms WHERE key IN "
+            "(SELECT key FROM transforms ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (FETCH_CACHE_MAX_ENTRIES,),
+        )
+    except sqlite3.Error as e:
+        print(f"Fetch cache write failed: {e}")
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import storage
+
+# Short-lived cache of GitHub lookups (a user's fork, the upstream branch head, access token
+# checks), shared by all workers through local SQLite so repeated calls skip the round trips.
+GITHUB_CACHE_ENABLED = os.environ.get("GITHUB_CACHE_ENABLED", "1") != "0"
+FORK_CACHE_TTL = int(os.environ.get("FORK_CACHE_TTL", str(24 * 3600)))  # seconds
+BASE_SHA_CACHE_TTL = int(os.environ.get("BASE_SHA_CACHE_TTL", "300"))  # seconds
+# /check-access-token results: valid tokens, invalid tokens, and how long a worker trusts its
+# own in-memory copy before rereading the shared one (bounds how late an invalidation is seen).
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", "300"))  # seconds
+TOKEN_NEGATIVE_CACHE_TTL = int(os.environ.get("TOKEN_NEGATIVE_CACHE_TTL", "60"))  # seconds
+TOKEN_LOCAL_CACHE_TTL = int(os.environ.get("TOKEN_LOCAL_CACHE_TTL", "10"))  # seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS github_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS github_cache_expires_at ON github_cache (expires_at);
+"""
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("github_cache", _SCHEMA)
+
+
+# token key -> (valid, status code, expires_at), in front of the shared table
+_token_results: Dict[str, Tuple[bool, int, float]] = {}
+_token_results_lock = threading.Lock()
+
+
+def token_key(access_token: str) -> str:
+    """
+    Hashes an access token for use in cache keys, so tokens are never stored. An Authorization
+    header value ("token ..." / "Bearer ...") hashes the same as the bare token.
+    """
+    return hashlib.sha256(access_token.split()[-1].encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[Any]:
+    """
+    Looks up a cached value.
+
+    Returns:
+        The cached value, or None on a miss, an expired entry or a storage error.
+    """
+    if not GITHUB_CACHE_ENABLED:
+        return None
+    try:
+        row = _db().execute(
+            "SELECT value FROM github_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    except sqlite3.Error as e:
+        print(f"GitHub cache read failed: {e}")
+        return None
+
+
+def put(key: str, value: Any, ttl: float) -> None:
+    """Stores a value for ttl seconds, dropping expired entries on the way."""
+    if not GITHUB_CACHE_ENABLED:
+        return
+    now = time.time()
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO github_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), now + ttl),
+        )
+        conn.execute("DELETE FROM github_cache WHERE expires_at <= ?", (now,))
+    except sqlite3.Error as e:
+        print(f"GitHub cache write failed: {e}")
+
+
+def delete(key: str) -> None:
+    if not GITHUB_CACHE_ENABLED:
+        return
+    try:
+        _db().execute("DELETE FROM github_cache WHERE key = ?", (key,))
+    except sqlite3.Error as e:
+        print(f"GitHub cache delete failed: {e}")
+
+
+def get_token_status(access_token: str) -> Optional[Tuple[bool, int]]:
+    """
+    Looks up a cached /check-access-token result.
+
+    Returns:
+        Optional[Tuple[bool, int]]: Whether the token is valid and GitHub's status code, or None on a miss.
+    """
+    if not GITHUB_CACHE_ENABLED:
+        return None
+    key = token_key(access_token)
+    now = time.time()
+    with _token_results_lock:
+        local = _token_results.get(key)
+    if local and local[2] > now:
+        return local[0], local[1]
+
+    cached = get(f"token:{key}")
+    if cached is None:
+        return None
+    with _token_results_lock:
+        _token_results[key] = (cached[0], cached[1], now + TOKEN_LOCAL_CACHE_TTL)
+    return cached[0], cached[1]
+
+
+def put_token_status(access_token: str, valid: bool, status_code: int) -> None:
+    """Caches a token check, for TOKEN_CACHE_TTL if the token is valid, else TOKEN_NEGATIVE_CACHE_TTL."""
+    key = token_key(access_token)
+    ttl = TOKEN_CACHE_TTL if valid else TOKEN_NEGATIVE_CACHE_TTL
+    now = time.time()
+    with _token_results_lock:
+        if len(_token_results) > 10000:
+            for stale in [k for k, (_, _, expires_at) in _token_results.items() if expires_at <= now]:
+                del _token_results[stale]
+        _token_results[key] = (valid, status_code, now + min(ttl, TOKEN_LOCAL_CACHE_TTL))
+    put(f"token:{key}", [valid, status_code], ttl)
+
+
+def invalidate_token(access_token: str) -> None:
+    """Forgets a token's cached check, e.g. after GitHub rejected it with a 401."""
+    key = token_key(access_token)
+    with _token_results_lock:
+        _token_results.pop(key, None)
+    delete(f"token:{key}")
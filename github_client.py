@@ -0,0 +1,555 @@
+import os
+import time
+import base64
+import hashlib
+import threading
+import requests
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Generator, Optional, Tuple
+from requests.adapters import HTTPAdapter
+
+import github_cache
+import metrics
+
+# Shared client for the GitHub REST API. GITHUB_API_URL can point at a local stand-in
+# (see benchmarks/mock_github.py) for testing.
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "10"))  # seconds, per attempt
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+GITHUB_BACKOFF = float(os.getenv("GITHUB_BACKOFF", "0.5"))  # seconds, doubled after each attempt
+# Never sleep longer than this for a retry; fail instead of tying up the worker.
+GITHUB_MAX_RETRY_WAIT = float(os.getenv("GITHUB_MAX_RETRY_WAIT", "20"))
+GITHUB_POOL_SIZE = int(os.getenv("GITHUB_POOL_SIZE", "20"))
+
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+
+# Steps yielded by the operations of BaseGitHubClient
+SEND = "send"
+SLEEP = "sleep"
+CALL = "call"
+Steps = Generator[Tuple[str, Any], Any, Any]
+
+
+class GitHubError(Exception):
+    def __init__(self, message, status_code=None):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def error_message(response) -> str:
+    """Extracts the GitHub error message from a response."""
+    try:
+        return response.json().get('message', 'No error message provided.')
+    except ValueError:
+        # In case the response body does not contain valid JSON
+        return 'No error message provided.'
+
+
+class BaseGitHubClient(ABC):
+    """
+    Retry and rate limit policy and GitHub operations shared by the blocking and the asyncio
+    GitHub clients, which only differ in how they send requests and wait.
+
+    Every call has a timeout and is retried with exponential backoff on connection errors and
+    5xx responses. Rate limited responses (429, or 403 for primary and secondary rate limits)
+    are retried after the wait GitHub asks for via Retry-After or X-RateLimit-Reset, unless that
+    wait exceeds GITHUB_MAX_RETRY_WAIT. X-RateLimit-Remaining is tracked per credential so an
+    exhausted credential fails fast instead of making calls that are bound to be rejected.
+    """
+
+    def __init__(self, base_url: str = GITHUB_API_URL, timeout: float = GITHUB_TIMEOUT,
+                 max_retries: int = GITHUB_MAX_RETRIES, backoff: float = GITHUB_BACKOFF,
+                 pool_size: int = GITHUB_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        # credential key -> (remaining, reset timestamp)
+        self.rate_limits: Dict[str, Tuple[int, float]] = {}
+        self._rate_limits_lock = threading.Lock()
+
+    @staticmethod
+    def _credential_key(access_token: Optional[str], auth) -> str:
+        if access_token:
+            return hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:16]
+        return "app" if auth else "anonymous"
+
+    def _track_rate_limit(self, credential: str, response) -> None:
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or not remaining.isdigit():
+            return
+        reset_at = float(reset) if reset and reset.isdigit() else time.time() + 60
+        with self._rate_limits_lock:
+            self.rate_limits[credential] = (int(remaining), reset_at)
+        metrics.GITHUB_RATE_LIMIT_REMAINING.set(int(remaining))
+
+    def _exhausted_wait(self, credential: str) -> float:
+        """Seconds until the credential's rate limit resets, or 0 if it still has calls left."""
+        with self._rate_limits_lock:
+            remaining, reset_at = self.rate_limits.get(credential, (1, 0.0))
+        if remaining > 0:
+            return 0.0
+        return max(reset_at - time.time(), 0.0)
+
+    def _retry_delay(self, response, attempt: int) -> Optional[float]:
+        """Returns how long to wait before retrying a response, or None if it must not be retried."""
+        status = response.status_code
+        if status in (403, 429):
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                reset = response.headers.get("X-RateLimit-Reset", "")
+                return max(float(reset) - time.time(), 1.0) if reset.isdigit() else 60.0
+            if status == 429 or "secondary rate limit" in error_message(response).lower():
+                # GitHub asks to wait at least a minute when no header says otherwise
+                return max(60.0, self.backoff * 2 ** attempt)
+            return None  # a plain permission error
+        if status in RETRYABLE_STATUS_CODES:
+            return self.backoff * 2 ** attempt
+        return None
+
+    @abstractmethod
+    def _transport_error(self, error: Exception) -> Tuple[bool, bool]:
+        """Returns whether error is a connection-level failure, and whether it is a read timeout."""
+
+    @abstractmethod
+    def _run(self, steps: Steps) -> Any:
+        """Runs the steps of an operation (see below) on the client's transport and returns its result."""
+
+    #########################
+    ### GitHub operations ###
+    #########################
+
+    # Each operation is a generator of steps, so both clients share it: (SEND, (method, url,
+    # headers, auth, kwargs)) is answered with the response, or the transport error thrown
+    # back in, (SLEEP, seconds) with None and (CALL, (fn, args)) with fn(*args), a blocking
+    # github_cache call. The clients only run the steps, see _run.
+
+    @staticmethod
+    def _blocking(fn, *args) -> Steps:
+        return (yield CALL, (fn, args))
+
+    def _request(self, call: str, method: str, path: str, access_token: Optional[str] = None,
+                 auth=None, **kwargs) -> Steps:
+        """
+        Sends a GitHub API request with retries.
+
+        Args:
+            call (str): Name of the operation, used as the metrics label.
+            method (str): HTTP method.
+            path (str): API path, e.g. "/repos/{repo}/forks", or a full URL.
+            access_token (str, optional): Value for the Authorization header (as sent by the frontend).
+            auth (tuple, optional): Basic auth credentials, for the OAuth app endpoints.
+
+        Returns:
+            The last response received. Callers check its status code.
+
+        Raises:
+            GitHubError: If the credential's rate limit is exhausted for longer than GITHUB_MAX_RETRY_WAIT.
+            The transport's error (requests.RequestException, httpx.TransportError): If the request
+            still fails at the connection level after all retries.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        headers = kwargs.pop("headers", {})
+        if access_token:
+            headers["Authorization"] = access_token
+        credential = self._credential_key(access_token, auth)
+
+        with metrics.GITHUB_CALL_SECONDS.labels(call).time():
+            wait = self._exhausted_wait(credential)
+            if wait > GITHUB_MAX_RETRY_WAIT:
+                raise GitHubError(f"GitHub rate limit exhausted, resets in {int(wait)}s.", 429)
+            if wait:
+                yield SLEEP, wait
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = yield SEND, (method, url, headers, auth, kwargs)
+                except Exception as e:
+                    connection_error, read_timeout = self._transport_error(e)
+                    # A read timeout may mean GitHub already applied a write, so only reads retry it
+                    unsafe = read_timeout and method not in ("GET", "HEAD")
+                    if not connection_error or attempt == self.max_retries or unsafe:
+                        raise
+                    yield SLEEP, self.backoff * 2 ** attempt
+                    continue
+
+                self._track_rate_limit(credential, response)
+                delay = self._retry_delay(response, attempt)
+                if delay is None or attempt == self.max_retries or delay > GITHUB_MAX_RETRY_WAIT:
+                    return response
+                metrics.GITHUB_RETRIES.labels(call).inc()
+                yield SLEEP, delay
+        return response
+
+    def _fork_repository(self, repo: str, access_token: str) -> Steps:
+        """
+        Fork a repository on GitHub using the access token
+        """
+        response = yield from self._request("fork_repository", "POST", f"/repos/{repo}/forks", access_token)
+        if response.status_code == 202:
+            return response.json()
+        # Include the status code and error message in the exception
+        raise GitHubError(
+            f"Failed to fork repository. Status code: {response.status_code}. Error: {error_message(response)}",
+            response.status_code,
+        )
+
+    def _get_latest_commit_sha(self, access_token: str, repo: str, branch: str = "main") -> Steps:
+        """
+        Get the latest commit SHA of a branch in a repository using the access token passed in.
+        """
+        response = yield from self._request(
+            "get_latest_commit_sha", "GET", f"/repos/{repo}/git/ref/heads/{branch}", access_token
+        )
+        if response.status_code == 200:
+            return response.json()["object"]["sha"]
+        raise GitHubError("Failed to get latest commit SHA.", response.status_code)
+
+    def _create_branch(self, repo: str, branch_name: str, access_token: str) -> Steps:
+        """
+        Create a new branch in a repository using the access token passed in as an arg.
+        """
+        latest_sha = yield from self._get_latest_commit_sha(access_token, repo, "main")
+        data = {
+            "ref": f"refs/heads/{branch_name}",
+            "sha": latest_sha,
+        }
+        response = yield from self._request("create_branch", "POST", f"/repos/{repo}/git/refs", access_token, json=data)
+        if response.status_code == 201:
+            return response.json()
+        raise GitHubError("Failed to create branch.", response.status_code)
+
+    def _create_file_in_repo(self, repo: str, file_path: str, commit_message: str, content: str,
+                             branch: str, access_token: str) -> Steps:
+        """
+        Create or update a file in a specified GitHub repository.
+
+        This sends a PUT request to the GitHub API to create or update a file at a specified path within a repository on a specific branch. The file content is base64 encoded before being sent.
+        """
+        data = {
+            "message": commit_message,
+            "content": base64.b64encode(content.encode('utf-8')).decode('utf-8'),
+            "branch": branch,
+        }
+        response = yield from self._request(
+            "create_file_in_repo", "PUT", f"/repos/{repo}/contents/{file_path}", access_token, json=data
+        )
+        if response.status_code in [200, 201]:  # 201 for Created, 200 for Updated
+            return response.json()
+        raise GitHubError(f"Failed to create file: {response.status_code} {error_message(response)}", response.status_code)
+
+    def _get_fork(self, repo: str, access_token: str) -> Steps:
+        """
+        Returns the full name of the user's fork of repo, forking it only if no fork is cached
+        for this access token.
+        """
+        key = f"fork:{repo}:{github_cache.token_key(access_token)}"
+        fork_name = yield from self._blocking(github_cache.get, key)
+        if fork_name is None:
+            fork_name = (yield from self._fork_repository(repo, access_token))['full_name']
+            yield from self._blocking(github_cache.put, key, fork_name, github_cache.FORK_CACHE_TTL)
+        return fork_name
+
+    def _get_branch_head(self, repo: str, branch: str, access_token: str) -> Steps:
+        """
+        Returns the commit SHA and tree SHA at the head of a branch, cached for BASE_SHA_CACHE_TTL.
+        """
+        key = f"head:{repo}:{branch}"
+        head = yield from self._blocking(github_cache.get, key)
+        if head is None:
+            response = yield from self._request(
+                "get_branch_head", "GET", f"/repos/{repo}/branches/{branch}", access_token
+            )
+            if response.status_code != 200:
+                raise GitHubError(f"Failed to get the head of {repo}:{branch}.", response.status_code)
+            commit = response.json()["commit"]
+            head = [commit["sha"], commit["commit"]["tree"]["sha"]]
+            yield from self._blocking(github_cache.put, key, head, github_cache.BASE_SHA_CACHE_TTL)
+        return head[0], head[1]
+
+    def _create_commit(self, repo: str, files: Dict[str, str], commit_message: str, parent_sha: str,
+                       base_tree_sha: str, access_token: str) -> Steps:
+        """
+        Creates a commit adding or replacing several files on top of a parent commit, through the
+        Git Data API. File contents go inline in the tree, so GitHub creates their blobs itself.
+
+        Returns:
+            str: The SHA of the new commit. No branch points to it yet.
+        """
+        tree = [{"path": path, "mode": "100644", "type": "blob", "content": content} for path, content in files.items()]
+        response = yield from self._request(
+            "create_tree", "POST", f"/repos/{repo}/git/trees", access_token,
+            json={"base_tree": base_tree_sha, "tree": tree},
+        )
+        if response.status_code != 201:
+            raise GitHubError(f"Failed to create tree: {response.status_code} {error_message(response)}", response.status_code)
+
+        data = {"message": commit_message, "tree": response.json()["sha"], "parents": [parent_sha]}
+        response = yield from self._request("create_commit", "POST", f"/repos/{repo}/git/commits", access_token, json=data)
+        if response.status_code != 201:
+            raise GitHubError(f"Failed to create commit: {response.status_code} {error_message(response)}", response.status_code)
+        return response.json()["sha"]
+
+    def _create_ref(self, repo: str, branch_name: str, sha: str, access_token: str) -> Steps:
+        data = {"ref": f"refs/heads/{branch_name}", "sha": sha}
+        response = yield from self._request("create_ref", "POST", f"/repos/{repo}/git/refs", access_token, json=data)
+        if response.status_code == 201:
+            return response.json()
+        raise GitHubError(f"Failed to create branch: {response.status_code} {error_message(response)}", response.status_code)
+
+    def _commit_files_to_fork(self, upstream_repo: str, branch_name: str, files: Dict[str, str],
+                              commit_message: str, access_token: str, base_branch: str = "main") -> Steps:
+        """
+        Adds files to a new branch of the user's fork of upstream_repo, in a single commit on top
+        of the upstream base branch.
+
+        On a warm cache this takes three GitHub calls (tree, commit, ref) however many files are
+        written. If GitHub answers 404 or 422, the cached fork or base SHA may be stale (fork
+        deleted, upstream history rewritten), so both are dropped and the commit is retried once.
+
+        Args:
+            upstream_repo (str): The repository the pull request targets, e.g. "owner/repo".
+            branch_name (str): Name of the branch to create in the fork.
+            files (Dict[str, str]): File contents keyed by path in the repository.
+            commit_message (str): Message of the commit.
+            access_token (str): The user's token, as sent in the Authorization header.
+            base_branch (str): Upstream branch to start from.
+
+        Returns:
+            str: The full name of the fork.
+        """
+        for attempt in range(2):
+            fork_name = yield from self._get_fork(upstream_repo, access_token)
+            try:
+                parent_sha, tree_sha = yield from self._get_branch_head(upstream_repo, base_branch, access_token)
+                commit_sha = yield from self._create_commit(
+                    fork_name, files, commit_message, parent_sha, tree_sha, access_token
+                )
+                yield from self._create_ref(fork_name, branch_name, commit_sha, access_token)
+                return fork_name
+            except GitHubError as e:
+                if attempt or e.status_code not in (404, 422):
+                    raise
+                print(f"GitHub answered {e.status_code} for {fork_name}, refreshing cached fork and base SHA.")
+                fork_key = f"fork:{upstream_repo}:{github_cache.token_key(access_token)}"
+                yield from self._blocking(github_cache.delete, fork_key)
+                yield from self._blocking(github_cache.delete, f"head:{upstream_repo}:{base_branch}")
+
+    def _submit_pull_request(self, main_repo: str, title: str, body: str, head: str, base: str,
+                             access_token: str) -> Steps:
+        """Submit a pull request to the main repository."""
+        data = {
+            "title": title,
+            "body": body,
+            "head": head,
+            "base": base,
+        }
+        response = yield from self._request(
+            "submit_pull_request", "POST", f"/repos/{main_repo}/pulls", f"token {access_token}", json=data
+        )
+        if response.status_code == 201:  # 201 Created
+            print("Pull request submitted successfully.")
+            return response.json()  # Returns the created pull request information
+        raise GitHubError(f"Failed to create pull request: {response.status_code} {error_message(response)}", response.status_code)
+
+    def _check_access_token(self, client_id: str, client_secret: str, access_token: str) -> Steps:
+        """
+        Checks an OAuth access token against the OAuth app it was issued for.
+
+        Results are cached by token hash (see github_cache.get_token_status); only definitive
+        answers are cached, not rate limits or server errors.
+
+        Returns:
+            Tuple[bool, int]: Whether the token is valid, and GitHub's status code.
+        """
+        cached = yield from self._blocking(github_cache.get_token_status, access_token)
+        if cached is not None:
+            return cached
+        response = yield from self._request(
+            "check_access_token", "POST", f"/applications/{client_id}/token",
+            auth=(client_id, client_secret),
+            headers={'Accept': 'application/vnd.github+json'},
+            json={'access_token': access_token},
+        )
+        valid = response.status_code == 200
+        if valid or response.status_code in (404, 422):  # 404: token not found for this app
+            yield from self._blocking(github_cache.put_token_status, access_token, valid, response.status_code)
+        return valid, response.status_code
+
+
+class GitHubClient(BaseGitHubClient):
+    """
+    Keep-alive, connection-pooled GitHub API client, see BaseGitHubClient for the retry policy
+    and the operations.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept": "application/vnd.github.v3+json"})
+
+    def _transport_error(self, error: Exception) -> Tuple[bool, bool]:
+        return (isinstance(error, (requests.ConnectionError, requests.Timeout)),
+                isinstance(error, requests.ReadTimeout))
+
+    def _run(self, steps: Steps) -> Any:
+        """Runs an operation, sending its requests on the session and sleeping and calling in this thread."""
+        result, error = None, None
+        while True:
+            try:
+                action, argument = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            if action == SLEEP:
+                time.sleep(argument)
+                continue
+            try:
+                if action == CALL:
+                    fn, args = argument
+                    result = fn(*args)
+                else:
+                    method, url, headers, auth, kwargs = argument
+                    result = self.session.request(method, url, headers=headers, auth=auth, timeout=self.timeout, **kwargs)
+            except Exception as e:
+                error = e
+
+    def request(self, call: str, method: str, path: str, access_token: Optional[str] = None,
+                auth=None, **kwargs) -> requests.Response:
+        """Sends a GitHub API request with retries, see BaseGitHubClient._request."""
+        return self._run(self._request(call, method, path, access_token, auth, **kwargs))
+
+    def fork_repository(self, repo: str, access_token: str) -> Dict[str, Any]:
+        return self._run(self._fork_repository(repo, access_token))
+
+    def get_latest_commit_sha(self, access_token: str, repo: str, branch: str = "main") -> str:
+        return self._run(self._get_latest_commit_sha(access_token, repo, branch))
+
+    def create_branch(self, repo: str, branch_name: str, access_token: str) -> Dict[str, Any]:
+        return self._run(self._create_branch(repo, branch_name, access_token))
+
+    def create_file_in_repo(self, repo: str, file_path: str, commit_message: str, content: str,
+                            branch: str, access_token: str) -> Dict[str, Any]:
+        return self._run(self._create_file_in_repo(repo, file_path, commit_message, content, branch, access_token))
+
+    def get_fork(self, repo: str, access_token: str) -> str:
+        return self._run(self._get_fork(repo, access_token))
+
+    def get_branch_head(self, repo: str, branch: str, access_token: str) -> Tuple[str, str]:
+        return self._run(self._get_branch_head(repo, branch, access_token))
+
+    def create_commit(self, repo: str, files: Dict[str, str], commit_message: str, parent_sha: str,
+                      base_tree_sha: str, access_token: str) -> str:
+        return self._run(self._create_commit(repo, files, commit_message, parent_sha, base_tree_sha, access_token))
+
+    def create_ref(self, repo: str, branch_name: str, sha: str, access_token: str) -> Dict[str, Any]:
+        return self._run(self._create_ref(repo, branch_name, sha, access_token))
+
+    def commit_files_to_fork(self, upstream_repo: str, branch_name: str, files: Dict[str, str],
+                             commit_message: str, access_token: str, base_branch: str = "main") -> str:
+        return self._run(self._commit_files_to_fork(
+            upstream_repo, branch_name, files, commit_message, access_token, base_branch
+        ))
+
+    def submit_pull_request(self, main_repo: str, title: str, body: str, head: str, base: str,
+                            access_token: str) -> Dict[str, Any]:
+        return self._run(self._submit_pull_request(main_repo, title, body, head, base, access_token))
+
+    def check_access_token(self, client_id: str, client_secret: str, access_token: str) -> Tuple[bool, int]:
+        return self._run(self._check_access_token(client_id, client_secret, access_token))
+
+
+class AsyncGitHubClient(BaseGitHubClient):
+    """
+    asyncio counterpart of GitHubClient for the ASGI app (asgi.py): the same operations, run on
+    a pooled httpx.AsyncClient and waiting with asyncio.sleep so the event loop keeps serving.
+    Only the operations the routes use are exposed.
+
+    httpx is imported on first use, so the WSGI deployment does not load it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def client(self):
+        # An AsyncClient belongs to the event loop it was first used in: create one per loop
+        import asyncio
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers={"Accept": "application/vnd.github.v3+json"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _transport_error(self, error: Exception) -> Tuple[bool, bool]:
+        import httpx
+
+        return (isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)),
+                isinstance(error, httpx.ReadTimeout))
+
+    async def _run(self, steps: Steps) -> Any:
+        """
+        Runs an operation, sending its requests on the AsyncClient, sleeping with asyncio.sleep and
+        making its cache calls on the loop's default executor.
+        """
+        import asyncio
+
+        result, error = None, None
+        while True:
+            try:
+                action, argument = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            if action == SLEEP:
+                await asyncio.sleep(argument)
+                continue
+            try:
+                if action == CALL:
+                    fn, args = argument
+                    result = await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+                else:
+                    method, url, headers, auth, kwargs = argument
+                    result = await self.client.request(method, url, headers=headers, auth=auth, **kwargs)
+            except Exception as e:
+                error = e
+
+    async def request(self, call: str, method: str, path: str, access_token: Optional[str] = None,
+                      auth=None, **kwargs):
+        """Sends a GitHub API request with retries, see BaseGitHubClient._request."""
+        return await self._run(self._request(call, method, path, access_token, auth, **kwargs))
+
+    async def commit_files_to_fork(self, upstream_repo: str, branch_name: str, files: Dict[str, str],
+                                   commit_message: str, access_token: str, base_branch: str = "main") -> str:
+        return await self._run(self._commit_files_to_fork(
+            upstream_repo, branch_name, files, commit_message, access_token, base_branch
+        ))
+
+    async def check_access_token(self, client_id: str, client_secret: str, access_token: str) -> Tuple[bool, int]:
+        return await self._run(self._check_access_token(client_id, client_secret, access_token))
+
+
+# Shared by all requests in a worker
+github = GitHubClient()
+async_github = AsyncGitHubClient()
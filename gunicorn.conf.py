@@ -0,0 +1,43 @@
+# Gunicorn server hooks, picked up automatically when gunicorn is started from this directory
+# (e.g. gunicorn --bind 0.0.0.0:8080 wsgi:app).
+# With several workers, aggregate their metrics in a directory outside the checkout:
+#   PROMETHEUS_MULTIPROC_DIR=/tmp/addapi-metrics gunicorn --workers 4 --bind 0.0.0.0:8080 wsgi:app
+import os
+import glob
+
+import metrics
+import transform_pool
+
+# The LLM stack is imported on the first extraction. With LLM_PRELOAD=1 workers load it (and
+# create the model) before taking requests instead; with gunicorn --preload the imports happen
+# once in the master and are shared by the forked workers.
+LLM_PRELOAD = os.environ.get("LLM_PRELOAD", "0") != "0"
+
+
+def on_starting(server):
+    # Samples of a previous run would otherwise be aggregated into /metrics
+    if metrics.MULTIPROC_DIR:
+        os.makedirs(metrics.MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics.MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+    # The app is already loaded in the master when preload_app is set
+    if LLM_PRELOAD and server.cfg.preload_app:
+        import html_extraction
+        html_extraction.preload()
+
+
+def post_worker_init(worker):
+    # Start the html_transformer process pool before the worker takes its first request
+    if transform_pool.TRANSFORM_EXECUTOR == "process":
+        transform_pool.warm()
+    if LLM_PRELOAD:
+        import html_extraction
+        html_extraction.preload(create_model=True)
+
+
+def worker_exit(server, worker):
+    transform_pool.shutdown()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
@@ -1,19 +1,86 @@
 import os
+import html
+import json
+import threading
 import requests
 import html2text
 
-from urllib.parse import urlencode
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urlencode, urlparse
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-from langchain_openai import ChatOpenAI
-from langchain.chains import create_extraction_chain_pydantic
-from langchain.prompts import PromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field, ConfigDict
-from typing import Optional, List, Dict, Any, Union
+from bs4 import BeautifulSoup, FeatureNotFound, Tag
+from typing import Optional, List, Dict, Any, Iterable, Union, Tuple
+
+import chunking
+import extraction_backends
+import extraction_cache
+import fetcher
+import llm_scheduler
+import metrics
+import near_duplicates
+import pruning
+import single_flight
+import structured_extraction
+import transform_pool
+import url_utils
+from customTypes import ApiCallDetail, ConvertedURL, ConvertResult
+from extraction_backends import get_llm, set_llm, model_settings
+
+# The extraction schemas are pydantic v1 models, the same classes langchain_core.pydantic_v1
+# re-exports, imported directly so defining them does not load langchain.
+try:
+    from pydantic.v1 import BaseModel, Field, ConfigDict
+except ImportError:
+    from pydantic import BaseModel, Field, ConfigDict
 
 load_dotenv()
 openai_key = os.environ.get("OPENAI_API_KEY")
-llm = ChatOpenAI(temperature=0, openai_api_key=openai_key)
+
+# Concurrency limits for scrape(). The global limit caps how many URLs are in flight at once in
+# this process, over all requests (they share one pool, see _get_scrape_executor()); the per-host
+# limit caps simultaneous fetches against a single documentation site.
+SCRAPE_MAX_WORKERS = int(os.environ.get("SCRAPE_MAX_WORKERS", "8"))
+SCRAPE_MAX_PER_HOST = int(os.environ.get("SCRAPE_MAX_PER_HOST", "2"))
+
+# Maximum number of extraction backend calls running at once in this process, across all URLs
+# and chunks: single-chunk pages call the backend on their scrape thread, the chunks of longer
+# pages on _llm_executor, and both hold one of the _llm_slots while the call runs.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# BeautifulSoup parser backend: "html.parser" (default) or "lxml", which is faster but loses most of
+# the content of malformed pages such as pydoc's; see the README.
+HTML_PARSER = os.environ.get("HTML_PARSER", "html.parser")
+
+# Bump whenever html_transformer() output changes so cached markdown is not reused.
+TRANSFORM_CACHE_VERSION = "1"
+# Likewise for the entries of structured_extraction's parsers.
+STRUCTURED_CACHE_VERSION = "2"
+
+
+def preload(create_model: bool = False) -> None:
+    """
+    Imports the LLM stack ahead of the first extraction.
+
+    Called in the gunicorn master with --preload so forked workers share the imported modules,
+    see gunicorn.conf.py. The model itself holds an HTTP connection pool, which must not be
+    shared across a fork, so it is only created when create_model is set (in a worker).
+    """
+    import langchain_openai  # noqa: F401
+    import langchain_community.callbacks  # noqa: F401
+    from langchain.chains import create_extraction_chain_pydantic  # noqa: F401
+    from langchain.prompts import PromptTemplate  # noqa: F401
+    if create_model:
+        get_llm()
+
+
+def __getattr__(name: str):
+    # html_extraction.llm still resolves, creating the model on first access
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def prompt_api():
@@ -66,6 +133,21 @@ class Option1Format(BaseModel):
         description="A question describing a real-life scenario that uses this API. Please don't include specific API name.")
 
 
+def prompt_fill():
+    return """The following API calls were read from reference documentation, one per line with a short description. For each api_call, copy it exactly and write Questions: real-life scenarios where someone would need it, without naming the API. Where a line says "needs example", also write example_code, a short Python code snippet using the call.
+
+    API calls:
+    {api_name}
+"""
+
+
+class StructuredFill(BaseModel):
+    api_call: str = Field(description="The api_call exactly as listed")
+    example_code: Optional[str] = Field(description="Python code snippet demonstrating how to use the API, if requested")
+    Questions: Optional[List[str]] = Field(
+        description="A question describing a real-life scenario that uses this API. Please don't include specific API name.")
+
+
 class ErrorFetchingContent(Exception):
     pass
 
@@ -74,78 +156,140 @@ class HTTPError(Exception):
         self.status_code = status_code
         super().__init__(f"HTTP Error with status code: {status_code}")
 
-def load_html(url):
+def fetch_page(url) -> fetcher.FetchResult:
     """
-    Fetches and returns HTML content from a specified URL.
+    Fetches a page through the pooled, revalidating HTTP cache in fetcher.py.
 
     Returns:
-        str: HTML content of the page.
+        FetchResult: HTML content of the page, a hash of it and its cache status.
 
     Raises:
         HTTPError: If an HTTP error occurs.
         ErrorFetchingContent: For non-HTTP exceptions related to fetching content.
     """
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raises an HTTPError if the status is 4xx, 5xx
-        return response.text
+        return fetcher.fetch(url)
     except requests.HTTPError as http_err:
-        raise HTTPError(response.status_code) from http_err
+        raise HTTPError(http_err.response.status_code) from http_err
     except requests.RequestException as req_err:
         raise ErrorFetchingContent(f"Error fetching {url}: {req_err}")
     except Exception as e:
         raise Exception(f"Unexpected Error: {str(e)}")
 
 
+def load_html(url):
+    """
+    Fetches and returns HTML content from a specified URL.
 
-def clean_soup(soup):
+    Returns:
+        str: HTML content of the page.
+
+    Raises:
+        HTTPError: If an HTTP error occurs.
+        ErrorFetchingContent: For non-HTTP exceptions related to fetching content.
     """
-    Cleans a BeautifulSoup object by removing specified tags, classes, and ids.
+    return fetch_page(url).text
 
-    Args:
-        soup (BeautifulSoup): The BeautifulSoup object to clean.
 
-    Returns:
-        BeautifulSoup: A cleaned version of the input BeautifulSoup object.
+EXCLUDE_CLASSES = frozenset([
+    "navbar", "nav", "navigation", "menu", "header", "footer",
+    "sidebar", "advert", "advertisement", "banner", "breadcrumbs",
+    "cookie-consent", "modal", "popup", "feedback", "social",
+    "social-links", "social-media", "share-buttons", "login",
+    "signup", "search-box", "search-bar", "pager", "pagination",
+    "related-links", "related-articles", "comments", "footer-links",
+    "footer-nav", "legal", "disclaimer", "copyright", "toc", "table-of-contents"
+])
+
+EXCLUDE_IDS = frozenset([
+    "navigation", "navbar", "nav", "menu", "header", "footer",
+    "sidebar", "advert", "advertisement", "banner", "breadcrumbs",
+    "cookie-consent", "modal", "popup", "feedback", "social",
+    "social-links", "social-media", "share-buttons", "login",
+    "signup", "search", "pager", "pagination", "related-links",
+    "comments", "footer-links", "footer-nav", "legal", "disclaimer",
+    "copyright", "toc"
+])
+
+EXCLUDE_TAGS = frozenset(["header", "footer"])
+
+# Classes marking the main content of a page, in order of preference
+MAIN_CONTENT_CLASSES = ['main', 'main-content', 'api-documentation', 'content', 'primary-content']
+
+RELEVANT_TAGS = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'code', 'section', 'pre']
+
+
+def is_excluded(tag: Tag) -> bool:
     """
-    exclude_classes = [
-        "navbar", "nav", "navigation", "menu", "header", "footer",
-        "sidebar", "advert", "advertisement", "banner", "breadcrumbs",
-        "cookie-consent", "modal", "popup", "feedback", "social",
-        "social-links", "social-media", "share-buttons", "login",
-        "signup", "search-box", "search-bar", "pager", "pagination",
-        "related-links", "related-articles", "comments", "footer-links",
-        "footer-nav", "legal", "disclaimer", "copyright", "toc", "table-of-contents"
-    ]
+    Returns True if a tag is navigation, chrome or other boilerplate that clean_soup() removes.
+    """
+    return is_excluded_element(tag.name, tag.attrs)
 
-    exclude_ids = [
-        "navigation", "navbar", "nav", "navigation", "menu", "header", "footer",
-        "sidebar", "advert", "advertisement", "banner", "breadcrumbs",
-        "cookie-consent", "modal", "popup", "feedback", "social",
-        "social-links", "social-media", "share-buttons", "login",
-        "signup", "search", "pager", "pagination", "related-links",
-        "comments", "footer-links", "footer-nav", "legal", "disclaimer",
-        "copyright", "toc"
-    ]
 
-    exclude_tags = ["header", "footer"]
+def is_excluded_element(name: str, attrs: Dict[str, Any]) -> bool:
+    """is_excluded() for an element given by its name and attributes, the class as a list or a string."""
+    if name in EXCLUDE_TAGS:
+        return True
+    tag_id = attrs.get("id")
+    if isinstance(tag_id, str) and tag_id in EXCLUDE_IDS:
+        return True
+    classes = attrs.get("class")
+    if classes:
+        if isinstance(classes, str):
+            classes = classes.split()
+        return not EXCLUDE_CLASSES.isdisjoint(classes)
+    return False
 
-    # Remove elements with specified classes and IDs
-    for class_name in exclude_classes:
-        for element in soup.find_all(class_=class_name):
-            # print(element)
-            element.decompose()
 
-    for id_name in exclude_ids:
-        for element in soup.find_all(id=id_name):
-            # print(element)
-            element.decompose()
+def clean_and_find_main(soup):
+    """
+    Cleans a BeautifulSoup object and locates its main content in a single traversal.
 
-    for tag in exclude_tags:
-        for element in soup.find_all(tag):
-            # print(element)
-            element.decompose()
+    Excluded subtrees are removed as soon as they are reached, without visiting their
+    descendants. Along the way, the first surviving element for each MAIN_CONTENT_CLASSES
+    entry and the body are recorded, so no second search is needed.
 
+    Returns:
+        BeautifulSoup: The main content element of the cleaned page (see find_main_content).
+    """
+    main_candidates: Dict[str, Tag] = {}
+    body = None
+    stack = [soup]
+    while stack:
+        node = stack.pop()
+        if node is not soup:
+            if is_excluded(node):
+                node.decompose()
+                continue
+            if body is None and node.name == "body":
+                body = node
+            classes = node.attrs.get("class")
+            if classes:
+                for class_name in MAIN_CONTENT_CLASSES:
+                    if class_name in classes and class_name not in main_candidates:
+                        main_candidates[class_name] = node
+        # Push children in reverse so they are visited in document order
+        stack.extend(reversed([child for child in node.contents if isinstance(child, Tag)]))
+
+    for class_name in MAIN_CONTENT_CLASSES:
+        if class_name in main_candidates:
+            return main_candidates[class_name]
+
+    print("common_class_names not found, reverting to body or entire soup.")
+    return body or soup
+
+
+def clean_soup(soup):
+    """
+    Cleans a BeautifulSoup object by removing specified tags, classes, and ids.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to clean.
+
+    Returns:
+        BeautifulSoup: A cleaned version of the input BeautifulSoup object.
+    """
+    clean_and_find_main(soup)
     return soup
 
 
@@ -156,9 +300,8 @@ def find_main_content(soup):
     Returns:
         BeautifulSoup: The main content element of the page.
     """
-    common_class_names = ['.main', '.main-content', '.api-documentation', '.content', '.primary-content']
-    for class_name in common_class_names:
-        main_content = soup.select_one(class_name)
+    for class_name in MAIN_CONTENT_CLASSES:
+        main_content = soup.select_one(f".{class_name}")
         if main_content:
             return main_content
 
@@ -173,10 +316,9 @@ def extract_relevant_tags(soup):
     Returns:
         BeautifulSoup: A new BeautifulSoup object containing only the relevant tags.
     """
-    tags_to_include = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'code', 'section', 'pre']
     # Create a new soup object to hold the filtered content
     filtered_soup = BeautifulSoup('', 'html.parser')
-    for tag in soup.find_all(tags_to_include):
+    for tag in soup.find_all(RELEVANT_TAGS):
         filtered_soup.append(tag)
     return filtered_soup
 
@@ -188,6 +330,12 @@ def soup_to_markdown(soup) -> str:
     Returns:
         str: The Markdown formatted string of the HTML content.
     """
+    html_content = str(soup)
+    return markdown_converter().handle(html_content)
+
+
+def markdown_converter() -> html2text.HTML2Text:
+    """Returns an html2text converter with the settings html_transformer() uses."""
     h = html2text.HTML2Text()
     h.ignore_links = True
     h.ignore_emphasis = False
@@ -210,108 +358,666 @@ def soup_to_markdown(soup) -> str:
     h.images_to_alt = True  # Convert images to their alt text
     h.body_width = 0  # No wrapping
     h.wrap_tables = True  # Wrap tables during text wrapping
+    return h
 
-    html_content = str(soup)
-    return h.handle(html_content)
+
+def make_soup(html_content: str, parser: Optional[str] = None) -> BeautifulSoup:
+    """
+    Parses HTML with the configured parser backend, falling back to html.parser if it is not installed.
+    """
+    parser = parser or HTML_PARSER
+    try:
+        return BeautifulSoup(html_content, parser)
+    except FeatureNotFound:
+        print(f"HTML parser '{parser}' is not installed, using html.parser.")
+        return BeautifulSoup(html_content, "html.parser")
 
 
-def html_transformer(html_content: str) -> str:
+def html_transformer(html_content: str, parser: Optional[str] = None) -> str:
     """
     Transforms HTML content into a cleaner Markdown format.
 
+    Args:
+        html_content (str): The HTML of the page.
+        parser (str, optional): BeautifulSoup parser backend, "html.parser" or "lxml". Defaults to HTML_PARSER.
+
     Returns:
         str: Markdown representation of the cleaned and only relevant HTML content.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
-    cleaned_soup = clean_soup(soup)
-    main_soup = find_main_content(cleaned_soup)
+    soup = make_soup(html_content, parser)
+    main_soup = clean_and_find_main(soup)
     relevant_soup = extract_relevant_tags(main_soup)
     markdown = soup_to_markdown(relevant_soup)
     return markdown
 
 
-def extract(content: str, llm):
+# Elements without an end tag, as BeautifulSoup treats them
+VOID_ELEMENTS = frozenset([
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image", "img",
+    "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+])
+# html2text drops the content of these anyway
+SILENT_ELEMENTS = frozenset(["script", "style"])
+STREAM_FEED_CHARS = 64 * 1024
+
+
+def _start_tag(tag: str, attrs: List[Tuple[str, Optional[str]]], void: bool = False) -> str:
+    rendered = "".join(f' {name}="{html.escape(value or "")}"' for name, value in attrs)
+    return f"<{tag}{rendered}{'/' if void else ''}>"
+
+
+class StreamingTransformer(HTMLParser):
+    """
+    Event-driven html_transformer(): the page is parsed as it is fed, excluded subtrees are
+    dropped as they stream by and only the relevant elements are kept, already flattened the way
+    extract_relevant_tags() leaves them (each relevant element on its own, in start tag order,
+    without the relevant elements nested in it). No tree of the page is ever built.
+
+    The main content is chosen like clean_and_find_main() does, by remembering which kept
+    elements fall inside the first element of each MAIN_CONTENT_CLASSES class and the body.
+    Once the most preferred one has ended the rest of the page is ignored.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Open elements as (tag, excluded, relevant, [main content classes it starts])
+        self.open: List[Tuple[str, bool, bool, List[str]]] = []
+        self.open_counts: Dict[str, int] = {}
+        self.excluded_depth = 0
+        self.silent_depth = 0
+        # Kept elements in start tag order; None until the element has ended
+        self.items: List[Optional[str]] = []
+        self.buffers: List[Tuple[int, List[str]]] = []
+        # Main content candidates as [first item, end item (None while open)]
+        self.regions: Dict[str, List[Optional[int]]] = {}
+        self.done = False
+
+    def feed(self, data: str) -> None:
+        if not self.done:
+            super().feed(data)
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        excluded = self.excluded_depth > 0 or is_excluded_element(tag, dict(attrs))
+        if tag in VOID_ELEMENTS:
+            if not excluded and self.buffers and not self.silent_depth:
+                self.buffers[-1][1].append(_start_tag(tag, attrs, void=True))
+            return
+
+        relevant = not excluded and tag in RELEVANT_TAGS
+        if not excluded and not relevant and self.buffers and not self.silent_depth:
+            self.buffers[-1][1].append(_start_tag(tag, attrs))
+        if relevant:
+            self.buffers.append((len(self.items), [_start_tag(tag, attrs)]))
+            self.items.append(None)
+
+        regions = []
+        if not excluded:
+            class_names = (dict(attrs).get("class") or "").split()
+            candidates = MAIN_CONTENT_CLASSES + ["body"] if tag == "body" else MAIN_CONTENT_CLASSES
+            for name in candidates:
+                if (name in class_names or name == "body") and name not in self.regions:
+                    self.regions[name] = [len(self.items), None]
+                    regions.append(name)
+        self.excluded_depth += excluded
+        self.silent_depth += tag in SILENT_ELEMENTS
+        self.open.append((tag, excluded, relevant, regions))
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.done or not self.open_counts.get(tag):
+            return
+        # Like BeautifulSoup, an end tag closes every element opened after its start tag
+        while self.open:
+            name, excluded, relevant, regions = self.open.pop()
+            self._close(name, excluded, relevant, regions)
+            if name == tag:
+                break
+        end = self.regions.get(MAIN_CONTENT_CLASSES[0], [None, None])[1]
+        if end is not None and not self.buffers:
+            self.done = True
+
+    def _close(self, tag, excluded, relevant, regions):
+        self.open_counts[tag] -= 1
+        self.excluded_depth -= excluded
+        self.silent_depth -= tag in SILENT_ELEMENTS
+        if relevant:
+            index, parts = self.buffers.pop()
+            parts.append(f"</{tag}>")
+            self.items[index] = "".join(parts)
+        elif not excluded and self.buffers and not self.silent_depth:
+            self.buffers[-1][1].append(f"</{tag}>")
+        for name in regions:
+            self.regions[name][1] = len(self.items)
+
+    def handle_data(self, data):
+        if not self.done and self.buffers and not self.excluded_depth and not self.silent_depth:
+            self.buffers[-1][1].append(html.escape(data, quote=False))
+
+    def main_items(self) -> Iterable[str]:
+        """Ends the parse and returns the kept elements of the main content, in document order."""
+        if not self.done:
+            self.close()
+            while self.open:
+                self._close(*self.open.pop())
+        for name in MAIN_CONTENT_CLASSES + ["body"]:
+            if name in self.regions:
+                start, end = self.regions[name]
+                return self.items[start:end]
+        return self.items
+
+
+def stream_html_transformer(html_content: Union[str, Iterable[str]]) -> str:
+    """
+    Transforms HTML into Markdown like html_transformer(), with memory bounded by the kept
+    content rather than by the page: see StreamingTransformer. Used for very large pages.
+
+    Args:
+        html_content (Union[str, Iterable[str]]): The HTML of the page, whole or in decoded chunks.
+
+    Returns:
+        str: Markdown representation of the cleaned and only relevant HTML content.
+    """
+    chunks = html_content
+    if isinstance(html_content, str):
+        chunks = (html_content[i:i + STREAM_FEED_CHARS] for i in range(0, len(html_content), STREAM_FEED_CHARS))
+    parser = StreamingTransformer()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+
+    h = markdown_converter()
+    h.start = True
+    for item in parser.main_items():
+        h.feed(item)
+    h.feed("")
+    markdown = h.optwrap(h.finish())
+    return html2text.pad_tables_in_text(markdown) if h.pad_tables else markdown
+
+
+def cached_html_transformer(page: fetcher.FetchResult) -> Tuple[str, Dict[str, Any]]:
+    """
+    Transforms a fetched page like html_transformer(), reusing the stored markdown when the
+    same page body was already transformed (e.g. after a 304 revalidation).
+
+    The transformation itself runs inline or in the process pool, see transform_pool.py.
+
+    Returns:
+        Tuple[str, Dict]: The markdown and how it was produced ("transform" and "transform_ms").
+    """
+    key = f"{page.body_hash}:{TRANSFORM_CACHE_VERSION}:{HTML_PARSER}"
+    markdown = fetcher.get_markdown(key)
+    if markdown is not None:
+        return markdown, {"transform": "cached"}
+
+    markdown, transform_meta = transform_pool.transform(page.text, HTML_PARSER)
+    fetcher.put_markdown(key, markdown)
+    return markdown, transform_meta
+
+
+def cached_extract_structured(page: fetcher.FetchResult) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Reads API entries from a generated reference page like structured_extraction.extract_structured(),
+    reusing the stored entries when the same page body was already parsed.
+
+    Only pages carrying a known generator's markers are parsed, with the size limits of the
+    transform (see transform_pool.structured()).
+    """
+    if not structured_extraction.STRUCTURED_EXTRACTION_ENABLED or structured_extraction.detect_format(page.text) is None:
+        return None
+    key = (f"structured:{page.body_hash}:{STRUCTURED_CACHE_VERSION}:{HTML_PARSER}"
+           f":{structured_extraction.STRUCTURED_MIN_ITEMS}")
+    cached = fetcher.get_markdown(key)
+    if cached is not None:
+        entries = json.loads(cached)
+        return tuple(entries) if entries else None
+
+    structured = transform_pool.structured(page.text, HTML_PARSER)
+    fetcher.put_markdown(key, json.dumps(structured))
+    return structured
+
+
+def extract(content: str, llm, pydantic_schema=Option1Format, template: Optional[str] = None):
     """
     Uses a language model to extract structured data from Markdown formatted text.
 
     Args:
         content (str): Markdown text from which to extract information.
         llm (ChatOpenAI): A pre-configured language model instance.
+        pydantic_schema: Schema of the extracted items. Defaults to Option1Format.
+        template (str, optional): Prompt template. Defaults to prompt_api().
 
     Returns:
         Any: The extracted information, structured according to a predefined schema.
     """
-    p = PromptTemplate(input_variables=["api_name"], template=prompt_api())
-    return create_extraction_chain_pydantic(pydantic_schema=Option1Format, llm=llm, prompt=p).run(content)
+    backend = extraction_backends.LangChainBackend(model=llm)
+    return backend.extract(content, pydantic_schema, template or prompt_api())[0]
+
+
+def extract_with_usage(content: str, backend: extraction_backends.ExtractionBackend,
+                       priority: int = llm_scheduler.INTERACTIVE, pydantic_schema=Option1Format,
+                       template: Optional[str] = None) -> Tuple[Any, Dict[str, int]]:
+    """
+    Runs an extraction backend, through the LLM scheduler if it calls OpenAI, and reports the
+    tokens it consumed.
+
+    Args:
+        content (str): Markdown text from which to extract information.
+        backend (ExtractionBackend): The backend to extract with, see extraction_backends.route().
+        priority (int): llm_scheduler.INTERACTIVE or llm_scheduler.BATCH.
+        pydantic_schema, template: See extract().
+
+    Returns:
+        Tuple[Any, Dict[str, int]]: The extracted information and its "prompt" / "completion" token counts.
+    """
+    template = template or prompt_api()
+
+    def call():
+        with _llm_slots, metrics.IN_FLIGHT.labels("llm_calls").track_inprogress(), \
+                metrics.EXTRACTION_BACKEND_SECONDS.labels(backend.name).time():
+            return backend.extract(content, pydantic_schema, template)
 
+    if not backend.uses_openai:
+        return call()
+    estimated_tokens = llm_scheduler.estimate_tokens(template, pydantic_schema.schema_json(), content)
+    extracted_content, tokens = llm_scheduler.scheduler.run(call, estimated_tokens, priority)
+    metrics.count_tokens(tokens["prompt"], tokens["completion"], backend.name)
+    return extracted_content, tokens
 
-def process_results(results: Dict[str, Dict[str, Union[Option1Format, List[Option1Format]]]], option_2_json) -> List[Any]:
+
+def cached_extract(content: str, backend: extraction_backends.ExtractionBackend,
+                   priority: int = llm_scheduler.INTERACTIVE, pydantic_schema=Option1Format,
+                   template: Optional[str] = None) -> Tuple[Any, bool, Dict[str, int]]:
     """
-    Processes extracted results into a structured JSON format.
+    Extracts structured data like extract_with_usage(), reusing a stored result when the same
+    markdown was already extracted with the same prompt, schema and backend settings.
+
+    Args:
+        content (str): Markdown text from which to extract information.
+        backend (ExtractionBackend): The backend to extract with on a miss.
+        priority (int): Scheduling priority of the LLM call on a miss, see llm_scheduler.
+        pydantic_schema, template: See extract().
+
+    Returns:
+        Tuple[Any, bool, Dict[str, int]]: The extracted information, whether it came from the cache
+        and the tokens consumed (zero on a hit).
+    """
+    template = template or prompt_api()
+    key = extraction_cache.make_key(content, template, pydantic_schema.schema_json(), backend.settings())
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        return [pydantic_schema.parse_obj(item) for item in cached], True, {"prompt": 0, "completion": 0}
+
+    extracted_content, tokens = extract_with_usage(content, backend, priority, pydantic_schema, template)
+    if isinstance(extracted_content, list):
+        extraction_cache.put(key, [item.dict() for item in extracted_content])
+    return extracted_content, False, tokens
+
+
+def merge_extractions(extractions: List[List[Option1Format]]) -> List[Option1Format]:
+    """
+    Merges the per-chunk extraction lists of one page, dropping repeated api_calls.
+
+    The first occurrence of an api_call is kept; empty fields on it are filled in from later duplicates.
+    """
+    merged: Dict[str, Option1Format] = {}
+    for items in extractions:
+        for item in items:
+            key = "".join(item.api_call.split())
+            if key not in merged:
+                merged[key] = item
+                continue
+            kept = merged[key]
+            for field_name in Option1Format.__fields__:
+                if not getattr(kept, field_name) and getattr(item, field_name):
+                    setattr(kept, field_name, getattr(item, field_name))
+    return list(merged.values())
+
+
+def select_backend(content: str, llm=None,
+                   tokens: Optional[int] = None) -> Tuple[extraction_backends.ExtractionBackend, Dict[str, str]]:
+    """
+    Returns the backend to extract content with, routed by its size (or tokens, when given) unless
+    llm (a langchain chat model or an ExtractionBackend) is given, and the decision for the result's "meta".
+    """
+    if llm is not None:
+        backend = extraction_backends.as_backend(llm)
+        return backend, {"backend": backend.name}
+    backend, route = extraction_backends.route(chunking.count_tokens(content) if tokens is None else tokens)
+    return backend, {"backend": backend.name, "route": route}
+
+
+def chunked_extract(content: str, llm=None, priority: int = llm_scheduler.INTERACTIVE,
+                    route_tokens: Optional[int] = None) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Extracts structured data from markdown of any length.
+
+    The page is routed to an extraction backend by its size (see extraction_backends.route()),
+    split into chunks within that backend's token budget (see chunking.py), the chunks are
+    extracted in parallel on the shared LLM executor and the results are merged.
+
+    Args:
+        content (str): Markdown text from which to extract information.
+        llm (optional): Extract with this langchain chat model or ExtractionBackend instead of routing.
+        priority (int): Scheduling priority of the LLM calls, see llm_scheduler.
+        route_tokens (int, optional): Size to route by, e.g. the page's size before pruning.
+            Defaults to the size of content.
+
+    Returns:
+        Tuple[Any, Dict]: The extracted information and details about the run (backend and route,
+        chunk count, cache outcome, tokens consumed).
+    """
+    backend, route_meta = select_backend(content, llm, route_tokens)
+    chunks = chunking.chunk_markdown(content, backend.chunk_tokens)
+    if len(chunks) == 1:
+        extracted_content, cache_hit, tokens = cached_extract(chunks[0], backend, priority)
+        return extracted_content, {**route_meta, "chunks": 1, "extraction_cache": "hit" if cache_hit else "miss",
+                                   "tokens": tokens}
+
+    futures = [_llm_executor.submit(cached_extract, chunk, backend, priority) for chunk in chunks]
+    outcomes = [future.result() for future in futures]
+    hits = sum(1 for _, cache_hit, _ in outcomes if cache_hit)
+    cache_status = "hit" if hits == len(outcomes) else "miss" if hits == 0 else "partial"
+    tokens = {
+        "prompt": sum(usage["prompt"] for _, _, usage in outcomes),
+        "completion": sum(usage["completion"] for _, _, usage in outcomes),
+    }
+    extracted_content = merge_extractions([items for items, _, _ in outcomes if isinstance(items, list)])
+    return extracted_content, {**route_meta, "chunks": len(chunks), "extraction_cache": cache_status, "tokens": tokens}
+
+
+def fill_structured(items: List[Dict[str, Any]], llm=None,
+                    priority: int = llm_scheduler.INTERACTIVE) -> Tuple[List[Option1Format], Dict[str, Any]]:
+    """
+    Completes entries read by structured_extraction with the fields the markup cannot provide.
+
+    The LLM only sees one line per entry (its api_call and functionality), not the page, and
+    writes Questions plus example_code where the documentation had none. If that fails the
+    entries are returned without them rather than failing the page. The list is routed to a
+    backend like a page (see chunked_extract()), unless llm is given.
+
+    Returns:
+        Tuple[List[Option1Format], Dict]: The entries and details about the fill (chunk count,
+        cache outcome, tokens consumed).
+    """
+    entries = [Option1Format.parse_obj(item) for item in items]
+    if not structured_extraction.STRUCTURED_LLM_FILL:
+        return entries, {"chunks": 0, "tokens": {"prompt": 0, "completion": 0}}
+
+    lines = [
+        f"- api_call: {entry.api_call} | {entry.functionality or entry.api_name}"
+        + ("" if entry.example_code else " | needs example")
+        for entry in entries
+    ]
+    backend, route_meta = select_backend("\n".join(lines), llm)
+    chunks = chunking.chunk_markdown("\n".join(lines), backend.chunk_tokens)
+    try:
+        futures = [_llm_executor.submit(cached_extract, chunk, backend, priority, StructuredFill, prompt_fill())
+                   for chunk in chunks]
+        outcomes = [future.result() for future in futures]
+    except Exception as e:
+        print(f"Filling structured entries failed, returning them without questions: {e}")
+        return entries, {**route_meta, "chunks": len(chunks), "fill": "failed", "tokens": {"prompt": 0, "completion": 0}}
+
+    fills = {
+        "".join(fill.api_call.split()): fill
+        for fill_items, _, _ in outcomes if isinstance(fill_items, list) for fill in fill_items
+    }
+    for entry in entries:
+        fill = fills.get("".join(entry.api_call.split()))
+        if fill is not None:
+            entry.Questions = fill.Questions
+            entry.example_code = entry.example_code or fill.example_code
+
+    hits = sum(1 for _, cache_hit, _ in outcomes if cache_hit)
+    tokens = {
+        "prompt": sum(usage["prompt"] for _, _, usage in outcomes),
+        "completion": sum(usage["completion"] for _, _, usage in outcomes),
+    }
+    return entries, {
+        **route_meta,
+        "chunks": len(chunks),
+        "extraction_cache": "hit" if hits == len(outcomes) else "miss" if hits == 0 else "partial",
+        "tokens": tokens,
+    }
+
+
+def process_results(results: Dict[str, Dict[str, Any]], option_2_json) -> ConvertResult:
+    """
+    Processes extracted results into the typed /convert result, in a single pass over the items.
 
     Args:
         results (Dict): Dictionary of extraction results keyed by URLs.
         option_2_json (Dict): Additional options and metadata for processing.
 
     Returns:
-        List[Any]: List of processed results in a structured JSON format.
-    """
-    def process_item(item):
-        # Recursively convert items into JSON
-        if isinstance(item, Option1Format):
-            return item.dict()
-        elif isinstance(item, list):
-            return [process_item(sub_item) for sub_item in item]
-        else:
-            return item
-
-    def sort_dict_by_key_order(dct):
-        desired_key_order = [
-            "user_name", "api_name", "api_call", "api_version", "api_arguments",
-            "functionality", "env_requirements", "example_code", "meta_data", "Questions"
-        ]
-        sorted_dict = {key: dct.get(key, None) for key in desired_key_order}
-        sorted_dict["user_name"] = option_2_json["user_name"]
-        return sorted_dict
-    
+        ConvertResult: ConvertedURL results keyed by URL. Successful ones hold ApiCallDetail items,
+        with the fields in the output key order; serialize them with serialization.dumps().
+    """
+    user_name = option_2_json["user_name"]
+    converted = {}
     for url, content in results.items():
+        data = content["data"]
         if content["status"] != "error":
-            # recursively convert data into a JSON
-            json_format: Union[List, Dict] = process_item(content["data"])
-            if isinstance(json_format, list):
-                sorted_json_format = [sort_dict_by_key_order(d) for d in json_format if isinstance(d, dict)]
-            elif isinstance(json_format, dict):
-                sorted_json_format = sort_dict_by_key_order(json_format) if isinstance(json_format, dict) else print(f"ERROR SORTING item: {json_format}")
-            
-            content["data"] = sorted_json_format
+            if isinstance(data, list):
+                data = [ApiCallDetail.from_extraction(item, user_name)
+                        for item in data if isinstance(item, (Option1Format, dict))]
+            elif isinstance(data, (Option1Format, dict)):
+                data = ApiCallDetail.from_extraction(data, user_name)
+            else:
+                print(f"ERROR SORTING item: {data}")
+                data = None
+        converted[url] = ConvertedURL(content["status"], data, content.get("meta"))
+    return converted
 
-    return results
 
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def host_semaphore(url: str, limit: Optional[int] = None) -> threading.BoundedSemaphore:
+    """
+    Returns the semaphore limiting concurrent fetches against the host of a URL.
+
+    Semaphores are shared by every scrape running in this process, so overlapping
+    /convert requests hitting the same site still respect the per-host limit.
+    """
+    limit = limit or SCRAPE_MAX_PER_HOST
+    key = f"{urlparse(url).netloc.lower()}#{limit}"
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(key)
+        if semaphore is None:
+            semaphore = _host_semaphores[key] = threading.BoundedSemaphore(limit)
+        return semaphore
+
+
+def extract_page(url: str, page: fetcher.FetchResult,
+                 priority: int = llm_scheduler.INTERACTIVE) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Runs the structured or transform -> prune -> extract part of the pipeline on a fetched page.
+
+    Pages whose markdown is a near duplicate of an already extracted page (another version or
+    a mirror, see near_duplicates.py) reuse that page's result; their meta names it in "derived_from".
+
+    Returns:
+        Tuple[Any, Dict]: The extracted information and the pipeline details for the result's "meta".
+    """
+    with metrics.time_stage("structured"):
+        structured = cached_extract_structured(page)
+    if structured is not None:
+        # Generated reference docs: entries come from the markup, the LLM only fills in
+        doc_format, items = structured
+        with metrics.time_stage("extract"):
+            extracted_content, extract_meta = fill_structured(items, priority=priority)
+        return extracted_content, {"fetch_cache": page.cache_status, "extractor": doc_format, **extract_meta}
+
+    with metrics.time_stage("transform"):
+        markdown, transform_meta = cached_html_transformer(page)
+    with metrics.time_stage("near_duplicate"):
+        namespace = extraction_cache.make_key("", prompt_api(), Option1Format.schema_json(),
+                                              extraction_backends.primary().settings())
+        fingerprint = near_duplicates.simhash(markdown)
+        match = near_duplicates.find(fingerprint, namespace, url) if fingerprint is not None else None
+    if match is not None:
+        source_url, distance, items = match
+        derived = [Option1Format.parse_obj(item) for item in near_duplicates.derive_items(items, source_url, url)]
+        return derived, {"fetch_cache": page.cache_status, "extractor": "near_duplicate", **transform_meta,
+                         "derived_from": source_url, "simhash_distance": distance,
+                         "tokens": {"prompt": 0, "completion": 0}}
+
+    with metrics.time_stage("prune"):
+        markdown, prune_meta = pruning.prune_markdown(markdown)
+    with metrics.time_stage("extract"):
+        # Routed by the page's size before pruning, which only ever shrinks it
+        extracted_content, extract_meta = chunked_extract(markdown, priority=priority,
+                                                          route_tokens=prune_meta["markdown_tokens"])
+    if fingerprint is not None and isinstance(extracted_content, list) and extracted_content:
+        near_duplicates.put(url, fingerprint, namespace, [item.dict() for item in extracted_content])
+    return extracted_content, {"fetch_cache": page.cache_status, "extractor": "llm",
+                               **transform_meta, **prune_meta, **extract_meta}
+
+
+def scrape_url(url: str, max_per_host: Optional[int] = None,
+               priority: int = llm_scheduler.INTERACTIVE) -> Dict[str, Any]:
+    """
+    Runs the load -> transform -> prune -> extract pipeline for a single URL. Pages generated by
+    Sphinx, pydoc, Javadoc or rustdoc are read directly instead, see structured_extraction.py.
+
+    Args:
+        url (str): The URL to scrape.
+        max_per_host (int, optional): Concurrent fetch limit for the URL's host.
+        priority (int): Scheduling priority of the LLM calls, see llm_scheduler.
+
+    Returns:
+        Dict[str, Union[str, List, Dict]]: A dictionary with "status" and "data", plus "meta" with
+        pipeline details such as the extraction cache outcome. Errors are caught and reported in
+        the result so one bad URL never fails the others.
+    """
+    try:
+        with metrics.IN_FLIGHT.labels("urls").track_inprogress():
+            with host_semaphore(url, max_per_host), metrics.time_stage("fetch"):
+                page = fetch_page(url)
+            extracted_content, meta = extract_page(url, page, priority)
+        metrics.SCRAPE_OUTCOMES.labels("success").inc()
+        return {"status": "success", "data": extracted_content, "meta": meta}
+
+    except HTTPError as http_err:
+        metrics.SCRAPE_OUTCOMES.labels("http_error").inc()
+        return {"status": "error", "data": [f"HTTP Error: {http_err.status_code}"]}
+    except ErrorFetchingContent as err:
+        metrics.SCRAPE_OUTCOMES.labels("fetch_error").inc()
+        return {"status": "error", "data": [str(err)]}
+    except Exception as e:
+        metrics.SCRAPE_OUTCOMES.labels("error").inc()
+        return {"status": "error", "data": [str(e)]}
+
+
+_scrape_executor: Optional[ThreadPoolExecutor] = None
+_scrape_executor_pid: Optional[int] = None
+_scrape_executor_lock = threading.Lock()
 
-def scrape(urls):
+
+def _get_scrape_executor() -> ThreadPoolExecutor:
+    # Created lazily (and again after a fork) so every worker process runs its own pool
+    global _scrape_executor, _scrape_executor_pid
+    with _scrape_executor_lock:
+        if _scrape_executor is None or _scrape_executor_pid != os.getpid():
+            _scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix="scrape")
+            _scrape_executor_pid = os.getpid()
+        return _scrape_executor
+
+
+def coalesced_scrape_url(url: str, max_per_host: Optional[int] = None,
+                         priority: int = llm_scheduler.INTERACTIVE) -> Dict[str, Any]:
+    """
+    Runs scrape_url(), unless the same page (by normalized URL) is already being scraped by
+    another request in this or another worker, in which case that scrape's result is returned.
+    Its "meta" then says where it ran in "coalesced": "thread" or "worker". See single_flight.py.
+    """
+    key = url_utils.normalize_url(url) or url
+    result, coalesced = single_flight.run(key, lambda: scrape_url(url, max_per_host, priority))
+    if coalesced is None:
+        return result
+    metrics.COALESCED_SCRAPES.labels(coalesced).inc()
+    if result.get("meta") is None:
+        return result
+    return {**result, "meta": {**result["meta"], "coalesced": coalesced}}
+
+
+def iter_scrape(urls, max_workers: Optional[int] = None, max_per_host: Optional[int] = None,
+                priority: int = llm_scheduler.INTERACTIVE):
+    """
+    Scrapes a list of URLs concurrently, yielding each result as soon as it is ready.
+
+    Each URL runs its own pipeline on a thread of the process-wide scrape pool (SCRAPE_MAX_WORKERS
+    threads shared by all requests), so fetches, HTML transformation and LLM extraction of
+    different URLs overlap. Duplicate URLs are only scraped once, and a URL already being scraped
+    for another request is awaited rather than scraped again. Closing the iterator early cancels
+    the URLs not started yet.
+
+    Args:
+        urls (List[str]): A list of URLs to scrape.
+        max_workers (int, optional): Maximum number of this call's URLs submitted at once.
+        max_per_host (int, optional): Maximum number of concurrent fetches per host.
+        priority (int): Scheduling priority of the LLM calls, llm_scheduler.INTERACTIVE or BATCH.
+
+    Yields:
+        Tuple[str, Dict]: The URL and its result, in completion order.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return
+
+    executor = _get_scrape_executor()
+    pending = iter(unique_urls)
+    futures = {}
+
+    def submit_next():
+        url = next(pending, None)
+        if url is not None:
+            futures[executor.submit(coalesced_scrape_url, url, max_per_host, priority)] = url
+
+    try:
+        for _ in range(max_workers or SCRAPE_MAX_WORKERS):
+            submit_next()
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                url = futures.pop(future)
+                submit_next()
+                yield url, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def scrape(urls, max_workers: Optional[int] = None, max_per_host: Optional[int] = None):
     """
     Scrapes web content from a list of URLs and extracts structured data of the relevant information relating to API usage.
 
+    URLs are processed concurrently on the process-wide scrape pool (see iter_scrape), at most
+    max_workers of them at once and max_per_host per site.
+
     Args:
         urls (List[str]): A list of URLs to scrape.
+        max_workers (int, optional): Maximum number of URLs processed at once. Defaults to SCRAPE_MAX_WORKERS.
+        max_per_host (int, optional): Maximum concurrent fetches per host. Defaults to SCRAPE_MAX_PER_HOST.
 
     Returns:
         Dict[str, Dict[str, Union[str, List]]]: A dictionary keyed by URLs with "status" and "data"
         indicating the outcome of the scraping process. The "status" can be either "success" or "error",
         with "data" containing the extracted information or an error message.
     """
-    results = {}
-    for url in urls:
-        try:
-            html_content = load_html(url) 
-            markdown = html_transformer(html_content)
-            extracted_content = extract(markdown, llm)
-            results[url] = {"status": "success", "data": extracted_content}
-        
-        except HTTPError as http_err:
-            results[url] = {"status": "error", "data": [f"HTTP Error: {http_err.status_code}"]}
-        except ErrorFetchingContent as err:
-            results[url] = {"status": "error", "data": [str(err)]}
-        except Exception as e:
-            results[url] = {"status": "error", "data": [str(e)]}
+    urls = list(urls)
+    # Pre-fill to keep the results in the order the URLs were submitted
+    results = {url: None for url in urls}
+    for url, result in iter_scrape(urls, max_workers, max_per_host):
+        results[url] = result
     return results
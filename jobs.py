@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import llm_scheduler
+import metrics
+import serialization
+import storage
+from html_extraction import iter_scrape, process_results
+
+# Background /convert jobs. State lives in local SQLite so any gunicorn worker can report
+# on a job, whichever worker accepted it.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_MAX_RETAINED = int(os.environ.get("JOB_MAX_RETAINED", "500"))
+# The worker owning a job (queued on its pool or running) refreshes the job's updated_at this
+# often; a queued or running job not updated for JOB_STALE_SECONDS is assumed lost with its worker.
+JOB_HEARTBEAT = float(os.environ.get("JOB_HEARTBEAT", "10"))
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "60"))
+# Seconds between checks while a request waits for a job, see wait_for_job().
+JOB_WAIT_POLL = float(os.environ.get("JOB_WAIT_POLL", "0.25"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, url)
+);
+CREATE TABLE IF NOT EXISTS job_idempotency_keys (
+    key TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class IdempotencyKeyConflict(Exception):
+    pass
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+# Jobs this process has queued or is running, kept alive by the heartbeat thread
+_owned: Set[str] = set()
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("jobs", _SCHEMA)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created lazily (and again after a fork) so every gunicorn worker runs its own pool and heartbeat
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="convert-job")
+            _executor_pid = os.getpid()
+            _owned.clear()
+            threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True).start()
+        return _executor
+
+
+def _heartbeat() -> None:
+    while True:
+        time.sleep(JOB_HEARTBEAT)
+        with _executor_lock:
+            owned = list(_owned)
+        if not owned:
+            continue
+        try:
+            _db().executemany(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                [(time.time(), job_id) for job_id in owned],
+            )
+        except sqlite3.Error as e:
+            print(f"Job heartbeat failed: {e}")
+
+
+def purge_expired_jobs() -> None:
+    """
+    Deletes finished jobs older than JOB_RETENTION_SECONDS, and the oldest finished jobs
+    beyond JOB_MAX_RETAINED.
+    """
+    conn = _db()
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND (finished_at < ? OR id IN "
+            "(SELECT id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?))",
+            (cutoff, JOB_MAX_RETAINED),
+        )
+        conn.execute("DELETE FROM job_results WHERE job_id NOT IN (SELECT id FROM jobs)")
+        conn.execute("DELETE FROM job_idempotency_keys WHERE job_id NOT IN (SELECT id FROM jobs)")
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def request_hash(urls: List[str], option_2_json: Dict[str, Any]) -> str:
+    """Hash of what a /convert request asks for, to tell a retry from a different request reusing its key."""
+    request = {"api_urls": urls, "user_name": option_2_json.get("user_name")}
+    return hashlib.sha256(serialization.dumps(request)).hexdigest()
+
+
+def _failed_or_lost(status: str, updated_at: float) -> bool:
+    return status == "failed" or (status in ("queued", "running") and time.time() - updated_at > JOB_STALE_SECONDS)
+
+
+def submit_job(api_urls: List[str], option_2_json: Dict[str, Any], idempotency_key: Optional[str] = None,
+               priority: int = llm_scheduler.BATCH) -> str:
+    """
+    Queues a scrape-and-extract run for background processing.
+
+    Args:
+        api_urls (List[str]): The URLs to convert.
+        option_2_json (Dict): The /convert payload, passed on to process_results.
+        idempotency_key (str, optional): Client-chosen key of the request. A retry with the same
+            key (and user) attaches to the job it started instead of queuing a new one, whichever
+            worker receives it; only a job that failed or was lost is started again.
+        priority (int): Scheduling priority of the job's LLM calls, see llm_scheduler.
+
+    Returns:
+        str: The id of the new job, or of the job started earlier with the same idempotency key.
+
+    Raises:
+        IdempotencyKeyConflict: If the key was already used for a request with other URLs.
+    """
+    job_id, urls, created = _create_job(api_urls, option_2_json, idempotency_key)
+    if created:
+        _own(job_id)
+        _get_executor().submit(run_job, job_id, urls, option_2_json, priority)
+    return job_id
+
+
+def run_keyed_job(api_urls: List[str], option_2_json: Dict[str, Any], idempotency_key: str,
+                  priority: int = llm_scheduler.INTERACTIVE) -> str:
+    """
+    Runs an interactive conversion with an idempotency key in the calling thread, recorded as a
+    job so a retry with the same key, in any worker, attaches to it instead of starting again.
+
+    Unlike submit_job() the conversion never waits for the background pool. If the key belongs
+    to a job that is still queued or running elsewhere, this returns at once; wait for it with
+    wait_for_job().
+
+    Returns:
+        str: The id of the job, finished if it was run here.
+
+    Raises:
+        IdempotencyKeyConflict: If the key was already used for a request with other URLs.
+    """
+    job_id, urls, created = _create_job(api_urls, option_2_json, idempotency_key)
+    if created:
+        _own(job_id)
+        run_job(job_id, urls, option_2_json, priority)
+    return job_id
+
+
+def _own(job_id: str) -> None:
+    _get_executor()  # starts this process's heartbeat
+    with _executor_lock:
+        _owned.add(job_id)
+
+
+def _create_job(api_urls: List[str], option_2_json: Dict[str, Any],
+                idempotency_key: Optional[str]) -> Tuple[str, List[str], bool]:
+    """Records a queued job, or finds the live job of the idempotency key. Returns its id, URLs and whether it is new."""
+    purge_expired_jobs()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    urls = list(dict.fromkeys(api_urls))
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if idempotency_key:
+            key = f"{option_2_json.get('user_name')}\0{idempotency_key}"
+            fingerprint = request_hash(urls, option_2_json)
+            row = conn.execute(
+                "SELECT k.job_id, k.request_hash, j.status, j.updated_at FROM job_idempotency_keys k "
+                "JOIN jobs j ON j.id = k.job_id WHERE k.key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and row[1] != fingerprint:
+                raise IdempotencyKeyConflict("Idempotency-Key was already used for a different request")
+            if row is not None and not _failed_or_lost(row[2], row[3]):
+                conn.execute("COMMIT")
+                return row[0], urls, False
+            conn.execute(
+                "INSERT OR REPLACE INTO job_idempotency_keys (key, job_id, request_hash, created_at) VALUES (?, ?, ?, ?)",
+                (key, job_id, fingerprint, now),
+            )
+        conn.execute(
+            "INSERT INTO jobs (id, status, request, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+            (job_id, json.dumps(option_2_json), len(urls), now, now),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    return job_id, urls, True
+
+
+def run_job(job_id: str, urls: List[str], option_2_json: Dict[str, Any],
+            priority: int = llm_scheduler.BATCH) -> None:
+    """
+    Runs a job through the concurrent scrape pipeline, storing each URL's processed result as it finishes.
+    """
+    conn = _db()
+    positions = {url: position for position, url in enumerate(urls)}
+    finished = {}
+    try:
+        conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), job_id))
+        # Background jobs (BATCH) yield the OpenAI quota to interactive /convert requests
+        for url, result in iter_scrape(urls, priority=priority):
+            with metrics.time_stage("process_results"):
+                processed = process_results({url: result}, option_2_json)[url]
+            finished[url] = {"meta": result.get("meta")}
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, position, url, result) VALUES (?, ?, ?, ?)",
+                (job_id, positions[url], url, serialization.dumps(processed).decode("utf-8")),
+            )
+            conn.execute(
+                "UPDATE jobs SET completed = completed + 1, updated_at = ? WHERE id = ?", (time.time(), job_id)
+            )
+            conn.execute("COMMIT")
+        status, error = "done", None
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"Job {job_id} failed: {e}")
+        status, error = "failed", str(e)
+    metrics.observe_request_tokens(finished)
+
+    now = time.time()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (status, error, now, now, job_id),
+        )
+    finally:
+        with _executor_lock:
+            _owned.discard(job_id)
+
+
+def get_job(job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Returns the progress and per-URL results of a job.
+
+    Args:
+        job_id (str): The job id returned by submit_job().
+        include_results (bool): Leave out "results", for a cheap status check.
+
+    Returns:
+        Optional[Dict]: The job with "status" (queued, running, done or failed), "total" and
+        "completed" URL counts, and "results" keyed by URL in the same shape as /convert.
+        None if the job does not exist or has expired.
+    """
+    conn = _db()
+    row = conn.execute(
+        "SELECT status, total, completed, error, created_at, updated_at, finished_at FROM jobs WHERE id = ?",
+        (job_id,),
+    ).fetchone()
+    if row is None:
+        return None
+
+    status, total, completed, error, created_at, updated_at, finished_at = row
+    if status in ("queued", "running") and time.time() - updated_at > JOB_STALE_SECONDS:
+        status, error = "failed", "Job was interrupted before it finished."
+
+    job = {
+        "job_id": job_id,
+        "status": status,
+        "total": total,
+        "completed": completed,
+        "error": error,
+        "created_at": created_at,
+        "finished_at": finished_at,
+    }
+    if not include_results:
+        return job
+    job["results"] = {
+        url: serialization.loads(result)
+        for url, result in conn.execute(
+            "SELECT url, result FROM job_results WHERE job_id = ? ORDER BY position", (job_id,)
+        )
+    }
+    return job
+
+
+def wait_for_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Blocks until a job is done or failed, wherever it runs, and returns it like get_job().
+    """
+    while True:
+        job = get_job(job_id, include_results=False)
+        if job is None or job["status"] in ("done", "failed"):
+            return job and get_job(job_id)
+        time.sleep(JOB_WAIT_POLL)
@@ -0,0 +1,237 @@
+import os
+import time
+import heapq
+import sqlite3
+import itertools
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import chunking
+import metrics
+import storage
+
+# Admission control for OpenAI calls. A token bucket sized to the account's quota is shared by
+# every gunicorn worker through local SQLite; within a worker, callers wait in a priority queue
+# so interactive /convert requests go before background jobs. Set LLM_RPM / LLM_TPM to the
+# limits of the OpenAI tier and model in use, or to 0 to disable that bucket.
+LLM_RPM = int(os.environ.get("LLM_RPM", "500"))
+LLM_TPM = int(os.environ.get("LLM_TPM", "60000"))
+# Expected completion size, added to the prompt tokens when estimating the cost of a call.
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.environ.get("LLM_COMPLETION_TOKENS_ESTIMATE", "1000"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF = float(os.environ.get("LLM_BACKOFF", "1"))  # seconds, doubled after each attempt
+# On a 429 the admitted rate is halved (down to LLM_MIN_RATE_SCALE of the quota) and then
+# grows back by LLM_RATE_SCALE_STEP after every successful call.
+LLM_MIN_RATE_SCALE = float(os.environ.get("LLM_MIN_RATE_SCALE", "0.1"))
+LLM_RATE_SCALE_STEP = float(os.environ.get("LLM_RATE_SCALE_STEP", "0.02"))
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_quota (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    scale REAL NOT NULL,
+    paused_until REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("llm_scheduler", _SCHEMA)
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Estimates the tokens a call will consume: its prompt texts plus the expected completion."""
+    return sum(chunking.count_tokens(text) for text in texts) + LLM_COMPLETION_TOKENS_ESTIMATE
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Reads the wait OpenAI asks for from a rate limit response, if it sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class _Quota:
+    """The shared RPM / TPM token bucket. Every method runs in one SQLite write transaction."""
+
+    def _load(self, conn: sqlite3.Connection, now: float):
+        row = conn.execute("SELECT requests, tokens, scale, paused_until, updated_at FROM llm_quota WHERE id = 1").fetchone()
+        if row is None:
+            row = (LLM_RPM, LLM_TPM, 1.0, 0.0, now)
+            conn.execute("INSERT INTO llm_quota VALUES (1, ?, ?, ?, ?, ?)", row)
+        requests, tokens, scale, paused_until, updated_at = row
+        # Refill at the scaled per-second rate, never beyond one (scaled) minute of quota
+        elapsed = max(now - updated_at, 0.0)
+        requests = min(requests + elapsed * LLM_RPM * scale / 60, LLM_RPM * scale)
+        tokens = min(tokens + elapsed * LLM_TPM * scale / 60, LLM_TPM * scale)
+        return requests, tokens, scale, paused_until
+
+    def _store(self, conn, requests, tokens, scale, paused_until, now) -> None:
+        conn.execute(
+            "UPDATE llm_quota SET requests = ?, tokens = ?, scale = ?, paused_until = ?, updated_at = ? WHERE id = 1",
+            (requests, tokens, scale, paused_until, now),
+        )
+
+    def _transaction(self, update: Callable):
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            result = update(conn, now, *self._load(conn, now))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def try_acquire(self, cost: int) -> float:
+        """
+        Takes one request and cost tokens from the bucket.
+
+        Returns:
+            float: 0 if the call may go ahead, else the seconds to wait before trying again.
+        """
+        def update(conn, now, requests, tokens, scale, paused_until):
+            if paused_until > now:
+                self._store(conn, requests, tokens, scale, paused_until, now)
+                return paused_until - now
+            # A call bigger than the whole bucket goes through once the bucket is full
+            needed_tokens = min(cost, LLM_TPM * scale) if LLM_TPM else 0
+            waits = [0.0]
+            if LLM_RPM and requests < 1:
+                waits.append((1 - requests) * 60 / (LLM_RPM * scale))
+            if LLM_TPM and tokens < needed_tokens:
+                waits.append((needed_tokens - tokens) * 60 / (LLM_TPM * scale))
+            wait = max(waits)
+            if wait == 0:
+                requests -= 1 if LLM_RPM else 0
+                tokens -= cost if LLM_TPM else 0
+            self._store(conn, requests, tokens, scale, paused_until, now)
+            return wait
+        return self._transaction(update)
+
+    def settle(self, estimated: int, used: Optional[int], succeeded: bool) -> None:
+        """
+        Corrects the bucket by the difference between the estimated and the consumed tokens
+        (used None keeps the estimate), and after a successful call grows the rate back.
+        """
+        def update(conn, now, requests, tokens, scale, paused_until):
+            if used is not None and LLM_TPM:
+                tokens -= used - estimated
+            if succeeded:
+                scale = min(scale + LLM_RATE_SCALE_STEP, 1.0)
+            self._store(conn, requests, tokens, scale, paused_until, now)
+        self._transaction(update)
+
+    def throttle(self, wait: float) -> float:
+        """
+        Halves the admitted rate and pauses every worker for wait seconds. 429s arriving while
+        already paused (the rest of the same burst) only extend the pause. Returns the new scale.
+        """
+        def update(conn, now, requests, tokens, scale, paused_until):
+            if paused_until <= now:
+                scale = max(scale / 2, LLM_MIN_RATE_SCALE)
+            self._store(conn, min(requests, 0), min(tokens, 0), scale, max(paused_until, now + wait), now)
+            return scale
+        return self._transaction(update)
+
+
+class LLMScheduler:
+    """
+    Runs LLM calls under the shared quota, highest priority (lowest number) first.
+
+    Only the caller at the head of this process's queue tries the shared bucket, so a
+    batch call never overtakes an interactive one waiting in the same worker.
+    """
+
+    def __init__(self):
+        self.quota = _Quota()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _admit(self, cost: int, priority: int) -> None:
+        entry = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    if self._queue[0] == entry:
+                        wait = self.quota.try_acquire(cost)
+                        if wait == 0:
+                            return
+                        self._condition.wait(min(wait, 1.0))
+                    else:
+                        self._condition.wait()
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+    def run(self, call: Callable[[], Tuple[Any, Dict[str, int]]], estimated_tokens: int,
+            priority: int = INTERACTIVE) -> Tuple[Any, Dict[str, int]]:
+        """
+        Runs call once the quota allows it, retrying rate limited and transient OpenAI errors.
+
+        Args:
+            call (Callable): Makes the LLM call and returns its result with the "prompt" and
+                "completion" tokens it consumed.
+            estimated_tokens (int): Token cost charged up front, see estimate_tokens().
+            priority (int): INTERACTIVE or BATCH.
+
+        Returns:
+            Tuple[Any, Dict[str, int]]: What call returned.
+
+        Raises:
+            RateLimitExceeded: If OpenAI still answers 429 after LLM_MAX_RETRIES retries.
+        """
+        # Imported on first use like the rest of the LLM stack, see html_extraction.get_llm()
+        import openai
+
+        retryable = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+        priority_name = PRIORITY_NAMES.get(priority, str(priority))
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            self._admit(estimated_tokens, priority)
+            metrics.LLM_QUEUE_SECONDS.labels(priority_name).observe(time.perf_counter() - start)
+            try:
+                result, tokens = call()
+            except retryable as e:
+                wait = _retry_after(e) or LLM_BACKOFF * 2 ** attempt
+                if isinstance(e, openai.RateLimitError):
+                    metrics.LLM_RATE_LIMITED.inc()
+                    scale = self.quota.throttle(wait)
+                    print(f"OpenAI rate limited, pausing {wait:.1f}s at {scale:.0%} of the configured quota.")
+                    if attempt == LLM_MAX_RETRIES:
+                        raise RateLimitExceeded(f"OpenAI rate limit persisted after {attempt} retries: {e}") from e
+                else:
+                    self.quota.settle(estimated_tokens, 0, succeeded=False)
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+                    time.sleep(wait)
+                continue
+            except Exception:
+                self.quota.settle(estimated_tokens, None, succeeded=False)
+                raise
+            self.quota.settle(estimated_tokens, tokens["prompt"] + tokens["completion"], succeeded=True)
+            return result, tokens
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,128 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Prometheus metrics served at /metrics.
+# With several gunicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty directory outside
+# the checkout (e.g. /tmp/addapi-metrics) before starting gunicorn: every worker then writes its
+# samples there and /metrics aggregates them.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_SECONDS = Histogram(
+    "addapi_scrape_stage_seconds",
+    "Time spent in each stage of a /convert: fetch, structured, transform, near_duplicate, prune, extract, process_results, serialize",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+GITHUB_CALL_SECONDS = Histogram(
+    "addapi_github_call_seconds",
+    "Latency of GitHub API calls, by helper",
+    ["call"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+GITHUB_RETRIES = Counter("addapi_github_retries_total", "GitHub API calls retried, by helper", ["call"])
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    "addapi_github_rate_limit_remaining",
+    "X-RateLimit-Remaining of the most recent GitHub API response",
+    multiprocess_mode="mostrecent",
+)
+SCRAPE_OUTCOMES = Counter(
+    "addapi_scrape_outcomes_total",
+    "Scraped URLs by outcome: success, http_error, fetch_error or error",
+    ["outcome"],
+)
+COALESCED_SCRAPES = Counter(
+    "addapi_coalesced_scrapes_total",
+    "URLs that reused a scrape already in flight for another request, by where it ran: thread or worker",
+    ["scope"],
+)
+LLM_TOKENS = Counter("addapi_llm_tokens_total", "OpenAI tokens consumed by extraction", ["kind"])
+LLM_QUEUE_SECONDS = Histogram(
+    "addapi_llm_queue_seconds",
+    "Time LLM calls waited for the shared OpenAI quota, by priority",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+LLM_RATE_LIMITED = Counter("addapi_llm_rate_limited_total", "OpenAI calls answered with a 429")
+EXTRACTION_ROUTES = Counter(
+    "addapi_extraction_routes_total",
+    "Pages (and structured fills) by extraction route (small, default, large or forced) and the backend it chose",
+    ["route", "backend"],
+)
+EXTRACTION_BACKEND_SECONDS = Histogram(
+    "addapi_extraction_backend_seconds",
+    "Latency of one extraction call, by backend, not counting the wait for the OpenAI quota",
+    ["backend"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+EXTRACTION_BACKEND_TOKENS = Counter(
+    "addapi_extraction_backend_tokens_total", "Tokens consumed by extraction, by backend", ["backend", "kind"]
+)
+REQUEST_TOKENS = Histogram(
+    "addapi_request_llm_tokens",
+    "OpenAI tokens consumed per /convert request",
+    ["kind"],
+    buckets=(0, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000),
+)
+IN_FLIGHT = Gauge(
+    "addapi_in_flight",
+    "Work currently in progress: HTTP requests by endpoint, URLs being scraped, LLM calls",
+    ["kind"],
+    multiprocess_mode="livesum",
+)
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Times a block as one observation of the given scrape stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def count_tokens(prompt_tokens: int, completion_tokens: int, backend: Optional[str] = None) -> None:
+    LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels("completion").inc(completion_tokens)
+    if backend is not None:
+        EXTRACTION_BACKEND_TOKENS.labels(backend, "prompt").inc(prompt_tokens)
+        EXTRACTION_BACKEND_TOKENS.labels(backend, "completion").inc(completion_tokens)
+
+
+def observe_request_tokens(results: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Records the tokens a whole /convert request consumed, from the per-URL "meta" of its results.
+    Results coalesced with another request's scrape are counted for that request only.
+    """
+    prompt_tokens = completion_tokens = 0
+    for result in results.values():
+        meta = result.get("meta") or {}
+        if meta.get("coalesced"):
+            continue
+        tokens = meta.get("tokens") or {}
+        prompt_tokens += tokens.get("prompt", 0)
+        completion_tokens += tokens.get("completion", 0)
+    REQUEST_TOKENS.labels("prompt").observe(prompt_tokens)
+    REQUEST_TOKENS.labels("completion").observe(completion_tokens)
+
+
+def render() -> Tuple[bytes, str]:
+    """Returns the metrics exposition, aggregated over all workers in multi-process mode."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drops the live gauges of an exited worker (called from the gunicorn child_exit hook)."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import storage
+
+# SimHash index over html_transformer() output, shared by all workers through local SQLite.
+# Pages within NEAR_DUPLICATE_MAX_DISTANCE bits of an already extracted page (other versions
+# or mirrors of the same docs) reuse its result instead of calling the LLM again.
+NEAR_DUPLICATE_ENABLED = os.environ.get("NEAR_DUPLICATE_ENABLED", "1") != "0"
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", "3"))  # differing bits out of 64
+# Pages with fewer shingles than this are too short for a meaningful fingerprint.
+NEAR_DUPLICATE_MIN_SHINGLES = int(os.environ.get("NEAR_DUPLICATE_MIN_SHINGLES", "50"))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.environ.get("NEAR_DUPLICATE_MAX_ENTRIES", "5000"))
+NEAR_DUPLICATE_TTL = int(os.environ.get("NEAR_DUPLICATE_TTL", str(7 * 24 * 3600)))  # seconds
+
+FINGERPRINT_BITS = 64
+SHINGLE_WORDS = 3
+# Splitting the fingerprint into max distance + 1 bands guarantees (pigeonhole) that any page
+# within the distance shares at least one whole band, so lookups only compare those candidates.
+BANDS = NEAR_DUPLICATE_MAX_DISTANCE + 1
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+WORD_RE = re.compile(r"\w+")
+VERSION_RE = re.compile(r"/(v?\d+(?:\.\d+)*(?:\.x)?|latest|stable|dev|master|main)(?=/)", re.IGNORECASE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS simhash_pages (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS simhash_pages_created_at ON simhash_pages (created_at);
+CREATE TABLE IF NOT EXISTS simhash_bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (band, value, key)
+);
+CREATE INDEX IF NOT EXISTS simhash_bands_key ON simhash_bands (key);
+"""
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("near_duplicates", _SCHEMA)
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    Computes the 64-bit SimHash of a text over its lowercased 3-word shingles.
+
+    Returns:
+        Optional[int]: The fingerprint, or None if the text has fewer than NEAR_DUPLICATE_MIN_SHINGLES shingles.
+    """
+    words = WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    if len(shingles) < NEAR_DUPLICATE_MIN_SHINGLES:
+        return None
+    # One 64 character bit string per shingle, concatenated: column i of the matrix is then the
+    # slice [i::64], and counting its ones is a single C-level call per bit
+    bits = "".join(
+        format(int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for shingle in shingles
+    )
+    half = len(shingles) / 2
+    fingerprint = 0
+    for i in range(FINGERPRINT_BITS):
+        fingerprint = (fingerprint << 1) | (bits[i::FINGERPRINT_BITS].count("1") > half)
+    return fingerprint
+
+
+def _bands(fingerprint: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def find(fingerprint: int, namespace: str, url: str) -> Optional[Tuple[str, int, List[Dict[str, Any]]]]:
+    """
+    Looks up the closest indexed page within NEAR_DUPLICATE_MAX_DISTANCE.
+
+    Args:
+        fingerprint (int): SimHash of the new page's markdown.
+        namespace (str): Only pages extracted with the same prompt, schema and model match.
+        url (str): The new page's URL. Its own earlier version never matches, so a page edited
+            in place is extracted again.
+
+    Returns:
+        Optional[Tuple[str, int, List[Dict]]]: The matching page's URL, its distance and its
+        extracted items, or None if there is none or on a storage error.
+    """
+    if not NEAR_DUPLICATE_ENABLED:
+        return None
+    clauses = " OR ".join("(b.band = ? AND b.value = ?)" for _ in range(BANDS))
+    params = [part for band, value in enumerate(_bands(fingerprint)) for part in (band, value)]
+    try:
+        rows = _db().execute(
+            f"SELECT DISTINCT p.url, p.fingerprint, p.value FROM simhash_bands b JOIN simhash_pages p ON p.key = b.key "
+            f"WHERE ({clauses}) AND p.namespace = ? AND p.url != ? AND p.created_at > ?",
+            params + [namespace, url, time.time() - NEAR_DUPLICATE_TTL],
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Near-duplicate index read failed: {e}")
+        return None
+
+    best = None
+    for candidate_url, candidate, value in rows:
+        distance = hamming_distance(fingerprint, candidate)
+        if distance <= NEAR_DUPLICATE_MAX_DISTANCE and (best is None or distance < best[1]):
+            best = (candidate_url, distance, value)
+    if best is None:
+        return None
+    return best[0], best[1], json.loads(best[2])
+
+
+def put(url: str, fingerprint: int, namespace: str, items: List[Dict[str, Any]]) -> None:
+    """
+    Indexes an extracted page, evicting the oldest pages above NEAR_DUPLICATE_MAX_ENTRIES.
+    """
+    if not NEAR_DUPLICATE_ENABLED:
+        return
+    key = hashlib.sha256(f"{namespace}\0{url}".encode("utf-8")).hexdigest()
+    conn = _db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM simhash_bands WHERE key = ?", (key,))
+        conn.execute(
+            "INSERT OR REPLACE INTO simhash_pages (key, namespace, url, fingerprint, value, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, url, _signed(fingerprint), json.dumps(items), time.time()),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO simhash_bands (band, value, key) VALUES (?, ?, ?)",
+            [(band, value, key) for band, value in enumerate(_bands(fingerprint))],
+        )
+        evicted = [row[0] for row in conn.execute(
+            "SELECT key FROM simhash_pages ORDER BY created_at DESC LIMIT -1 OFFSET ?", (NEAR_DUPLICATE_MAX_ENTRIES,)
+        )]
+        conn.executemany("DELETE FROM simhash_pages WHERE key = ?", [(k,) for k in evicted])
+        conn.executemany("DELETE FROM simhash_bands WHERE key = ?", [(k,) for k in evicted])
+        conn.execute("COMMIT")
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"Near-duplicate index write failed: {e}")
+
+
+def url_version(url: str) -> Optional[str]:
+    """Returns the documentation version in a URL path ("/v2/", "/3.11/", "/latest/"), if any."""
+    match = VERSION_RE.search(urlsplit(url).path)
+    return match.group(1) if match else None
+
+
+def derive_items(items: List[Dict[str, Any]], source_url: str, url: str) -> List[Dict[str, Any]]:
+    """
+    Adapts the items extracted from source_url to its near duplicate at url: when the two URLs
+    name different documentation versions, api_version is set to the new page's version.
+    """
+    source_version, version = url_version(source_url), url_version(url)
+    if version is None or version == source_version:
+        return [dict(item) for item in items]
+    return [{**item, "api_version": version} for item in items]
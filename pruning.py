@@ -0,0 +1,182 @@
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from chunking import HEADING_RE, _code_state, count_tokens
+
+# Pruning of the markdown sent to the LLM. Blocks repeated by nested relevant tags are dropped,
+# and with a PRUNE_TOKEN_BUDGET, longer pages lose their least API-like prose. Parts with a call
+# signature are always kept, so pruning never costs api_call coverage.
+PRUNING_ENABLED = os.environ.get("PRUNING_ENABLED", "1") != "0"
+PRUNE_TOKEN_BUDGET = int(os.environ.get("PRUNE_TOKEN_BUDGET", "0"))  # 0 keeps every (deduplicated) block
+# Sections longer than this are scored in windows of about this many tokens instead of as a whole.
+PRUNE_WINDOW_TOKENS = int(os.environ.get("PRUNE_WINDOW_TOKENS", "400"))
+
+# Blocks shorter than this (normalized characters) are never treated as duplicates;
+# short lines such as "Parameters:" legitimately repeat.
+MIN_DUPLICATE_CHARS = 40
+
+# A table row starts or ends with "|", or is the "---|---" separator; "a | b" in prose or a shell
+# pipe is not a table
+TABLE_ROW_RE = re.compile(r"^\s*\||\|\s*$|^\s*:?-{3,}:?(\s*\|\s*:?-{3,}:?)+\s*$")
+SIGNATURE_RE = re.compile(r"\b[A-Za-z_][\w.:]*\s*\([^()\n]{0,200}\)")
+KEYWORD_RE = re.compile(
+    r"^\W*(parameters|arguments|args|keyword arguments|returns?|return type|raises|yields|examples?|usage|"
+    r"signature|syntax|options|fields|methods|attributes)\b",
+    re.IGNORECASE,
+)
+
+
+def split_blocks(markdown: str) -> List[str]:
+    """
+    Splits markdown into blocks: a whole code block, a run of table rows, or a single line
+    (html2text runs with single_line_break, so every line is a paragraph).
+    """
+    blocks, code, table = [], [], []
+    in_code = False
+    for line in markdown.splitlines():
+        now_in_code = _code_state(line, in_code)
+        if in_code or now_in_code:
+            code.append(line)
+            if not now_in_code:
+                blocks.append("\n".join(code))
+                code = []
+            in_code = now_in_code
+            continue
+        if TABLE_ROW_RE.search(line):
+            table.append(line)
+            continue
+        if table:
+            blocks.append("\n".join(table))
+            table = []
+        if line.strip():
+            blocks.append(line)
+    if code or table:
+        blocks.append("\n".join(code or table))
+    return blocks
+
+
+def score_block(block: str) -> float:
+    """
+    Scores how API-like a block is: code blocks, call signatures, parameter tables, headings
+    and parameter / return keywords all count. Plain prose scores 0.
+    """
+    first_line = block.lstrip().splitlines()[0] if block.strip() else ""
+    signatures = min(len(SIGNATURE_RE.findall(block)), 5)
+    score = 2.0 * signatures
+    if "[code]" in first_line or first_line.startswith("```"):
+        score += 3
+    elif HEADING_RE.match(first_line):
+        score += 2 + (3 if signatures else 0)
+    elif TABLE_ROW_RE.search(first_line) and "\n" in block:
+        score += min(block.count("\n"), 10) * 0.5
+    if KEYWORD_RE.match(first_line):
+        score += 2
+    score += min(block.count("`") // 2, 3) * 0.5
+    return score
+
+
+def deduplicate_blocks(blocks: List[str]) -> List[str]:
+    """
+    Drops blocks whose text already appeared, on its own or as lines of an earlier (nesting) block.
+
+    Blocks and their lines are kept in a set, so this stays linear in the page size.
+    """
+    kept, seen = [], set()
+    for block in blocks:
+        normalized = " ".join(block.split())
+        lines = [line for line in (" ".join(line.split()) for line in block.splitlines())
+                 if len(line) >= MIN_DUPLICATE_CHARS]
+        if len(normalized) >= MIN_DUPLICATE_CHARS and (
+            normalized in seen or (lines and all(line in seen for line in lines))
+        ):
+            continue
+        kept.append(block)
+        if len(normalized) >= MIN_DUPLICATE_CHARS:
+            seen.add(normalized)
+            seen.update(lines)
+    return kept
+
+
+def _windows(blocks: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Groups blocks into scoring units: a section (heading and its blocks), or for sections
+    longer than PRUNE_WINDOW_TOKENS, consecutive windows of it. Returns (heading, blocks) pairs.
+    """
+    sections: List[List[str]] = [[]]
+    for block in blocks:
+        if HEADING_RE.match(block) and sections[-1]:
+            sections.append([])
+        sections[-1].append(block)
+
+    units = []
+    for section in sections:
+        heading = section[0] if HEADING_RE.match(section[0]) else ""
+        window, window_tokens = [], 0
+        for block in section:
+            block_tokens = count_tokens(block)
+            # Start a new window before a signature, so a definition stays with its description
+            if window and window_tokens + block_tokens > PRUNE_WINDOW_TOKENS and (
+                window_tokens >= PRUNE_WINDOW_TOKENS / 2 or SIGNATURE_RE.search(block)
+            ):
+                units.append((heading, window))
+                window, window_tokens = [], 0
+            window.append(block)
+            window_tokens += block_tokens
+        if window:
+            units.append((heading, window))
+    return units
+
+
+def prune_markdown(markdown: str, max_tokens: int = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Deduplicates markdown and, when it exceeds the token budget, drops its least API-like prose.
+
+    The opening part of the page and every block with a call signature are always kept, even
+    if they alone exceed the budget. The rest of each part is ranked by score per token (see
+    score_block) and kept while budget remains. Kept blocks stay in document order, each under
+    its section heading.
+
+    Args:
+        markdown (str): Markdown produced by html_transformer().
+        max_tokens (int, optional): Token budget. Defaults to PRUNE_TOKEN_BUDGET; 0 only deduplicates.
+
+    Returns:
+        Tuple[str, Dict]: The pruned markdown, and "markdown_tokens" / "pruned_tokens" counts.
+    """
+    tokens_before = count_tokens(markdown)
+    if not PRUNING_ENABLED:
+        return markdown, {"markdown_tokens": tokens_before, "pruned_tokens": tokens_before}
+    max_tokens = PRUNE_TOKEN_BUDGET if max_tokens is None else max_tokens
+
+    blocks = deduplicate_blocks(split_blocks(markdown))
+    pruned = "\n".join(blocks)
+    pruned_tokens = count_tokens(pruned)
+    if max_tokens and pruned_tokens > max_tokens:
+        units = _windows(blocks)
+        unit_tokens = [sum(count_tokens(block) for block in unit_blocks) + 1 for _, unit_blocks in units]
+        density = [sum(score_block(block) for block in unit_blocks) / tokens
+                   for (_, unit_blocks), tokens in zip(units, unit_tokens)]
+
+        # The opening part (page title, overview) always stays, it names the API, and so do the
+        # signature blocks of every other part: only their prose is traded for the budget
+        signatures = [[block for block in unit_blocks if SIGNATURE_RE.search(block)] for _, unit_blocks in units]
+        signature_tokens = [sum(count_tokens(block) for block in blocks) for blocks in signatures]
+        whole, used = {0}, unit_tokens[0] + sum(signature_tokens[1:])
+        for index in sorted(range(1, len(units)), key=lambda i: -density[i]):
+            if used + unit_tokens[index] - signature_tokens[index] <= max_tokens:
+                whole.add(index)
+                used += unit_tokens[index] - signature_tokens[index]
+
+        lines, last_heading = [], None
+        for index, (heading, unit_blocks) in enumerate(units):
+            kept = unit_blocks if index in whole else signatures[index]
+            if not kept:
+                continue
+            if heading and heading != last_heading and kept[0] != heading:
+                lines.append(heading)
+            last_heading = heading
+            lines.extend(kept)
+        pruned = "\n".join(lines)
+        pruned_tokens = count_tokens(pruned)
+    return pruned, {"markdown_tokens": tokens_before, "pruned_tokens": pruned_tokens}
@@ -0,0 +1,56 @@
+import os
+import gzip
+from typing import Any, Optional
+
+import orjson
+
+# JSON encoding of API responses and stored results. Compact unless pretty output is asked for;
+# responses larger than RESPONSE_GZIP_MIN_BYTES are gzipped for clients that accept it.
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "5"))
+
+
+def _default(obj: Any) -> Any:
+    # pydantic models (Option1Format) left in a result; dataclasses are handled by orjson itself
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """
+    Serializes to UTF-8 JSON bytes with orjson.
+
+    Args:
+        obj: The value, which may contain ApiCallDetail / ConvertedURL dataclasses.
+        pretty (bool): Indent with two spaces instead of the compact form.
+    """
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+
+def loads(data) -> Any:
+    return orjson.loads(data)
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Optional[bytes]:
+    """
+    Gzips a response body if the client accepts gzip and the body is large enough to benefit.
+
+    Returns:
+        Optional[bytes]: The compressed body, or None to send it as is.
+    """
+    if len(body) < RESPONSE_GZIP_MIN_BYTES or not accepts_gzip(accept_encoding):
+        return None
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Parses an Accept-Encoding header: gzip (or *) listed without q=0."""
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*"):
+            q = params.strip().replace(" ", "")
+            return q not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
@@ -0,0 +1,206 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+import serialization
+import storage
+
+# Coalesces concurrent runs of the same work, keyed by e.g. a normalized URL: the first caller
+# runs it and callers arriving while it is in flight get its result instead of running it again.
+# Threads of one worker wait on the flight directly; other gunicorn workers find it in local
+# SQLite and poll for the result, which is stored as JSON when the flight lands.
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "1") != "0"
+SINGLE_FLIGHT_POLL = float(os.environ.get("SINGLE_FLIGHT_POLL", "0.25"))  # seconds
+# The worker running a flight refreshes its heartbeat this often; a flight whose heartbeat is
+# older than SINGLE_FLIGHT_STALE is assumed lost with its worker and taken over by a waiter.
+SINGLE_FLIGHT_HEARTBEAT = float(os.environ.get("SINGLE_FLIGHT_HEARTBEAT", "5"))
+SINGLE_FLIGHT_STALE = float(os.environ.get("SINGLE_FLIGHT_STALE", "30"))
+# How long a landed flight's result stays readable for waiters in other workers.
+SINGLE_FLIGHT_RESULT_TTL = float(os.environ.get("SINGLE_FLIGHT_RESULT_TTL", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result TEXT,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+# Flights this process is running in the cross-worker table, refreshed by the heartbeat thread
+_leading: Set[Tuple[str, str]] = set()
+_heartbeat_pid: Optional[int] = None
+
+
+def _db() -> sqlite3.Connection:
+    return storage.connect("single_flight", _SCHEMA)
+
+
+def _ensure_heartbeat() -> None:
+    # Started lazily, and again after a fork, so every gunicorn worker runs its own
+    global _heartbeat_pid
+    with _flights_lock:
+        if _heartbeat_pid == os.getpid():
+            return
+        _heartbeat_pid = os.getpid()
+        _leading.clear()
+    threading.Thread(target=_heartbeat, name="single-flight-heartbeat", daemon=True).start()
+
+
+def _heartbeat() -> None:
+    while True:
+        time.sleep(SINGLE_FLIGHT_HEARTBEAT)
+        with _flights_lock:
+            leading = list(_leading)
+        if not leading:
+            continue
+        try:
+            _db().executemany(
+                "UPDATE flights SET heartbeat = ? WHERE key = ? AND token = ? AND state = 'running'",
+                [(time.time(), key, token) for key, token in leading],
+            )
+        except sqlite3.Error as e:
+            print(f"Single-flight heartbeat failed: {e}")
+
+
+def _claim(key: str) -> Tuple[bool, str]:
+    """
+    Starts a flight for key unless another worker has a live one.
+
+    Returns:
+        Tuple[bool, str]: Whether this caller now runs the flight, and the flight's token.
+    """
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "DELETE FROM flights WHERE state = 'done' AND heartbeat < ?", (now - SINGLE_FLIGHT_RESULT_TTL,)
+        )
+        row = conn.execute("SELECT token, state, heartbeat FROM flights WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[1] == "running" and row[2] > now - SINGLE_FLIGHT_STALE:
+            conn.execute("COMMIT")
+            return False, row[0]
+        token = uuid.uuid4().hex
+        conn.execute(
+            "INSERT OR REPLACE INTO flights (key, token, state, result, heartbeat) VALUES (?, ?, 'running', NULL, ?)",
+            (key, token, now),
+        )
+        conn.execute("COMMIT")
+        return True, token
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+_FAILED = object()
+
+
+def _land(key: str, token: str, result: Any) -> None:
+    conn = _db()
+    if result is _FAILED:
+        # Waiters take the flight over at once instead of waiting for it to go stale
+        conn.execute("DELETE FROM flights WHERE key = ? AND token = ?", (key, token))
+        return
+    conn.execute(
+        "UPDATE flights SET state = 'done', result = ?, heartbeat = ? WHERE key = ? AND token = ?",
+        (serialization.dumps(result).decode("utf-8"), time.time(), key, token),
+    )
+
+
+def _run_shared(key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """Runs fn as the cross-worker flight for key, or waits for another worker's. Returns the result and whether it was shared."""
+    while True:
+        try:
+            leader, token = _claim(key)
+        except sqlite3.Error as e:
+            print(f"Single-flight claim failed, running without coalescing: {e}")
+            return fn(), False
+
+        if leader:
+            _ensure_heartbeat()
+            with _flights_lock:
+                _leading.add((key, token))
+            result = _FAILED
+            try:
+                result = fn()
+                return result, False
+            finally:
+                with _flights_lock:
+                    _leading.discard((key, token))
+                try:
+                    _land(key, token, result)
+                except (sqlite3.Error, TypeError) as e:
+                    print(f"Single-flight result could not be stored: {e}")
+
+        while True:
+            time.sleep(SINGLE_FLIGHT_POLL)
+            try:
+                row = _db().execute("SELECT state, result, heartbeat FROM flights WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Single-flight poll failed: {e}")
+                continue
+            if row is not None and row[0] == "done":
+                return serialization.loads(row[1]), True
+            if row is None or row[2] <= time.time() - SINGLE_FLIGHT_STALE:
+                break  # the flight failed or its worker died: claim it
+
+
+def run(key: str, fn: Callable[[], Any]) -> Tuple[Any, Optional[str]]:
+    """
+    Runs fn, unless a call with the same key is already in flight, in which case its result is awaited.
+
+    Only the caller that runs fn gets its own result object: waiters in this process share it,
+    waiters in other workers get a copy decoded from JSON (models become plain dicts).
+
+    Args:
+        key (str): Identifies the work, e.g. a normalized URL.
+        fn (Callable): Does the work. Its result must be serializable with serialization.dumps().
+
+    Returns:
+        Tuple[Any, Optional[str]]: The result, and None if this call ran fn or where the flight it
+        joined ran: "thread" (this worker) or "worker" (another worker).
+
+    Raises:
+        Exception: Whatever fn raised, also in waiters of this process.
+    """
+    if not SINGLE_FLIGHT_ENABLED:
+        return fn(), None
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        joined = flight is not None
+        if not joined:
+            flight = _flights[key] = _Flight()
+    if joined:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, "thread"
+
+    try:
+        flight.result, shared = _run_shared(key, fn)
+        return flight.result, "worker" if shared else None
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
@@ -0,0 +1,43 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+# Directory holding the SQLite databases shared by every gunicorn worker on this machine.
+DATA_DIR = os.environ.get(
+    "ADDAPI_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".addapi")
+)
+
+_local = threading.local()
+
+
+def connect(name: str, schema: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Returns this thread's connection to a named local SQLite database.
+
+    Connections are opened lazily, one per thread and process (sqlite3 connections must not
+    cross threads or survive a fork), in autocommit mode with WAL journaling so readers in
+    other workers are never blocked by a writer.
+
+    Args:
+        name (str): Database name, used as the file name inside DATA_DIR.
+        schema (str, optional): SQL script run once when the connection is opened.
+
+    Returns:
+        sqlite3.Connection: The connection for the calling thread.
+    """
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+
+    conn = _local.connections.get(name)
+    if conn is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(DATA_DIR, f"{name}.sqlite3"), timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if schema:
+            conn.executescript(schema)
+        _local.connections[name] = conn
+    return conn
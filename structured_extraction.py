@@ -0,0 +1,298 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+# Direct extraction of API entries from documentation generators whose HTML already marks up
+# every signature (Sphinx, pydoc, Javadoc, rustdoc). These pages skip the LLM extraction; the
+# LLM is only asked for the fields the markup cannot provide (see html_extraction.fill_structured).
+STRUCTURED_EXTRACTION_ENABLED = os.environ.get("STRUCTURED_EXTRACTION_ENABLED", "1") != "0"
+# Whether the LLM writes Questions (and missing example_code) for entries read from the markup.
+STRUCTURED_LLM_FILL = os.environ.get("STRUCTURED_LLM_FILL", "1") != "0"
+# Fewer entries than this and the page goes through the LLM as usual.
+STRUCTURED_MIN_ITEMS = int(os.environ.get("STRUCTURED_MIN_ITEMS", "1"))
+FUNCTIONALITY_MAX_WORDS = 20
+
+# Substrings identifying each generator, checked on the raw HTML so other pages are never parsed here
+FORMAT_MARKERS = (
+    ("sphinx", ('class="sig sig-object', '<dl class="function"', '<dl class="method"', '<dl class="class"')),
+    ("pydoc", ("<title>Python: ",)),
+    ("javadoc", ("Generated by javadoc", 'class="member-signature"')),
+    ("rustdoc", ('content="rustdoc"', 'class="code-header"')),
+)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z(`\"'])")
+PYDOC_TITLE_RE = re.compile(r"Python:\s+(?:module|package|class)\s+([\w.]+)")
+BLANK_LINE_RE = re.compile(r"\n\s*\n")
+SECTION_RE = re.compile(r"(defined here|inherited from)")
+ANNOTATION_RE = re.compile(r"@[\w.$]+(\s*\([^)]*\))?")
+
+
+def detect_format(html_content: str) -> Optional[str]:
+    """Returns the documentation generator a page was built with, or None."""
+    for doc_format, markers in FORMAT_MARKERS:
+        if any(marker in html_content for marker in markers):
+            return doc_format
+    return None
+
+
+def _text(element) -> str:
+    return " ".join(element.get_text().split()) if element is not None else ""
+
+
+def _compact(text: str) -> str:
+    """Normalizes the spacing of a signature: one space after commas and colons, around "->"."""
+    text = " ".join(text.split())
+    text = re.sub(r"\s*(->|::|[(),\[\]<>:=&*])\s*", r"\1", text)
+    return re.sub(r"(,|:(?!:)(?<!::))", r"\1 ", text).replace("->", " -> ")
+
+
+def first_sentence(text: str) -> str:
+    """Returns the first sentence of a docstring, at most FUNCTIONALITY_MAX_WORDS words long."""
+    text = " ".join(text.split())
+    sentence = SENTENCE_END_RE.split(text, maxsplit=1)[0] if text else ""
+    words = sentence.split()
+    if len(words) > FUNCTIONALITY_MAX_WORDS:
+        sentence = " ".join(words[:FUNCTIONALITY_MAX_WORDS]) + "..."
+    return sentence
+
+
+def split_parameters(parameters: str) -> List[str]:
+    """Splits a parameter list at top-level commas, leaving nested brackets and defaults intact."""
+    parts, depth, current = [], 0, []
+    for char in parameters:
+        if char in "([{<":
+            depth += 1
+        elif char in ")]}>" and depth:
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+
+def _closing_bracket(text: str, start: int) -> int:
+    """Returns the index of the bracket closing the one at text[start], or -1 if it is unbalanced."""
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] in "([{<":
+            depth += 1
+        elif text[index] in ")]}>" and text[index - 1] != "-":  # not the arrow of a return type
+            depth -= 1
+            if depth == 0:
+                return index
+    return -1
+
+
+def parameter_arguments(parameters: List[str]) -> List[List[str]]:
+    """
+    Turns parameters into api_arguments entries: [name] or [name, default] (Python),
+    [name, type] (Rust / Java). Separators such as "*" and "/" and self are left out.
+    """
+    arguments = []
+    for parameter in parameters:
+        parameter = parameter.strip()
+        if parameter in ("*", "/", "self", "cls", "&self", "&mut self", "mut self") or not parameter:
+            continue
+        if "=" in parameter:
+            name, default = parameter.split("=", 1)
+            arguments.append([name.strip(), default.strip()])
+        elif ":" in parameter:
+            name, kind = parameter.split(":", 1)
+            arguments.append([name.strip(), kind.strip()])
+        elif " " in parameter and not parameter.startswith("*"):
+            kind, name = parameter.rsplit(" ", 1)  # Java: "String name"
+            arguments.append([name.strip(), kind.strip()])
+        else:
+            arguments.append([parameter])
+    return arguments
+
+
+def _entry(api_name: str, api_call: str, parameters: List[str], description: str,
+           example_code: Optional[str]) -> Dict[str, Any]:
+    """Builds an item with the Option1Format fields, those the markup cannot give left empty."""
+    return {
+        "api_name": api_name,
+        "api_call": api_call,
+        "api_version": None,
+        "api_arguments": parameter_arguments(parameters),
+        "functionality": first_sentence(description),
+        "env_requirements": None,
+        "example_code": example_code,
+        "meta_data": None,
+        "Questions": None,
+    }
+
+
+def _example(container) -> Optional[str]:
+    """The first code example inside a description, if any."""
+    if container is None:
+        return None
+    pre = container.find("pre")
+    if pre is None:
+        return None
+    code = pre.get_text().strip("\n")
+    return code or None
+
+
+def parse_sphinx(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    items = []
+    for dt in soup.select("dl.function > dt, dl.method > dt, dl.class > dt, dl.classmethod > dt, dl.staticmethod > dt"):
+        if "sig" not in (dt.get("class") or []) and not dt.get("id"):
+            continue
+        for link in dt.select("a.headerlink"):
+            link.decompose()
+        name = dt.get("id") or _compact(_text(dt.select_one(".sig-prename")) + _text(dt.select_one(".sig-name")))
+        if not name:
+            continue
+        parameters = [_compact(_text(param)) for param in dt.select("em.sig-param")]
+        dd = dt.find_next_sibling("dd")
+        first_paragraph = dd.find("p") if dd is not None else None
+        items.append(_entry(
+            name, f"{name}({', '.join(parameters)})", parameters, _text(first_paragraph), _example(dd)
+        ))
+    return items
+
+
+def parse_pydoc(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    title = PYDOC_TITLE_RE.search(_text(soup.title))
+    module = title.group(1) if title else ""
+    items = []
+    for anchor in soup.select("dl > dt > a[name]"):
+        dt = anchor.parent
+        strong = anchor.find("strong")
+        if strong is None:
+            continue
+        owner, _, function = anchor["name"].partition("-")
+        if function.startswith("__") and function != "__init__":
+            continue
+        # Members inherited from other classes (often builtins) are documented on those classes
+        section = dt.find_previous(string=SECTION_RE)
+        if section is not None and "inherited from" in section:
+            continue
+        signature = _text(dt)[len(_text(strong)):].strip()
+        if not signature.startswith("(") or signature.startswith("(...)"):
+            continue
+        parameters = [p for p in split_parameters(signature[1:signature.rfind(")")]) if p != "self"]
+        qualified = ".".join(part for part in (module, owner) if part)
+        name = qualified if function == "__init__" else ".".join(part for part in (qualified, function) if part)
+        dd = dt.find_next_sibling("dd")
+        if dd is not None:
+            for br in dd.find_all("br"):
+                br.decompose()  # every <br> is followed by a newline already
+        docstring = dd.get_text() if dd is not None else ""
+        paragraph = BLANK_LINE_RE.split(docstring.strip())[0].replace("``", "`")
+        items.append(_entry(name, f"{name}({', '.join(parameters)})", parameters, paragraph, None))
+    return items
+
+
+def parse_javadoc(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    class_name = re.sub(r"<.*", "", _text(soup.select_one("h1.title, h2.title")).split(" ")[-1])
+    items = []
+    # JDK 11+ layout, then the older blockList one
+    for signature in soup.select("div.member-signature, ul.blockList li.blockList > pre"):
+        # Annotations come first and look like calls: @Deprecated(since="9")
+        for annotation in signature.select("span.annotations"):
+            annotation.decompose()
+        element_name = signature.select_one("span.element-name, span.member-name")
+        element_parameters = signature.select_one("span.parameters, span.arguments")
+        if element_name is not None:
+            method = _text(element_name)
+            parameters = split_parameters(_text(element_parameters).strip("()")) if element_parameters else []
+        else:
+            text = ANNOTATION_RE.sub(" ", " ".join(signature.get_text(" ").split()))
+            match = re.search(r"([\w$]+)\s*\(([^)]*)\)", text)
+            if not match:
+                continue
+            method, parameters = match.group(1), split_parameters(match.group(2))
+        block = signature.find_next_sibling("div", class_="block")
+        name = f"{class_name}.{method}" if class_name and class_name != method else method
+        call = f"{name}({', '.join(arg[0] for arg in parameter_arguments(parameters))})"
+        items.append(_entry(name, call, parameters, _text(block), _example(block)))
+    return items
+
+
+def parse_rustdoc(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    heading = soup.select_one("h1 > span")
+    type_name = _text(heading).split("::")[-1]
+    items = []
+    for header in soup.select("section.method h4.code-header, pre.item-decl"):
+        # Blanket and auto trait implementations repeat on every type
+        if header.find_parent(id=("blanket-implementations-list", "synthetic-implementations-list")):
+            continue
+        for tooltip in header.select(".tooltip"):
+            tooltip.decompose()  # "notable traits" markers
+        signature = _compact(header.get_text(" "))
+        match = re.search(r"\bfn\s+(\w+)", signature)
+        if not match:
+            continue
+        function = match.group(1)
+        # Generic parameters may hold parentheses of their own (F: Fn(u8) -> bool)
+        generics_end = _closing_bracket(signature, match.end()) if signature[match.end():match.end() + 1] == "<" else -1
+        open_paren = signature.find("(", max(match.end(), generics_end))
+        close_paren = _closing_bracket(signature, open_paren) if open_paren != -1 else -1
+        if close_paren == -1:
+            continue
+        if header.name == "pre":
+            name = function
+            docblock = soup.select_one("details.top-doc div.docblock") or soup.select_one("div.docblock")
+        else:
+            name = f"{type_name}::{function}" if type_name else function
+            details = header.find_parent("details")
+            docblock = details.find("div", class_="docblock") if details is not None else None
+        parameters = split_parameters(signature[open_paren + 1:close_paren])
+        first_paragraph = docblock.find("p") if docblock is not None else None
+        if first_paragraph is None and header.find_parent(id="trait-implementations-list"):
+            continue  # undocumented trait methods such as eq / fmt
+        # A call like the other formats give: qualifiers (const, unsafe, async, extern), generics
+        # and the return type are left out, as is the self receiver
+        call = f"{name}({', '.join(arg[0] for arg in parameter_arguments(parameters))})"
+        items.append(_entry(name, call, parameters, _text(first_paragraph), _example(docblock)))
+    return items
+
+
+PARSERS = {"sphinx": parse_sphinx, "pydoc": parse_pydoc, "javadoc": parse_javadoc, "rustdoc": parse_rustdoc}
+
+
+def extract_structured(html_content: str, parser: str = "html.parser") -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Extracts API entries straight from the markup of Sphinx, pydoc, Javadoc and rustdoc pages.
+
+    Args:
+        html_content (str): The HTML of the page.
+        parser (str): BeautifulSoup parser backend.
+
+    Returns:
+        Optional[Tuple[str, List[Dict]]]: The detected format and the entries, as dictionaries with
+        the Option1Format fields (Questions left empty). None if the page is not in a known
+        format or too few entries were found.
+    """
+    if not STRUCTURED_EXTRACTION_ENABLED:
+        return None
+    doc_format = detect_format(html_content)
+    if doc_format is None:
+        return None
+    try:
+        soup = BeautifulSoup(html_content, parser)
+    except FeatureNotFound:
+        soup = BeautifulSoup(html_content, "html.parser")
+
+    try:
+        parsed = PARSERS[doc_format](soup)
+    except Exception as e:
+        # Markup the parser did not expect: the page goes through the LLM path instead
+        print(f"Parsing the {doc_format} page failed, extracting it with the LLM: {e!r}")
+        return None
+
+    items, seen = [], set()
+    for item in parsed:
+        if item["api_call"] not in seen:
+            seen.add(item["api_call"])
+            items.append(item)
+    if len(items) < STRUCTURED_MIN_ITEMS:
+        return None
+    return doc_format, items
@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+# Where html_transformer() runs: "inline" on the calling thread, or "process" in a pool of
+# worker processes so BeautifulSoup / html2text do not hold this worker's GIL.
+TRANSFORM_EXECUTOR = os.environ.get("TRANSFORM_EXECUTOR", "inline")
+TRANSFORM_PROCESSES = int(os.environ.get("TRANSFORM_PROCESSES", str(min(os.cpu_count() or 2, 4))))
+# Pages shorter than this (in characters) stay inline even in process mode; the IPC would cost more than it saves.
+TRANSFORM_INLINE_MAX_CHARS = int(os.environ.get("TRANSFORM_INLINE_MAX_CHARS", "200000"))
+# Pages at least this long (in characters) go through stream_html_transformer(), which never
+# builds a tree of the page, instead of the BeautifulSoup html_transformer().
+TRANSFORM_STREAM_MIN_CHARS = int(os.environ.get("TRANSFORM_STREAM_MIN_CHARS", "1000000"))
+# "forkserver" starts workers from a clean process instead of forking a threaded gunicorn worker.
+TRANSFORM_START_METHOD = os.environ.get("TRANSFORM_START_METHOD", "forkserver")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # Pay the parser imports once per worker process rather than on the first page
+    import html_extraction  # noqa: F401
+
+
+def _noop(delay: float) -> int:
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _timed_transform(html_content: str, parser: Optional[str]) -> Tuple[str, float, str]:
+    from html_extraction import html_transformer, stream_html_transformer
+    start = time.perf_counter()
+    if len(html_content) >= TRANSFORM_STREAM_MIN_CHARS:
+        markdown, mode = stream_html_transformer(html_content), "stream"
+    else:
+        markdown, mode = html_transformer(html_content, parser), "soup"
+    return markdown, time.perf_counter() - start, mode
+
+
+def _structured(html_content: str, parser: Optional[str]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    from structured_extraction import extract_structured
+    return extract_structured(html_content, parser or "html.parser")
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Returns this process's transform pool, creating it on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            method = TRANSFORM_START_METHOD if TRANSFORM_START_METHOD in multiprocessing.get_all_start_methods() else None
+            _pool = ProcessPoolExecutor(
+                max_workers=TRANSFORM_PROCESSES,
+                mp_context=multiprocessing.get_context(method),
+                initializer=_init_worker,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def warm() -> None:
+    """
+    Starts every worker process of the pool ahead of the first request.
+
+    Called from the gunicorn post_worker_init hook when TRANSFORM_EXECUTOR is "process".
+    """
+    pool = get_pool()
+    # Short sleeps keep workers busy so the executor has to start all of them
+    for future in [pool.submit(_noop, 0.05) for _ in range(TRANSFORM_PROCESSES)]:
+        future.result()
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def transform(html_content: str, parser: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Runs html_transformer() according to TRANSFORM_EXECUTOR and times it.
+
+    Args:
+        html_content (str): The HTML of the page.
+        parser (str, optional): BeautifulSoup parser backend, see html_transformer().
+
+    Returns:
+        Tuple[str, Dict]: The markdown, and "transform" (inline or process) with "transform_ms" and
+        "transform_mode" (soup, or stream for pages of TRANSFORM_STREAM_MIN_CHARS or more).
+    """
+    if TRANSFORM_EXECUTOR == "process" and len(html_content) > TRANSFORM_INLINE_MAX_CHARS:
+        try:
+            markdown, elapsed, mode = get_pool().submit(_timed_transform, html_content, parser).result()
+            return markdown, {"transform": "process", "transform_ms": round(elapsed * 1000, 1), "transform_mode": mode}
+        except BrokenProcessPool:
+            print("Transform pool broke, recreating it and transforming inline.")
+            shutdown()
+
+    markdown, elapsed, mode = _timed_transform(html_content, parser)
+    return markdown, {"transform": "inline", "transform_ms": round(elapsed * 1000, 1), "transform_mode": mode}
+
+
+def structured(html_content: str, parser: Optional[str] = None) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Runs structured_extraction.extract_structured() where transform() would run html_transformer().
+
+    It builds a BeautifulSoup tree too, so pages of TRANSFORM_STREAM_MIN_CHARS or more are not
+    parsed at all (None); they go through the stream transformer like any other page.
+
+    Returns:
+        Optional[Tuple[str, List[Dict]]]: See extract_structured().
+    """
+    if len(html_content) >= TRANSFORM_STREAM_MIN_CHARS:
+        return None
+    if TRANSFORM_EXECUTOR == "process" and len(html_content) > TRANSFORM_INLINE_MAX_CHARS:
+        try:
+            return get_pool().submit(_structured, html_content, parser).result()
+        except BrokenProcessPool:
+            print("Transform pool broke, recreating it and extracting inline.")
+            shutdown()
+    return _structured(html_content, parser)
@@ -0,0 +1,66 @@
+import posixpath
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Query parameters that only track where a visitor came from, never change the page
+TRACKING_PARAMS = frozenset(["fbclid", "gclid", "ref", "ref_src", "source"])
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """
+    Normalizes a URL so every spelling of the same page compares equal.
+
+    The scheme and host are lowercased, default ports, fragments, "." / ".." path segments and
+    tracking parameters (utm_* and TRACKING_PARAMS) are dropped, and the remaining query
+    parameters are sorted. An empty path becomes "/".
+
+    Args:
+        url (str): The URL, absolute or relative to base.
+        base (str, optional): URL of the page the link was found on.
+
+    Returns:
+        Optional[str]: The normalized absolute URL, or None if it is not an http(s) URL.
+    """
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+
+    path = parts.path or "/"
+    if "." in path:
+        trailing_slash = path.endswith(("/", "/.", "/.."))
+        path = posixpath.normpath(path)
+        path = "/" if path in (".", "//") else path
+        if trailing_slash and not path.endswith("/"):
+            path += "/"
+        if path.startswith("//"):
+            path = "/" + path.lstrip("/")
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def in_scope(url: str, root: str) -> bool:
+    """Returns True if url is on the same host as root and under root's directory."""
+    url_parts, root_parts = urlsplit(url), urlsplit(root)
+    if url_parts.netloc != root_parts.netloc:
+        return False
+    prefix = root_parts.path if root_parts.path.endswith("/") else posixpath.dirname(root_parts.path).rstrip("/") + "/"
+    return url_parts.path.startswith(prefix) or url_parts.path + "/" == prefix